@@ -238,7 +238,7 @@ class CompletionByValuesVar(varlib.TwoVarsRatio):
 '''
 
 
-class EarnedByTicketsVar(ModelVariable):
+class EarnedByTicketsVar(varlib.SumTickets):
 
     model_cls = Model
 
@@ -247,6 +247,13 @@ class EarnedByTicketsVar(ModelVariable):
     subject_support = (SubjectArea.USER, SubjectArea.PROJECT)
     cluster_support = (ClusterArea.NONE, ClusterArea.MILESTONE)
 
+    # varlib.SumTickets specific vars
+    filter_tickets = (
+                (ts.Status()=='closed') &
+                (ts.Resolution()=='done')
+                )
+    sum_expr = ts.TicketValue()
+
     alias = 'earned_by_tickets'
     label = u'Заработано по стоимости задач'
     description = u'''
@@ -254,18 +261,6 @@ class EarnedByTicketsVar(ModelVariable):
 суммированием стоимостей задач.
 '''
 
-    def _get(self):
-        q = self.model.sources['ticket']
-        self > q
-        q.where(
-                (ts.Status()=='closed') &
-                (ts.Resolution()=='done')
-                )
-        if self['area'] == SubjectArea.PROJECT:
-            q.limit_to_project_users(ts.Owner())
-        res = q.sum(ts.TicketValue())
-        return res
-
 
 class ValidTicketValuesSum(ModelVariable):
 
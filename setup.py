@@ -152,12 +152,14 @@ facilities.
         trac.user.api = trac.user.api
         trac.user.sys = trac.user.sys
         trac.search = trac.search.web_ui
+        trac.search.index = trac.search.index
         trac.ticket.admin = trac.ticket.admin
         trac.ticket.query = trac.ticket.query
         trac.ticket.report = trac.ticket.report
         trac.ticket.roadmap = trac.ticket.roadmap
         trac.ticket.web_ui = trac.ticket.web_ui
         trac.timeline = trac.timeline.web_ui
+        trac.timeline.cache = trac.timeline.cache
         trac.versioncontrol.admin = trac.versioncontrol.admin
         trac.versioncontrol.svn_authz = trac.versioncontrol.svn_authz
         trac.versioncontrol.svn_fs = trac.versioncontrol.svn_fs
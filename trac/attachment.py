@@ -34,6 +34,7 @@ from trac.mimeview import *
 from trac.perm import PermissionError, IPermissionPolicy
 from trac.resource import *
 from trac.search import search_to_sql, shorten_result
+from trac.timeline.api import iter_recent_rows, merge_events
 from trac.util import get_reporter_id, create_unique_file
 from trac.util.datefmt import format_datetime, from_utimestamp, \
                               to_datetime, to_utimestamp, utc
@@ -575,12 +576,15 @@ class AttachmentModule(Component):
                 'attachments': attachments,
                 'parent': context.resource}
     
-    def get_history(self, start, stop, realm, pid):
+    def get_history(self, start, stop, realm, pid, maxrows=0):
         """Return an iterable of tuples describing changes to attachments on
         a particular object realm.
 
         The tuples are in the form (change, project_id, realm, id, filename, time,
         description, author). `change` can currently only be `created`.
+
+        The changes are generated newest first, if `maxrows` is not 0 they
+        are read from the database `maxrows` at a time.
         """
         is_global = pid is None
         if is_global and not self.rs.has_global_resources(realm):
@@ -590,16 +594,16 @@ class AttachmentModule(Component):
             return
         # Traverse attachment directory
         db = self.env.get_read_db()
-        cursor = db.cursor()
         query = '''
             SELECT DISTINCT {sel_pid} a.type, a.id, a.filename, a.time, a.description, a.author
             FROM attachment a
             JOIN {rsc_tab} r ON CAST(r.{rsc_id} AS varchar)=a.id
-            WHERE a.time > %s AND a.time < %s AND a.type = %s {and_pid}
+            WHERE a.type = %s {and_pid} AND a.time >= %s AND a.time <= %s
+            ORDER BY a.time DESC
         '''
         rsc_tab = db.quote(self.rs.get_realm_table(realm))
         rsc_id  = db.quote(self.rs.get_realm_id(realm))
-        sql_args = [to_utimestamp(start), to_utimestamp(stop), realm]
+        sql_args = [realm]
         if has_project:
             sel_pid = 'COALESCE(r.project_id,0),'
             if is_global:
@@ -611,20 +615,29 @@ class AttachmentModule(Component):
             sel_pid = '0,' # global pid
             and_pid = ''
         query = query.format(sel_pid=sel_pid, rsc_tab=rsc_tab, rsc_id=rsc_id, and_pid=and_pid)
-        cursor.execute(query, sql_args)
-        for project_id, realm, id, filename, ts, description, author in cursor:
+        from trac.timeline.cache import TimelineEventCache
+        # start < a.time < stop
+        rows = TimelineEventCache(self.env).get_rows(
+            ('attachment', realm, pid), (pid,),
+            to_utimestamp(start) + 1, to_utimestamp(stop) - 1,
+            lambda ts_from, ts_to: iter_recent_rows(db, query,
+                sql_args + [ts_from, ts_to], maxrows, 4), 4)
+        for project_id, realm, id, filename, ts, description, author in rows:
             time = from_utimestamp(ts)
             yield ('created', project_id, realm, id, filename, time, description, author)
 
-    def get_timeline_events(self, req, resource_realm, start, stop, pid, syllabus_id):
+    def get_timeline_events(self, req, resource_realm, start, stop, pid,
+                            syllabus_id, maxrows=0):
         """Return an event generator suitable for ITimelineEventProvider.
 
         Events are changes to attachments on resources of the given
-        `resource_realm.realm`.
+        `resource_realm.realm`. They are generated newest first, see
+        `ITimelineEventProvider` for the meaning of `maxrows`.
         """
         def generate_event(pid):
             for change, project_id, realm, id, filename, time, descr, author in \
-                    self.get_history(start, stop, resource_realm.realm, pid):
+                    self.get_history(start, stop, resource_realm.realm, pid,
+                                     maxrows):
                 attachment = resource_realm(id=id, pid=project_id).child('attachment', filename)
                 if 'ATTACHMENT_VIEW' in req.perm(attachment):
                     data_ = (attachment, descr)
@@ -632,18 +645,14 @@ class AttachmentModule(Component):
 
         # global
         if pid is None:
-            for e in generate_event(None):
-                yield e
-            return
+            return generate_event(None)
 
         is_multi = isinstance(pid, (list, tuple))
         if is_multi:
-            for project_id in pid:
-                for e in generate_event(project_id):
-                    yield e
+            return merge_events([generate_event(project_id)
+                                 for project_id in pid])
         else:
-            for e in generate_event(pid):
-                yield e
+            return generate_event(pid)
 
     def render_timeline_event(self, context, field, event):
         attachment, descr = event[4]
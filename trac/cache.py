@@ -119,13 +119,8 @@ class CacheManager(Component):
         local_meta = self._local.meta
         local_cache = self._local.cache
         if local_meta is None:
-            # First cache usage in this request, retrieve cache metadata
-            # from the database and make a thread-local copy of the cache
             db = self.env.get_read_db()
-            cursor = db.cursor()
-            cursor.execute("SELECT id,generation FROM cache")
-            self._local.meta = local_meta = dict(cursor)
-            self._local.cache = local_cache = self._cache.copy()
+            local_meta, local_cache = self._load_metadata(db)
         else:
             db = None
         
@@ -168,6 +163,19 @@ class CacheManager(Component):
         finally:
             self._lock.release()
         
+    def get_generation(self, id):
+        """Return the generation of the given id as seen by the current
+        request, or -1 if the id has never been invalidated.
+        
+        This allows other caches to store data of their own along with the
+        generation it was retrieved for, and to use `invalidate()` to make it
+        stale in all processes.
+        """
+        local_meta = self._local.meta
+        if local_meta is None:
+            local_meta = self._load_metadata(self.env.get_read_db())[0]
+        return local_meta.get(id, -1)
+
     def invalidate(self, id):
         """Invalidate cached data for the given id."""
         db = self.env.get_read_db() # prevent deadlock
@@ -182,6 +190,7 @@ class CacheManager(Component):
             #  - If the row doesn't exist, the UPDATE does nothing, but starts
             #    a transaction. The SELECT then returns nothing, and we can
             #    safely INSERT a new row.
+            generation = []
             @self.env.with_transaction()
             def do_invalidate(db):
                 cursor = db.cursor()
@@ -190,9 +199,11 @@ class CacheManager(Component):
                     """, (id,))
                 cursor.execute("SELECT generation FROM cache WHERE id=%s",
                                (id,))
-                if not cursor.fetchone():
+                row = cursor.fetchone()
+                if not row:
                     cursor.execute("INSERT INTO cache VALUES (%s, %s)",
                                    (id, 0))
+                generation.append(row and row[0] or 0)
             
             # Invalidate in this process
             self._cache.pop(id, None)
@@ -202,5 +213,18 @@ class CacheManager(Component):
                 del self._local.cache[id]
             except (KeyError, TypeError):
                 pass
+            if self._local.meta is not None:
+                self._local.meta[id] = generation[0]
         finally:
             self._lock.release()
+
+    # Internal methods
+
+    def _load_metadata(self, db):
+        """Retrieve cache metadata from the database on first cache usage in
+        the request, and make a thread-local copy of the cache."""
+        cursor = db.cursor()
+        cursor.execute("SELECT id,generation FROM cache")
+        self._local.meta = local_meta = dict(cursor)
+        self._local.cache = local_cache = self._cache.copy()
+        return local_meta, local_cache
@@ -14,14 +14,17 @@
 
 from ConfigParser import ConfigParser
 from copy import deepcopy
+import glob
 import os.path
+import re
 import threading
+import time
 
 from trac.admin import AdminCommandError, IAdminCommandProvider
 from trac.core import *
 from trac.util import AtomicFile, as_bool
 from trac.util.compat import any
-from trac.util.text import printout, to_unicode, CRLF
+from trac.util.text import printout, to_unicode, exception_to_unicode, CRLF
 from trac.util.translation import _, N_
 
 __all__ = ['Configuration', 'Option', 'BoolOption', 'IntOption', 'FloatOption',
@@ -539,9 +542,23 @@ class Section(object):
 
 
 class ConfigurationSwitcher(object):
+    """Registry of syllabus and project configurations.
+
+    Configurations are preloaded by `preload` and read without locking.
+    Changes of configuration files are checked at most once per
+    `poll_interval` seconds for each configuration, not on every access.
+    """
+
+    # seconds between checks of configuration files modification
+    poll_interval = 5
+
+    _filename_re = re.compile(r'^id(\d+)\.ini$')
 
     def __init__(self, env):
         self._switch_lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        # {(key, id): time of last check}
+        self._last_poll = {}
         self.env = env
         self.common_config = env.config
 
@@ -554,6 +571,24 @@ class ConfigurationSwitcher(object):
     def project(self, id):
         return self.switch(project=id)
 
+    def preload(self):
+        """Load all existing syllabus and project configurations."""
+        c = self.common()
+        if not c.filename:
+            return
+        for key in ('syllabus', 'project'):
+            pattern = os.path.join(os.path.dirname(c.filename), key, 'id*.ini')
+            for filename in glob.glob(pattern):
+                match = self._filename_re.match(os.path.basename(filename))
+                if not match:
+                    continue
+                try:
+                    self._get(key, int(match.group(1)))
+                except Exception, e:
+                    # a broken file must only break its syllabus or project
+                    self.env.log.warning('Can not preload configuration %s: %s',
+                                         filename, exception_to_unicode(e))
+
     # TODO: Add something like filename provider for syllabus and project
     # config files. Having env object, we could get this info even from DB
     # (but not in __init__ - DB is not inited at that moment).
@@ -568,12 +603,28 @@ class ConfigurationSwitcher(object):
             id = syllabus
         else:
             raise AttributeError
-        with self._switch_lock:
-            if id not in self.env.conf_switcher_cache[key]:
-                c = self.common()
-                filename = os.path.join(os.path.dirname(c.filename), key, 'id{0}.ini'.format(id))
-                self.env.conf_switcher_cache[key][id] = Configuration(filename)
-            return self.env.conf_switcher_cache[key][id]
+        return self._get(key, id)
+
+    def _get(self, key, id):
+        config = self.env.conf_switcher_cache[key].get(id)
+        if config is None:
+            with self._switch_lock:
+                if id not in self.env.conf_switcher_cache[key]:
+                    c = self.common()
+                    filename = os.path.join(os.path.dirname(c.filename), key, 'id{0}.ini'.format(id))
+                    self.env.conf_switcher_cache[key][id] = Configuration(filename)
+                    self._last_poll[(key, id)] = time.time()
+                return self.env.conf_switcher_cache[key][id]
+        now = time.time()
+        if now - self._last_poll.get((key, id), 0) >= self.poll_interval:
+            # skip the check if other thread is doing it
+            if self._poll_lock.acquire(False):
+                try:
+                    self._last_poll[(key, id)] = now
+                    config.parse_if_needed()
+                finally:
+                    self._poll_lock.release()
+        return config
 
 class AccessorSwitcher(object):
 
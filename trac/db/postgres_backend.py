@@ -15,13 +15,14 @@
 # Author: Christopher Lenz <cmlenz@gmx.de>
 
 import re, os
+from itertools import count
 
 from genshi import Markup
 
 from trac.core import *
 from trac.config import Option
 from trac.db.api import IDatabaseConnector, _parse_db_str
-from trac.db.util import ConnectionWrapper, IterableCursor
+from trac.db.util import ConnectionWrapper, IterableCursor, ServerCursor
 from trac.util import get_pkginfo
 from trac.util.compat import close_fds
 from trac.util.text import empty, exception_to_unicode, to_unicode
@@ -294,3 +295,14 @@ class PostgreSQLConnection(ConnectionWrapper):
     def cursor(self):
         return IterableCursor(self.cnx.cursor(), self.log)
 
+    _server_cursor_ids = count()
+
+    def server_cursor(self, batch_size=1000):
+        """Return a cursor keeping the result of a query on the server,
+        so that large results can be read without loading them entirely.
+        The cursor must be closed before the transaction ends."""
+        cursor = self.cnx.cursor('trac_cursor_%d'
+                                 % self._server_cursor_ids.next())
+        cursor.arraysize = batch_size
+        return ServerCursor(cursor, self.log)
+
@@ -86,6 +86,21 @@ class IterableCursor(object):
         return self.cursor.executemany(sql, args)
 
 
+class ServerCursor(IterableCursor):
+    """Iterable cursor for cursors keeping the result set on the database
+    server. Iteration fetches the rows in batches of `arraysize`.
+    """
+    __slots__ = []
+
+    def __iter__(self):
+        while True:
+            rows = self.cursor.fetchmany(self.cursor.arraysize)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+
 class ConnectionWrapper(object):
     """Generic wrapper around connection objects.
     
@@ -18,7 +18,7 @@
 from trac.db import Table, Column, Index, ForeignKey
 
 # Database version identifier. Used for automatic upgrades.
-db_version = 26
+db_version = 28
 
 def __mkreports(reports):
     """Utility function used to create report data in same syntax as the
@@ -322,6 +322,13 @@ schema = [
         Column('ticket_id', type='int', null=False),
         Column('value', type='int', null=False, default='0'),
         ForeignKey('ticket_id', 'ticket', 'id', on_delete='CASCADE')],
+    Table('ticket_evaluation_queue', key=('ticket_id',))[
+        Column('ticket_id', type='int', null=False),
+        Column('project_id', type='int', null=False),
+        Column('time', type='int64', null=False),
+        Column('claimed_by', type='varchar (255)'),
+        Column('claim_time', type='int64'),
+        ForeignKey('ticket_id', 'ticket', 'id', on_delete='CASCADE')],
     Table('team_milestone_evaluation', key=('username', 'project_id', 'milestone'))[
         Column('username', type='varchar(255)'),
         Column('project_id', type='int'),
@@ -347,6 +354,25 @@ schema = [
         Column('criterion', type='varchar(255)'),
         Column('value', default="''", null=False),
         ForeignKey('project_id', 'projects', 'id', on_delete='CASCADE')],
+
+    # Search index
+    Table('search_document', key='id')[
+        Column('id', auto_increment=True),
+        Column('realm', type='varchar (255)'),
+        Column('resource', type='varchar (255)'),
+        Column('project_id', type='int', null=True),
+        Column('title'),
+        Column('author', type='varchar (255)'),
+        Column('time', type='int64'),
+        Column('text'),
+        ForeignKey('project_id', 'projects', 'id', on_delete='CASCADE'),
+        Index(['realm', 'resource'])],
+    Table('search_term', key=('term', 'document'))[
+        Column('term', type='varchar (255)'),
+        Column('document', type='int'),
+        Column('weight', type='int'),
+        ForeignKey('document', 'search_document', 'id', on_delete='CASCADE'),
+        Index(['document'])],
 ]
 
 ##
@@ -196,3 +196,12 @@ project_info = Table('project_info', metadata,
     Column('syllabus_id', Integer, ForeignKey('syllabuses.id'), nullable=False),
 )
 
+developer_projects = Table('developer_projects', metadata,
+    Column('user_id', Integer, ForeignKey('users.id')),
+    Column('username', String(255), ForeignKey('users.username'), primary_key=True),
+    Column('team_id', Integer, ForeignKey('teams.id')),
+    Column('team_name', String(255)),
+    Column('project_id', Integer, ForeignKey('projects.id'), primary_key=True),
+    Column('project_name', String(255)),
+)
+
@@ -391,6 +391,13 @@ class Environment(Component, ComponentManager):
         RepositoryManager(self).shutdown(tid)
         DatabaseManager(self).shutdown(tid)
         if tid is None:
+            # Only stop the threads of the components already activated
+            from trac.evaluation.api.components import EvaluationManagement
+            from trac.evaluation.components import TicketStatistics
+            for cls in (TicketStatistics, EvaluationManagement):
+                component = self.components.get(cls)
+                if component is not None:
+                    component.shutdown()
             self.log.removeHandler(self._log_handler)
             self._log_handler.flush()
             self._log_handler.close()
@@ -480,6 +487,7 @@ class Environment(Component, ComponentManager):
         self.conf_switcher_cache = {'syllabus': {}, 'project': {}} # for ConfigurationSwitcher
         self.configs = ConfigurationSwitcher(self)
         self.setup_log()
+        self.configs.preload()
         from trac.loader import load_components
         plugins_dir = self.shared_plugins_dir
         load_components(self, plugins_dir and (plugins_dir,))
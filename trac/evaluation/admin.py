@@ -5,13 +5,14 @@ import tempfile
 
 from trac.core import Component, implements, TracError
 from trac.admin.api import IAdminCommandProvider, IAdminPanelProvider, AdminArea
+from trac.project.api import ProjectManagement
 
-from trac.evaluation.api import EvaluationManagement
+from trac.evaluation.api import EvaluationManagement, EvaluationValueCache
 from trac.evaluation.api.scale import prepare_editable_var, create_scale_validator, create_group_validator
 
 from trac.web.chrome import add_notice, add_warning
 from trac.util.translation import _
-from trac.util.text import exception_to_unicode
+from trac.util.text import exception_to_unicode, printout
 from trac.util.formencode_addons import process_form
 
 
@@ -60,6 +61,7 @@ class EvaluationAdmin(Component):
                         c = aliases[name]
                         c.set(new_val)
                     model.sconfig.save()
+                    EvaluationValueCache(self.env).invalidate_syllabus(syllabus_id)
                     add_notice(req, _('Your changes have been saved.'))
                     req.redirect(req.panel_href())
 
@@ -71,6 +73,7 @@ class EvaluationAdmin(Component):
                     c = aliases[name]
                     c.reset()
                 model.sconfig.save()
+                EvaluationValueCache(self.env).invalidate_syllabus(syllabus_id)
                 add_notice(req, _('Your changes have been saved.'))
                 req.redirect(req.panel_href())
 
@@ -236,23 +239,42 @@ class EvaluationAdmin(Component):
         yield ('evaluation tickets update project', '<pid>',
                'Update tickets values (for all tickets by project)',
                None, self._do_update_tickets_project)
+        yield ('evaluation tickets update syllabus', '<syllabus_id>',
+               'Update tickets values (for all projects of the syllabus)',
+               None, self._do_update_tickets_syllabus)
+        yield ('evaluation tickets update all', '',
+               'Update tickets values (for all projects)',
+               None, self._do_update_tickets_all)
+        yield ('evaluation queue process', '',
+               'Update values of the tickets queued by deferred updates',
+               None, self._do_process_queue)
 
     def _do_update_tickets_project(self, pid):
-        from trac.evaluation.components import TicketStatistics
-        from trac.ticket.model import Ticket
-        ts = TicketStatistics(self.env)
+        self._update_tickets([int(pid)])
+
+    def _do_update_tickets_syllabus(self, syllabus_id):
+        pids = ProjectManagement(self.env).get_syllabus_projects(int(syllabus_id))
+        self._update_tickets(pids)
+
+    def _do_update_tickets_all(self):
         db = self.env.get_read_db()
         cursor = db.cursor()
-        cursor.execute('''
-            SELECT id FROM ticket WHERE project_id=%s
-            ''', (pid,))
-        rows = cursor.fetchall()
-        if not rows:
-            return
-        ids = [r[0] for r in rows]
-        cursor.close()
-        for id_ in ids:
-            print 'Updating value for ticket #%s' % id_
-            ticket = Ticket(self.env, id_)
-            ts.update_ticket(ticket)
+        cursor.execute('SELECT id FROM projects ORDER BY id')
+        self._update_tickets([row[0] for row in cursor])
 
+    def _do_process_queue(self):
+        from trac.evaluation.components import TicketStatistics
+        count = TicketStatistics(self.env).process_queue()
+        printout(_('Values of %(count)s queued tickets updated', count=count))
+
+    def _update_tickets(self, pids):
+        from trac.evaluation.components import TicketStatistics
+        ts = TicketStatistics(self.env)
+        def progress(pid, count):
+            printout(_('Project %(pid)s: %(count)s tickets updated',
+                       pid=pid, count=count))
+        total = 0
+        for pid in pids:
+            total += ts.update_project_tickets(pid, progress)
+        printout(_('Values of %(count)s tickets of %(num)s projects updated',
+                   count=total, num=len(pids)))
@@ -1,6 +1,8 @@
 from trac.evaluation.api.error import *
 from trac.evaluation.api.scale import *
 from trac.evaluation.api.area import *
+from trac.evaluation.api.cache import *
+from trac.evaluation.api.memo import *
 from trac.evaluation.api.model import *
 from trac.evaluation.api.util import *
 from trac.evaluation.api import varlib
@@ -21,7 +21,21 @@ class SubjectArea(object):
         return _(cls._labels[area])
 
 class TimeArea(object):
-    DAY = 1
+    DAY   = 1
+    WEEK  = 2 # weeks start on Monday
+    MONTH = 3
+
+    _labels = {
+        DAY: N_('Day'),
+        WEEK: N_('Week'),
+        MONTH: N_('Month'),
+    }
+
+    @classmethod
+    def label(cls, area):
+        if area not in cls._labels:
+            return _('<Unknown time area>')
+        return _(cls._labels[area])
 
 class ClusterArea(object):
     NONE      = 0
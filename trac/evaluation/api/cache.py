@@ -0,0 +1,109 @@
+import threading
+
+from trac.core import Component, implements
+from trac.config import BoolOption
+from trac.cache import CacheManager
+from trac.ticket.api import ITicketChangeListener, IMilestoneChangeListener
+
+__all__ = ['EvaluationValueCache']
+
+
+
+class EvaluationValueCache(Component):
+    '''Cache of computed evaluation model variables values.
+
+    Values are stored per (syllabus, project) pair. Syllabus and project
+    generations are kept by `CacheManager`, so invalidation made by one
+    process is seen by all other processes on their next request.
+    '''
+
+    implements(ITicketChangeListener, IMilestoneChangeListener)
+
+    enabled = BoolOption('evaluation', 'value_cache', default='true',
+                        doc="""Cache computed values of evaluation model variables
+                        until project tickets, milestones or evaluation results change.""")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {(syllabus_id, project_id): (generation, {key: value})}
+        self._values = {}
+
+    # ITicketChangeListener methods
+
+    def ticket_created(self, tkt):
+        self.invalidate(tkt.pid)
+
+    def ticket_changed(self, tkt, comment, author, old_values):
+        self.invalidate(tkt.pid)
+
+    def ticket_deleted(self, tkt):
+        self.invalidate(tkt.pid)
+
+    # IMilestoneChangeListener methods
+
+    def milestone_created(self, milestone):
+        self.invalidate(milestone.pid)
+
+    def milestone_changed(self, milestone, old_values):
+        self.invalidate(milestone.pid)
+
+    def milestone_deleted(self, milestone):
+        self.invalidate(milestone.pid)
+
+    # API
+
+    def get(self, syllabus_id, project_id, key, default=None):
+        '''Return cached value for `key` or `default` if there is
+        no valid value in the cache.'''
+        generation = self._get_generation(syllabus_id, project_id)
+        with self._lock:
+            entry = self._values.get((syllabus_id, project_id))
+            if entry is None or entry[0] != generation:
+                return default
+            return entry[1].get(key, default)
+
+    def set(self, syllabus_id, project_id, key, value):
+        '''Store value for `key`.'''
+        generation = self._get_generation(syllabus_id, project_id)
+        with self._lock:
+            entry = self._values.get((syllabus_id, project_id))
+            if entry is None or entry[0] != generation:
+                entry = self._values[(syllabus_id, project_id)] = (generation, {})
+            entry[1][key] = value
+
+    def invalidate(self, project_id):
+        '''Invalidate cached values for the project and its users.'''
+        if project_id is None:
+            return
+        project_id = int(project_id)
+        CacheManager(self.env).invalidate(self._project_cache_id(project_id))
+        with self._lock:
+            for k in [k for k in self._values if k[1] == project_id]:
+                del self._values[k]
+
+    def invalidate_syllabus(self, syllabus_id=None):
+        '''Invalidate cached values for all projects of the syllabus.
+        If `syllabus_id` is None - invalidate cached values entirely.'''
+        if syllabus_id is not None:
+            syllabus_id = int(syllabus_id)
+        CacheManager(self.env).invalidate(self._syllabus_cache_id(syllabus_id))
+        with self._lock:
+            for k in [k for k in self._values
+                      if syllabus_id is None or k[0] == syllabus_id]:
+                del self._values[k]
+
+    # Internal methods
+
+    def _get_generation(self, syllabus_id, project_id):
+        cm = CacheManager(self.env)
+        return (cm.get_generation(self._syllabus_cache_id(None)),
+                cm.get_generation(self._syllabus_cache_id(syllabus_id)),
+                cm.get_generation(self._project_cache_id(project_id)))
+
+    def _syllabus_cache_id(self, syllabus_id):
+        if syllabus_id is None:
+            return 'trac.evaluation.values'
+        return 'trac.evaluation.values.syllabus:%s' % syllabus_id
+
+    def _project_cache_id(self, project_id):
+        return 'trac.evaluation.values.project:%s' % project_id
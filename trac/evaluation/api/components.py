@@ -1,12 +1,16 @@
 import threading
+from collections import OrderedDict
 
+from trac.cache import CacheManager
 from trac.core import Component, TracError
 from trac.util.text import exception_to_unicode
 from trac.util.translation import _, N_
-from trac.config import Option
+from trac.config import IntOption, Option
 
 from trac.project.api import ProjectManagement
 from trac.evaluation.api.model import EvaluationModel
+from trac.evaluation.api.cache import EvaluationValueCache
+from trac.evaluation.api.memo import evaluation_pass
 
 __all__ = ['EvaluationManagement']
 
@@ -17,10 +21,18 @@ class EvaluationManagement(Component):
     package = Option('evaluation', 'package', default='',
                         doc="""Name of evaluation model package""", switcher=True)
 
+    threads = IntOption('evaluation', 'threads', default='1',
+                        doc="""Number of threads evaluating independent variables
+                        (and subjects of variables without batch evaluation)
+                        concurrently. 1 evaluates everything in the request
+                        thread, which is required with SQLite databases.""")
+
     def __init__(self):
         self._model_cache_lock = threading.Lock()
         self.pm = ProjectManagement(self.env)
         self._models = {}
+        self._pool_lock = threading.Lock()
+        self._pool = None
 
     def get_model(self, syllabus_id):
         syllabus_id = int(syllabus_id)
@@ -63,3 +75,70 @@ class EvaluationManagement(Component):
                 self._models.pop(syllabus_id, None)
             else:
                 self._models = {}
+        EvaluationValueCache(self.env).invalidate_syllabus(syllabus_id)
+
+    def batch(self, variables, projects=None, users=None, catch_errors=False):
+        '''Evaluate several variables for several subjects at once.
+
+        Arguments are the same as for `ModelVariable.batch`. Return
+        OrderedDict { <variable>: OrderedDict { <subject>: <value>, ... } }
+        ordered as `variables`.
+
+        If `threads` option is greater than 1, the variables are evaluated
+        concurrently by a thread pool, each task using its own clone
+        of the variable (see `ModelVariable.clone`). Subjects of variables
+        without batch evaluation are split between the tasks too.
+
+        All the variables are evaluated in the same evaluation pass
+        (see `EvaluationPass`), so sub-variables they share are computed
+        once.
+        '''
+        with evaluation_pass() as memo:
+            return self._batch(memo, list(variables), projects, users,
+                               catch_errors)
+
+    def _batch(self, memo, variables, projects, users, catch_errors):
+        kwargs = {'catch_errors': catch_errors}
+        subjects = list(projects if projects is not None else users or [])
+        subj_arg = projects is not None and 'projects' or 'users'
+        threads = self.threads
+        if threads <= 1 or len(variables) * len(subjects) <= 1:
+            return OrderedDict((var, var.batch(projects=projects, users=users,
+                                               **kwargs))
+                               for var in variables)
+
+        tasks = []
+        chunk_size = (len(subjects) + threads - 1) // threads
+        for var in variables:
+            if var.supports_batch() or len(subjects) <= 1:
+                tasks.append((var, subjects))
+            else:
+                for i in xrange(0, len(subjects), chunk_size):
+                    tasks.append((var, subjects[i:i + chunk_size]))
+
+        def evaluate((var, chunk)):
+            # cache generations must be reloaded by the pool threads
+            CacheManager(self.env).reset_metadata()
+            with evaluation_pass(memo):
+                return var.clone().batch(**dict(kwargs, **{subj_arg: chunk}))
+
+        results = self._get_pool().map(evaluate, tasks)
+        values = OrderedDict((var, OrderedDict()) for var in variables)
+        for (var, chunk), result in zip(tasks, results):
+            values[var].update(result)
+        return values
+
+    def shutdown(self):
+        '''Terminate the thread pool evaluating variables, if any.'''
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                from multiprocessing.pool import ThreadPool
+                self._pool = ThreadPool(self.threads)
+            return self._pool
@@ -0,0 +1,171 @@
+import threading
+from contextlib import contextmanager
+
+from trac.util.translation import _
+
+from trac.evaluation.api.error import EvalModelError, EvalVariableError
+
+__all__ = ['EvaluationPass', 'evaluation_pass', 'get_evaluation_pass',
+           'make_key']
+
+
+_local = threading.local()
+
+
+class EvaluationPass(object):
+    '''Memo table of variable values computed during one evaluation pass.
+
+    Values are keyed by (syllabus ID, variable alias, normalized state)
+    (see `make_key`), so a sub-variable shared by several composite
+    variables (e.g. ticket counts used by project, milestone and final
+    ratings) is computed once per pass. Evaluation errors are memoized
+    as well and raised again on each access.
+
+    The pass also tracks which variables each variable depends on,
+    detects circular dependencies and counts hits and misses per
+    variable alias (see `get_stats`).
+
+    A pass is shared by the threads evaluating it (see
+    `EvaluationManagement.batch`), each thread having its own stack
+    of variables being computed.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # {key: (value, error)}
+        self._values = {}
+        # {alias: [hits, misses]}
+        self._counts = {}
+        # {alias: set of aliases of sub-variables}
+        self._dependencies = {}
+
+    def get(self, key, compute):
+        '''Return memoized value for `key`, or compute it with `compute()`
+        and memoize it.'''
+        alias = key[1]
+        found, value = self.lookup(key)
+        if found:
+            return value
+        with self.computing(alias, key):
+            try:
+                value = compute()
+            except EvalModelError, e:
+                self.store(key, None, e)
+                raise
+        self.store(key, value)
+        return value
+
+    def lookup(self, key):
+        '''Return (True, <value>) if a value is memoized for `key`,
+        (False, None) otherwise. A memoized error is raised.'''
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is not None:
+                self._count(key[1], 0)
+        if entry is None:
+            return False, None
+        value, error = entry
+        if error is not None:
+            raise error
+        return True, value
+
+    def store(self, key, value, error=None):
+        '''Memoize `value` (or `error`) computed for `key`.'''
+        with self._lock:
+            self._values[key] = (value, error)
+            self._count(key[1], 1)
+
+    @contextmanager
+    def computing(self, alias, key=None):
+        '''Context manager marking variable `alias` as being computed
+        in the current thread: variables accessed meanwhile are recorded
+        as its dependencies.'''
+        stack = self._get_stack()
+        if key is not None and key in [k for a, k in stack]:
+            raise EvalVariableError(_('Circular dependency of variable '
+                                      '"%(alias)s"', alias=alias))
+        stack.append((alias, key))
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def get_stats(self):
+        '''Return list of (alias, hits, misses, dependencies) tuples
+        ordered by alias, `dependencies` being a sorted list of aliases.'''
+        with self._lock:
+            return [(alias, hits, misses,
+                     sorted(self._dependencies.get(alias, ())))
+                    for alias, (hits, misses) in sorted(self._counts.items())]
+
+    def get_hit_rate(self):
+        '''Return ratio of variable accesses served from the memo table
+        or None if no variable was accessed.'''
+        with self._lock:
+            hits = sum(counts[0] for counts in self._counts.itervalues())
+            total = hits + sum(counts[1] for counts
+                               in self._counts.itervalues())
+        if total:
+            return float(hits) / total
+
+    # Internal methods
+
+    def _get_stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _count(self, alias, index):
+        counts = self._counts.setdefault(alias, [0, 0])
+        counts[index] += 1
+        stack = self._get_stack()
+        if stack and stack[-1][0] != alias:
+            self._dependencies.setdefault(stack[-1][0], set()).add(alias)
+
+
+def make_key(syllabus_id, alias, state):
+    '''Return memo key of variable `alias` evaluated for `state` or None
+    if the state can't be used as a key.
+
+    >>> make_key(1, 'var', {'area': 1, 'groupby': {'time': 2}, 'subjects': [3]})
+    (1, 'var', (('area', 1), ('groupby', (('time', 2),))))
+    '''
+    key = (syllabus_id, alias, _normalize(dict((k, v) for k, v
+                                               in state.iteritems()
+                                               if k != 'subjects')))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.iteritems()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    return value
+
+
+def get_evaluation_pass():
+    '''Return the evaluation pass of the current thread or None.'''
+    return getattr(_local, 'memo', None)
+
+
+@contextmanager
+def evaluation_pass(memo=None):
+    '''Context manager making `memo` the evaluation pass of the current
+    thread. By default the current pass is kept if there is one,
+    otherwise a new `EvaluationPass` is started.
+    '''
+    previous = get_evaluation_pass()
+    if memo is None:
+        memo = previous or EvaluationPass()
+    _local.memo = memo
+    try:
+        yield memo
+    finally:
+        _local.memo = previous
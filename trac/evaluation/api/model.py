@@ -1,3 +1,6 @@
+import copy
+from collections import OrderedDict
+
 from trac.util.translation import _
 from trac.util.text import exception_to_unicode
 
@@ -7,6 +10,8 @@ from trac.evaluation.api.error import *
 from trac.evaluation.api.meta import *
 from trac.evaluation.api.scale import *
 from trac.evaluation.api.area import *
+from trac.evaluation.api.cache import EvaluationValueCache
+from trac.evaluation.api.memo import evaluation_pass, make_key
 
 
 __all__ = ['EvaluationModel', 'ModelVariable', 'ModelConstant']
@@ -46,12 +51,14 @@ class EvaluationModel(object):
     constants = None  # see `ModelConstantAccessor`
     sources   = None  # see `SourceAccessor`
     sconfig   = None  # syllabus configuration
+    source_cache = None  # data shared between model sources instances
 
     def __init__(self, syllabus_id):
         self.vars = ModelVariableAccessor(self)
         self.constants = ModelConstantAccessor(self)
         from trac.evaluation.sources import SourceAccessor
         self.sources = SourceAccessor(self)
+        self.source_cache = {}
         self.syllabus_id = syllabus_id
 
         # initialized later (component activation)
@@ -67,6 +74,11 @@ class EvaluationModel(object):
         '''Return ticket value'''
         raise NotImplementedError
 
+    def get_ticket_values(self, tickets):
+        '''Return list of values of `tickets` list.
+        May be overridden to evaluate several tickets at once.'''
+        return [self.get_ticket_value(ticket) for ticket in tickets]
+
     # API
 
     def get_ticket_value_help(self):
@@ -186,6 +198,8 @@ class EvaluationModel(object):
 
 DEBUG = False
 
+_NOT_CACHED = object()
+
 class ModelVariable(object):
 
     __metaclass__ = ModelVariableMetaclass
@@ -197,12 +211,17 @@ class ModelVariable(object):
     subject_support      = set()
     cluster_support      = set([ClusterArea.NONE])
 
-    # not used currently
+    # see `group_by`
     time_groupby_support = set()
     subj_groupby_support = set()
 
     scale = Scale()
 
+    # Computed values are cached until project data changes
+    # (see `EvaluationValueCache`). Set to False for variables
+    # that depend on anything else, e.g. current time.
+    cacheable = True
+
     alias = None
     label = None
     description = None
@@ -212,6 +231,226 @@ class ModelVariable(object):
         self._set_default_state()
 
     def get(self):
+        self._check_state()
+        # values are memoized for the current evaluation pass
+        # (see `EvaluationPass`), a new pass is started if needed
+        with evaluation_pass() as memo:
+            key = self._memo_key(self._state)
+            if key is None:
+                with memo.computing(self.alias):
+                    return self._get_value()
+            return memo.get(key, self._get_value)
+
+    def _get_value(self):
+        cache = self._get_value_cache()
+        cache_args = cache and self._value_cache_args(self._state)
+        if cache_args:
+            value = cache.get(*cache_args, default=_NOT_CACHED)
+            if value is not _NOT_CACHED:
+                return value
+        value = self._evaluate(lambda: self._scale_value(self._get()))
+        if cache_args:
+            cache.set(*(cache_args + (value,)))
+        return value
+
+    def batch(self, projects=None, users=None, catch_errors=False):
+        '''Evaluate variable for several subjects at once.
+
+        Exactly one of `projects` (list of project IDs) or `users`
+        (list of usernames) must be specified. For users, project
+        must be set in the state beforehand (see `project`).
+        Other state arguments (e.g. milestone) are used as usual.
+
+        Return OrderedDict { <subject>: <value>, ... } ordered as subjects.
+        If `catch_errors` is True, messages of evaluation errors
+        are returned as subject values instead of raising exception.
+
+        Values are memoized per subject for the current evaluation pass
+        (see `EvaluationPass`) like the values of `get`.
+        '''
+        if (projects is None) == (users is None):
+            raise ValueError('Either projects or users must be specified')
+        if projects is not None:
+            area = SubjectArea.PROJECT
+            subjects = list(projects)
+        else:
+            area = SubjectArea.USER
+            subjects = list(users)
+        if not subjects:
+            return OrderedDict()
+
+        with evaluation_pass() as memo:
+            return self._batch(memo, area, subjects, catch_errors)
+
+    def _batch(self, memo, area, subjects, catch_errors):
+        state = self._state
+        self._state = dict(state, area=area, subjects=subjects)
+        try:
+            try:
+                if area == SubjectArea.USER and state.get('project_id') is None:
+                    raise EvalVariableError(_('Project must be set to evaluate '
+                                              'variable for several users'))
+                self._check_state()
+            except EvalModelError, e:
+                if not catch_errors:
+                    raise
+                return OrderedDict((subj, e.message) for subj in subjects)
+
+            # take values already computed in this pass or cached
+            cache = self._get_value_cache()
+            cached = {}
+            cache_args = {}
+            memo_keys = {}
+            for subj in subjects:
+                subj_state = self._subject_state(state, area, subj)
+                key = self._memo_key(subj_state)
+                if key is not None:
+                    try:
+                        found, value = memo.lookup(key)
+                    except EvalModelError, e:
+                        if not catch_errors:
+                            raise
+                        found, value = True, e.message
+                    if found:
+                        cached[subj] = value
+                        continue
+                    memo_keys[subj] = key
+                args = cache and self._value_cache_args(subj_state)
+                if not args:
+                    continue
+                cache_args[subj] = args
+                value = cache.get(*args, default=_NOT_CACHED)
+                if value is not _NOT_CACHED:
+                    cached[subj] = value
+                    if subj in memo_keys:
+                        memo.store(memo_keys[subj], value)
+            missing = [subj for subj in subjects if subj not in cached]
+
+            if missing:
+                self._state = dict(state, area=area, subjects=missing)
+                try:
+                    with memo.computing(self.alias):
+                        computed = self._evaluate(self._get_batch_values, missing)
+                except EvalModelError, e:
+                    if not catch_errors:
+                        raise
+                    computed = OrderedDict((subj, e.message) for subj in missing)
+                else:
+                    if computed is None:
+                        # variable doesn't support batch evaluation,
+                        # so evaluate it subject by subject
+                        # (values are memoized by `get`)
+                        computed = self._get_values_one_by_one(state, area, missing, catch_errors)
+                    else:
+                        for subj, value in computed.iteritems():
+                            if subj in cache_args:
+                                cache.set(*(cache_args[subj] + (value,)))
+                            if subj in memo_keys:
+                                memo.store(memo_keys[subj], value)
+                cached.update(computed)
+            return OrderedDict((subj, cached[subj]) for subj in subjects)
+        finally:
+            self._state = state
+
+    def clone(self):
+        '''Return new variable of the same class with a copy of the state.
+
+        Variables are not thread-safe (`batch` changes the state while
+        evaluating), so concurrent evaluations must use their own clones.
+        '''
+        var = self.__class__(self.model)
+        var._state = copy.deepcopy(self._state)
+        return var
+
+    def supports_batch(self):
+        '''Return whether the variable implements batch evaluation
+        (see `_get_batch`).
+
+        A subclass overriding `_get` of a variable with batch evaluation
+        (e.g. a `CountTickets` with its own query) is evaluated subject
+        by subject, unless it overrides `_get_batch` as well.
+        '''
+        mro = self.__class__.__mro__
+        def defining_class(name):
+            for cls in mro:
+                if name in cls.__dict__:
+                    return cls
+        batch_cls = defining_class('_get_batch')
+        return batch_cls is not ModelVariable and \
+            mro.index(batch_cls) <= mro.index(defining_class('_get'))
+
+    def _get_values_one_by_one(self, state, area, subjects, catch_errors):
+        values = OrderedDict()
+        for subj in subjects:
+            self._state = self._subject_state(state, area, subj)
+            try:
+                values[subj] = self.get()
+            except EvalModelError, e:
+                if not catch_errors:
+                    raise
+                values[subj] = e.message
+        return values
+
+    def _subject_state(self, state, area, subj):
+        '''Return copy of `state` with single subject `subj` set for `area`'''
+        if area == SubjectArea.PROJECT:
+            return dict(state, area=area, project_id=subj)
+        return dict(state, area=area, username=subj)
+
+    def _get_value_cache(self):
+        env = self.model and self.model.env
+        if env is not None and self.cacheable:
+            cache = EvaluationValueCache(env)
+            if cache.enabled:
+                return cache
+
+    def _memo_key(self, state):
+        '''Return key of the variable value for `state` in the memo
+        table of evaluation passes or None if it can't be memoized.'''
+        return make_key(self.model and self.model.syllabus_id, self.alias,
+                        state)
+
+    def _value_cache_args(self, state):
+        '''Return (<syllabus_id>, <project_id>, <key>) to cache variable
+        value for `state` or None if the value can't be cached.'''
+        if state['area'] not in (SubjectArea.PROJECT, SubjectArea.USER) or \
+                state.get('project_id') is None:
+            return None
+        key = (self.alias,) + tuple(sorted((k, v) for k, v in state.iteritems()
+                                           if k != 'subjects'))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return (self.model.syllabus_id, int(state['project_id']), key)
+
+    def _get_batch_values(self, subjects):
+        # a batch query for a single subject saves nothing over `get`
+        if not self.supports_batch() or len(subjects) == 1:
+            return None
+        values = self._get_batch(subjects)
+        if values is None:
+            return None
+        return OrderedDict((subj, self._scale_value(values.get(subj)))
+                           for subj in subjects)
+
+    def _scale_value(self, value):
+        '''Apply scale to value or to values of grouped results (see `group_by`)'''
+        if isinstance(value, dict):
+            return OrderedDict((k, self._scale_value(v)) for k, v in value.iteritems())
+        return self.scale.get(value)
+
+    def _get(self):
+        raise NotImplementedError
+
+    def _get_batch(self, subjects):
+        '''Return dict { <subject>: <raw value>, ... } for all `subjects`
+        (project IDs or usernames, see `self['area']`) at once
+        or None if variable doesn't support batch evaluation.
+        '''
+        return None
+
+    def _check_state(self):
         area = self._state['area']
         if area not in self.subject_support:
             raise EvalVariableError(_(
@@ -227,9 +466,10 @@ class ModelVariable(object):
                         'Variable requires clustering (available clusters: %(clusters)s) '
                         'but no appropriate arguments defined in var state',
                         clusters=cl_available))
+
+    def _evaluate(self, func, *args):
         try:
-            value = self._get()
-            value = self.scale.get(value)
+            return func(*args)
         except EvalModelError:
             raise
         except Exception, e:
@@ -237,10 +477,6 @@ class ModelVariable(object):
                 raise
             msg = exception_to_unicode(e)
             raise EvalModelError(_('Error occurred while getting variable value: %(msg)s', msg=msg))
-        return value
-
-    def _get(self):
-        raise NotImplementedError
 
     def __getitem__(self, arg):
         return self._state.get(arg)
@@ -291,12 +527,29 @@ class ModelVariable(object):
         }
         return self
 
-    # not used currently
-    def group_by(self, time=None, subj=None, first_by=None):
+    def group_by(self, time=None, subj=None, first_by=None, time_field=None):
+        '''Group variable value by time (see `TimeArea`) and/or subject
+        (see `SubjectArea`). Variable value becomes nested OrderedDicts
+        { <bucket start datetime or subject>: <value>, ... }.
+        Supported groupings are listed in `time_groupby_support` and
+        `subj_groupby_support`. For other arguments see ticket `Query.group_by`.
+        '''
+        if time is not None and time not in self.time_groupby_support:
+            raise EvalVariableError(_(
+                'Variable "%(alias)s" (%(label)s) doesn\'t support grouping by "%(area)s"',
+                alias=self.alias, label=self.label, area=TimeArea.label(time)))
+        if subj is not None and subj not in self.subj_groupby_support:
+            raise EvalVariableError(_(
+                'Variable "%(alias)s" (%(label)s) doesn\'t support grouping by "%(area)s"',
+                alias=self.alias, label=self.label, area=SubjectArea.label(subj)))
+        if time is None and subj is None:
+            self._state.pop('groupby', None)
+            return self
         self._state['groupby'] = {
             'time': time,
             'subj': subj,
-            'first_by': first_by
+            'first_by': first_by,
+            'time_field': time_field,
         }
         return self
 
@@ -370,10 +623,18 @@ class ModelVariable(object):
         q = query
         s = self._state
         area = s['area']
+        subjects = s.get('subjects')
         if area == SubjectArea.USER:
-            q.project(s['project_id']).user(s['username'])
-        elif area == SubjectArea.PROJECT:
             q.project(s['project_id'])
+            if subjects is not None:
+                q.users(subjects)
+            else:
+                q.user(s['username'])
+        elif area == SubjectArea.PROJECT:
+            if subjects is not None:
+                q.projects(subjects)
+            else:
+                q.project(s['project_id'])
         elif area == SubjectArea.GROUP:
             q.group(s['group_id'])
         elif area == SubjectArea.SYLLABUS:
@@ -381,6 +642,8 @@ class ModelVariable(object):
 
         if 'milestone' in s:
             q.milestone(s['milestone'])
+        if s.get('groupby'):
+            q.group_by(**s['groupby'])
 
 
 class ModelConstant(object):
@@ -487,6 +750,20 @@ class ModelSource(object):
         self._state['milestone'] = milestone_name
         return self
 
+    # Batch area setup methods
+    # should be overriden by sources supporting batch queries
+
+    def projects(self, project_ids):
+        raise EvalSourceError(_('Model source does not support batch queries'))
+
+    def users(self, usernames):
+        raise EvalSourceError(_('Model source does not support batch queries'))
+
+    # should be overriden by sources supporting grouped queries
+
+    def group_by(self, time=None, subj=None, first_by=None, time_field=None):
+        raise EvalSourceError(_('Model source does not support grouped queries'))
+
     # Util methods
 
     def check_state(self, *args):
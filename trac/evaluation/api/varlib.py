@@ -1,5 +1,5 @@
 from trac.evaluation.api.model import ModelVariable, \
-    SubjectArea, ClusterArea, \
+    SubjectArea, ClusterArea, TimeArea, \
     RatioScale
 from trac.evaluation.sources import tktsrc
 from trac.user.api import UserRole
@@ -11,6 +11,9 @@ class CountTickets(ModelVariable):
 
     scale = RatioScale(int)
 
+    time_groupby_support = set([TimeArea.DAY, TimeArea.WEEK, TimeArea.MONTH])
+    subj_groupby_support = set([SubjectArea.USER, SubjectArea.PROJECT])
+
     # parameters to override
 
     # Expression for ticket query.
@@ -39,6 +42,12 @@ class CountTickets(ModelVariable):
         '''Do some more specific query filtration before its execution'''
 
     def _get(self):
+        return self._prepare_query().count()
+
+    def _get_batch(self, subjects):
+        return self._prepare_query().count()
+
+    def _prepare_query(self):
         q = self.model.sources['ticket']
         q.user_field(self.user_field)
         self > q
@@ -47,8 +56,20 @@ class CountTickets(ModelVariable):
         if self.limit_project_users and self['area'] == SubjectArea.PROJECT:
             q.limit_to_project_users(self.limit_project_users_field, allow_empty=self.limit_allow_empty)
         self.extra_filter(q)
-        res = q.count()
-        return res
+        return q
+
+
+class SumTickets(CountTickets):
+    '''Sum ticket expression using several filters'''
+
+    # Expression to sum, e.g. tktsrc.TicketValue()
+    sum_expr = None
+
+    def _get(self):
+        return self._prepare_query().sum(self.sum_expr)
+
+    def _get_batch(self, subjects):
+        return self._prepare_query().sum(self.sum_expr)
 
 
 class MultiVars(ModelVariable):
@@ -88,8 +109,23 @@ class TwoVarsRatio(ModelVariable):
         var2  = self.model.vars[self.var2]
         self > var1
         self > var2
-        var1 = var1.get()
-        var2 = var2.get()
+        return self._ratio(var1.get(), var2.get())
+
+    def _get_batch(self, subjects):
+        var1  = self.model.vars[self.var1]
+        var2  = self.model.vars[self.var2]
+        self > var1
+        self > var2
+        if self['area'] == SubjectArea.PROJECT:
+            kwargs = {'projects': subjects}
+        else:
+            kwargs = {'users': subjects}
+        values1 = var1.batch(**kwargs)
+        values2 = var2.batch(**kwargs)
+        return dict((subj, self._ratio(values1[subj], values2[subj]))
+                    for subj in subjects)
+
+    def _ratio(self, var1, var2):
         if not var2:
             return 0
         if self.convert_type:
@@ -1,15 +1,71 @@
+import os
+import socket
+import threading
+from datetime import datetime
+from itertools import groupby, islice
+
+from trac.cache import CacheManager
+from trac.config import ChoiceOption
 from trac.core import Component, implements
 from trac.ticket.api import ITicketChangeListener
+from trac.ticket.model import Ticket
 from trac.db import with_transaction
-from trac.evaluation.api import EvaluationManagement
+from trac.web.api import IRequestFilter
+from trac.evaluation.api import EvaluationManagement, EvaluationValueCache
+from trac.util.datefmt import to_utimestamp, utc
+from trac.util.text import exception_to_unicode
 
 
 class TicketStatistics(Component):
 
-    implements(ITicketChangeListener)
+    implements(ITicketChangeListener, IRequestFilter)
+
+    ticket_updates = ChoiceOption('evaluation', 'ticket_updates',
+                                  ['deferred', 'immediate'],
+        """How evaluation values of changed tickets are updated:
+        `deferred` queues the changed tickets in the database and
+        updates their values in batches from a background thread
+        started by the first request or change, `immediate` updates the
+        value when the ticket is saved. Tickets left queued by a stopped
+        process are updated by the next worker started, or with
+        `trac-admin <env> evaluation queue process`.""")
+
+    # Number of tickets evaluated and stored in one transaction
+    # by `update_project_tickets` and `process_queue`
+    UPDATE_CHUNK_SIZE = 500
+
+    # Seconds between two checks of the queue when nothing is queued
+    # by this process (changes queued by other processes or before
+    # a restart)
+    QUEUE_INTERVAL = 60
+
+    # Seconds waited after a ticket is queued before updating values,
+    # so that bursts of changes are coalesced
+    QUEUE_DELAY = 1
+
+    # Seconds after which tickets claimed by a worker which didn't
+    # update them (e.g. its process was killed) can be claimed again
+    CLAIM_TIMEOUT = 600
 
     def __init__(self):
         self.em = EvaluationManagement(self.env)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    # IRequestFilter methods
+
+    def pre_process_request(self, req, handler):
+        # update the tickets left queued by a stopped process
+        if self._worker is None and self.ticket_updates == 'deferred' and \
+                not self._stopping.is_set():
+            self._start_worker()
+            self._wakeup.set()
+        return handler
+
+    def post_process_request(self, req, template, data, content_type):
+        return template, data, content_type
 
     # ITicketChangeListener methods
 
@@ -24,7 +80,13 @@ class TicketStatistics(Component):
         pass
 
     def watch_ticket(self, tkt, is_new=False):
-        self.update_ticket(tkt, is_new=is_new)
+        if self.ticket_updates == 'immediate':
+            self.update_ticket(tkt, is_new=is_new)
+        else:
+            if is_new:
+                # the queue worker then only updates the value
+                self.update_ticket_value(tkt.id, 0, insert=True)
+            self.enqueue([(tkt.id, tkt.pid)])
 
     #
 
@@ -51,3 +113,219 @@ class TicketStatistics(Component):
             cursor = db.cursor()
             cursor.execute(query, params)
 
+    def update_project_tickets(self, pid, progress=None):
+        '''Recompute values of all tickets of the project.
+
+        Tickets are read with a single query (see `Ticket.select`),
+        evaluated by chunks of `UPDATE_CHUNK_SIZE` tickets (see
+        `EvaluationModel.get_ticket_values`) and values of each chunk
+        are stored in one transaction. `progress(pid, count)` is called
+        after each chunk. Return the number of updated tickets.
+        '''
+        model = self.em.get_model_by_project(pid)
+        tickets = Ticket.select(self.env, pid)
+        count = 0
+        while True:
+            chunk = list(islice(tickets, self.UPDATE_CHUNK_SIZE))
+            if not chunk:
+                break
+            values = model.get_ticket_values(chunk)
+            self.update_ticket_values(zip([t.id for t in chunk], values))
+            count += len(chunk)
+            if progress:
+                progress(pid, count)
+        if count:
+            EvaluationValueCache(self.env).invalidate(pid)
+        return count
+
+    def update_ticket_values(self, values):
+        '''Store list of (ticket_id, value) pairs in one transaction,
+        values of tickets missing in `ticket_evaluation` are inserted.
+
+        Rows are inserted when tickets are created, so only tickets
+        created before the evaluation system have a missing row: all the
+        values are updated with one `executemany`, then the rows still
+        missing are inserted with another one.
+        '''
+        if not values:
+            return
+        @with_transaction(self.env)
+        def update_values(db):
+            cursor = db.cursor()
+            cursor.executemany('''
+                UPDATE ticket_evaluation
+                SET value=%s
+                WHERE ticket_id=%s
+                ''', [(value, ticket_id) for ticket_id, value in values])
+            cursor.execute('''
+                SELECT ticket_id FROM ticket_evaluation
+                WHERE ticket_id IN (%s)
+                ''' % ','.join(['%s'] * len(values)),
+                [ticket_id for ticket_id, value in values])
+            existing = set(row[0] for row in cursor)
+            missing = [(ticket_id, value) for ticket_id, value in values
+                       if ticket_id not in existing]
+            if missing:
+                cursor.executemany('''
+                    INSERT INTO ticket_evaluation (ticket_id, value)
+                    VALUES (%s, %s)
+                    ''', missing)
+
+    # Deferred updates
+
+    def enqueue(self, tickets):
+        '''Queue value updates of the (ticket_id, project_id) pairs
+        and start the queue worker of this process if needed.
+
+        A ticket is queued once: changing it again before its value is
+        updated only moves its queue time.
+        '''
+        if not tickets:
+            return
+        now = to_utimestamp(datetime.now(utc))
+        @with_transaction(self.env)
+        def do_enqueue(db):
+            cursor = db.cursor()
+            for ticket_id, pid in tickets:
+                cursor.execute('''
+                    UPDATE ticket_evaluation_queue SET time=%s
+                    WHERE ticket_id=%s
+                    ''', (now, ticket_id))
+                if not cursor.rowcount:
+                    cursor.execute('''
+                        INSERT INTO ticket_evaluation_queue
+                            (ticket_id, project_id, time)
+                        VALUES (%s, %s, %s)
+                        ''', (ticket_id, pid, now))
+        self._start_worker()
+        self._wakeup.set()
+
+    def process_queue(self):
+        '''Update values of the queued tickets and return their number.
+
+        Tickets are claimed by batches of `UPDATE_CHUNK_SIZE` tickets
+        in ticket id order, so that workers of several processes don't
+        update the same tickets. Values of each project of a batch are
+        computed with `EvaluationModel.get_ticket_values` and stored in
+        the transaction removing the tickets from the queue. Tickets
+        queued again meanwhile and tickets of a project failing to
+        evaluate stay queued and are released for the next run.
+        '''
+        count = 0
+        worker = '%s:%s' % (socket.gethostname(), os.getpid())
+        try:
+            while True:
+                rows = self._claim_queued(worker)
+                if not rows:
+                    break
+                rows.sort(key=lambda row: (row[1], row[0]))
+                for pid, queued in groupby(rows, key=lambda row: row[1]):
+                    queued = [(ticket_id, ts) for ticket_id, _, ts in queued]
+                    try:
+                        count += self._update_queued_tickets(pid, queued,
+                                                             worker)
+                    except Exception, e:
+                        self.log.error("Failed to update evaluation values "
+                                       "of tickets of project %s: %s", pid,
+                                       exception_to_unicode(e,
+                                                            traceback=True))
+        finally:
+            @with_transaction(self.env)
+            def do_release(db):
+                cursor = db.cursor()
+                cursor.execute('''
+                    UPDATE ticket_evaluation_queue
+                    SET claimed_by=NULL, claim_time=NULL
+                    WHERE claimed_by=%s
+                    ''', (worker,))
+        return count
+
+    def shutdown(self):
+        '''Stop the queue worker, waiting for the end of the update
+        in progress.'''
+        with self._worker_lock:
+            self._stopping.set()
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._wakeup.set()
+            worker.join()
+
+    def _claim_queued(self, worker):
+        '''Claim the next batch of unclaimed queued tickets and return
+        their (ticket_id, project_id, time) rows.'''
+        now = to_utimestamp(datetime.now(utc))
+        expired = now - self.CLAIM_TIMEOUT * 1000000
+        @with_transaction(self.env)
+        def do_claim(db):
+            cursor = db.cursor()
+            cursor.execute('''
+                SELECT ticket_id FROM ticket_evaluation_queue
+                WHERE claimed_by IS NULL OR claim_time<%%s
+                ORDER BY ticket_id LIMIT %d
+                ''' % self.UPDATE_CHUNK_SIZE, (expired,))
+            ids = [row[0] for row in cursor]
+            if ids:
+                # claimed meanwhile by another worker if not updated
+                cursor.execute('''
+                    UPDATE ticket_evaluation_queue
+                    SET claimed_by=%%s, claim_time=%%s
+                    WHERE ticket_id IN (%s)
+                      AND (claimed_by IS NULL OR claim_time<%%s)
+                    ''' % ','.join(['%s'] * len(ids)),
+                    [worker, now] + ids + [expired])
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        cursor.execute('''
+            SELECT ticket_id, project_id, time
+            FROM ticket_evaluation_queue
+            WHERE claimed_by=%s AND claim_time=%s
+            ORDER BY ticket_id
+            ''', (worker, now))
+        return cursor.fetchall()
+
+    def _update_queued_tickets(self, pid, queued, worker):
+        model = self.em.get_model_by_project(pid)
+        tickets = list(Ticket.select(self.env, pid,
+                                     ids=[ticket_id for ticket_id, ts
+                                          in queued]))
+        values = dict(zip([t.id for t in tickets],
+                          tickets and model.get_ticket_values(tickets) or []))
+        updated = []
+        @with_transaction(self.env)
+        def do_update(db):
+            cursor = db.cursor()
+            for ticket_id, ts in queued:
+                # tickets queued again keep their queue entry
+                cursor.execute('''
+                    DELETE FROM ticket_evaluation_queue
+                    WHERE ticket_id=%s AND time=%s AND claimed_by=%s
+                    ''', (ticket_id, ts, worker))
+                if cursor.rowcount and ticket_id in values:
+                    updated.append((ticket_id, values[ticket_id]))
+            self.update_ticket_values(updated)
+        EvaluationValueCache(self.env).invalidate(pid)
+        return len(updated)
+
+    def _start_worker(self):
+        with self._worker_lock:
+            if self._worker is None and not self._stopping.is_set():
+                self._worker = threading.Thread(target=self._run_worker,
+                                     name='TicketStatistics queue worker')
+                self._worker.daemon = True
+                self._worker.start()
+
+    def _run_worker(self):
+        while True:
+            self._wakeup.wait(self.QUEUE_INTERVAL)
+            if self._wakeup.is_set():
+                self._stopping.wait(self.QUEUE_DELAY)
+                self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                CacheManager(self.env).reset_metadata()
+                self.process_queue()
+            except Exception, e:
+                self.log.error("Failed to process the evaluation update "
+                               "queue: %s",
+                               exception_to_unicode(e, traceback=True))
@@ -19,9 +19,10 @@ from trac.web.chrome import add_ctxtnav, add_package, add_notice, \
 
 from trac.ticket.model import Milestone
 from trac.project.api import ProjectManagement
-from trac.user.api import UserRole
+from trac.user.api import UserRole, UserManagement
 from trac.evaluation.api.components import EvaluationManagement
-from trac.evaluation.api import EvalModelError, SubjectArea
+from trac.evaluation.api.cache import EvaluationValueCache
+from trac.evaluation.api import SubjectArea
 
 import formencode
 from formencode import validators, variabledecode
@@ -116,6 +117,7 @@ class MilestoneEvaluation(Component):
     def __init__(self):
         self.pm = ProjectManagement(self.env)
         self.evmanager = EvaluationManagement(self.env)
+        self.value_cache = EvaluationValueCache(self.env)
         md = self.env.get_sa_metadata()
         self.ev_tab  = md.tables['team_milestone_evaluation']
         self.res_tab = md.tables['team_milestone_evaluation_results']
@@ -337,22 +339,14 @@ class MilestoneEvaluation(Component):
     def _init_user_vars(self, milestone, vars, users):
         user_vars = [var for var in vars
                      if SubjectArea.USER in var.subject_support]
-        vvalues = OrderedDict()
         for var in user_vars:
-            uvalues = OrderedDict()
             var.project(milestone.pid)
             var.milestone(milestone.name)
-            for user in users:
-                try:
-                    var.user(user)
-                    var_value = var.get()
-                except EvalModelError, e:
-                    var_value = e.message
-                uvalues[user] = var_value
-            vvalues[var] = uvalues
-        return vvalues
+        return self.evmanager.batch(user_vars, users=users, catch_errors=True)
 
     def _prepare_eval_vars(self, req, milestone, users, role, data):
+        # prefetch fullnames shown in template
+        UserManagement(self.env).get_user_fullnames(users, req)
         syllabus_id = req.data['syllabus_id']
         model = self.evmanager.get_model(syllabus_id)
         milestone_vars = model.get_milestone_team_eval_vars(role)
@@ -366,16 +360,15 @@ class MilestoneEvaluation(Component):
         syllabus_id = req.data['syllabus_id']
         model = self.evmanager.get_model(syllabus_id)
         milestone_vars = model.get_milestone_rating_vars()
-        vars = OrderedDict()
         if milestone_vars:
             for var in milestone_vars:
-                try:
-                    var.project(project_id)
-                    var.milestone(milestone.name)
-                    var_value = var.get()
-                except EvalModelError, e:
-                    var_value = e.message
-                vars[var] = var_value
+                var.milestone(milestone.name)
+            # a single project is evaluated as with `get`, but the
+            # variables share one evaluation pass and may run concurrently
+            values = self.evmanager.batch(milestone_vars, projects=[project_id],
+                                          catch_errors=True)
+            vars = OrderedDict((var, values[var][project_id])
+                               for var in milestone_vars)
             if vars:
                 data['milestone_vars'] = vars
 
@@ -559,6 +552,7 @@ class MilestoneEvaluation(Component):
             values(approved=approved)
         conn = self.env.get_sa_connection()
         conn.execute(q_ev)
+        self.value_cache.invalidate(pid)
 
     def save_results(self, author, pid, milestone, completed_on, results, is_new=False):
         '''Save milestone team evaluation results.
@@ -597,3 +591,4 @@ class MilestoneEvaluation(Component):
         except:
             trans.rollback()
             raise
+        self.value_cache.invalidate(pid)
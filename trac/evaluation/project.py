@@ -9,8 +9,8 @@ from trac.core import Component, implements
 from trac.perm import IPermissionRequestor
 
 from trac.evaluation.api.components import EvaluationManagement
+from trac.evaluation.api.cache import EvaluationValueCache
 from trac.evaluation.api.scale import prepare_editable_var, create_scale_validator, create_group_validator
-from trac.evaluation.api.error import EvalModelError
 
 
 class ProjectEvalForm(formencode.Schema):
@@ -32,6 +32,7 @@ class ProjectEvaluation(Component):
 
     def __init__(self):
         self.evmanager = EvaluationManagement(self.env)
+        self.value_cache = EvaluationValueCache(self.env)
         md = self.env.get_sa_metadata()
         self.pe_tab  = md.tables['project_evaluation']
 
@@ -125,15 +126,13 @@ class ProjectEvaluation(Component):
         syllabus_id = req.data['syllabus_id']
         model = self.evmanager.get_model(syllabus_id)
         variables = model.get_project_rating_vars()
-        vars = OrderedDict()
         if variables:
-            for var in variables:
-                try:
-                    var.project(project_id)
-                    var_value = var.get()
-                except EvalModelError, e:
-                    var_value = e.message
-                vars[var] = var_value
+            # a single project is evaluated as with `get`, but the
+            # variables share one evaluation pass and may run concurrently
+            values = self.evmanager.batch(variables, projects=[project_id],
+                                          catch_errors=True)
+            vars = OrderedDict((var, values[var][project_id])
+                               for var in variables)
             if vars:
                 data['variables'] = vars
 
@@ -230,4 +229,5 @@ class ProjectEvaluation(Component):
         except:
             trans.rollback()
             raise
+        self.value_cache.invalidate(project_id)
 
@@ -3,18 +3,21 @@ from operator import (
     )
 
 #from inspect import currentframe
+from collections import OrderedDict
+from datetime import datetime
 from lazy import lazy
 
-from sqlalchemy import Integer, Numeric
-from sqlalchemy.sql import func, cast
+from sqlalchemy import Integer, BigInteger, Numeric
+from sqlalchemy.sql import func, cast, select, extract, literal_column, bindparam
 
+from trac.util.datefmt import from_utimestamp, utc
 from trac.util.translation import _
 
 from trac.ticket.api import TicketSystem
 from trac.project.api import ProjectManagement
 
 from trac.evaluation.api.model import ModelSource
-from trac.evaluation.api.area import SubjectArea
+from trac.evaluation.api.area import SubjectArea, TimeArea
 from trac.evaluation.api.error import EvalSourceError
 
 __all__ = ['Query', 'Info',                                         # sources
@@ -22,7 +25,7 @@ __all__ = ['Query', 'Info',                                         # sources
            'Milestone', 'Type', 'Priority', 'Severity', 'Version',
            'Component', 'Keywords', 'CreateTime', 'ChangeTime'
            'TicketValue',                                           # extra attributes
-           'InProjectUsers',                                        # special expressions
+           'InProjectUsers', 'Param',                               # special expressions
            'Count', 'Sum', 'Avg',                                   # function expressions
            ]
 
@@ -99,6 +102,24 @@ class OpExpression(object):
         '''Compare two OpExpression objects'''
         return self.op == other.op and self.args == other.args
 
+    def key(self):
+        '''Return hashable structural key of expression.
+        Expressions don't store dynamic data (see class docstring),
+        so the key is built from class and all instance attributes.'''
+        return (self.__class__,
+                tuple(sorted((k, self.value_key(v)) for k, v in vars(self).iteritems())))
+
+    @classmethod
+    def value_key(cls, value):
+        '''Return hashable key of expression argument'''
+        if isinstance(value, OpExpression):
+            return value.key()
+        if isinstance(value, (list, tuple)):
+            return (value.__class__, tuple(map(cls.value_key, value)))
+        if isinstance(value, (set, frozenset)):
+            return (value.__class__, frozenset(map(cls.value_key, value)))
+        return (value.__class__, value)
+
     @classmethod
     def process_args(cls, args, ticket_query):
         return map(lambda a: cls._process_arg(a, ticket_query), args)
@@ -143,12 +164,31 @@ class InProjectUsers(OpExpression):
                                              and self.allow_empty == other.allow_empty
 
     def process(self, ticket_query):
-        project_id = int(ticket_query._state['project_id'])
-        users = ticket_query.projman.get_project_users(project_id)
-        expr = self.expr.in_(users)
+        # check each ticket against its own project team,
+        # so that statement doesn't depend on project
+        tables = ticket_query.sa_metadata.tables
+        dp = tables['developer_projects']
+        col = self.expr.process(ticket_query)
+        users = select([dp.c.username]).\
+                    where(dp.c.project_id==tables['ticket'].c.project_id)
+        expr = col.in_(users)
         if self.allow_empty:
-            expr = expr | (self.expr == None)
-        return expr.process(ticket_query)
+            expr = expr | (col == None)
+        return expr
+
+
+class Param(OpExpression):
+    '''Query parameter. Its value is taken from query state on execution,
+    so that compiled query statement can be reused for other values.'''
+
+    def __init__(self, name):
+        self.name = name
+
+    def compare(self, other):
+        return self.name == other.name
+
+    def process(self, ticket_query):
+        return bindparam('p_' + self.name)
 
 
 class TicketAttribute(OpExpression):
@@ -345,6 +385,9 @@ class Avg(FuncExpression):
 
 class Query(ModelSource):
 
+    # maximum number of compiled statements cached in the model
+    statement_cache_size = 500
+
     def __init__(self, model):
         super(Query, self).__init__(model)
         self.info   = Info(self.model)
@@ -362,9 +405,10 @@ class Query(ModelSource):
             'extra_columns': set(), # all used extra attribute columns (names)
             'func_columns': set(), # all used func columns (names)
             'where_exprs': [],
+            'params': {}, # values of query parameters (see `Param`)
             'aggregate': False, # is aggregate op applied
 #            'aggregate_expr': None,
-            'group_by': False,
+            'group_by': None, # see `group_by`
             'scalar': False,
         }
         self._query_parts = {
@@ -382,7 +426,11 @@ class Query(ModelSource):
         a = s['area']
         q = self.info.reset()
         if a == SubjectArea.USER or a == SubjectArea.PROJECT:
-            q.project(s['project_id'])
+            pid = s['project_id']
+            if pid is None and s.get('subjects'):
+                # batch project area: projects share syllabus fields
+                pid = s['subjects'][0]
+            q.project(pid)
         elif a == SubjectArea.GROUP or a == SubjectArea.SYLLABUS:
             q.project(s['syllabus_id'])
         return q.ticket_fields()
@@ -401,6 +449,22 @@ class Query(ModelSource):
         })
         return self
 
+    def users(self, usernames, field_expr=None):
+        '''Batch user area: query results are grouped by user.
+        Project must be set beforehand.'''
+        self.user(None, field_expr)
+        self._state['subjects'] = list(usernames)
+        return self
+
+    def projects(self, pids):
+        '''Batch project area: query results are grouped by project.'''
+        self._state.update({
+            'area': SubjectArea.PROJECT,
+            'project_id': None,
+            'subjects': list(pids),
+        })
+        return self
+
     def user_field(self, field_expr):
         field_expr = self._instantiate_expr(field_expr)
         self._state['user_area_field'] = field_expr
@@ -435,7 +499,8 @@ class Query(ModelSource):
         return self
 
     def milestone(self, name):
-        self.where(Milestone() == name)
+        self._state['params']['milestone'] = name
+        self.where(Milestone() == Param('milestone'))
         return self
 
     def period(self, begin=None, end=None):
@@ -445,11 +510,33 @@ class Query(ModelSource):
         }
         return self
 
-    def group_by(self, time=None, subj=None, first_by=None):
-        self._state['groupby'] = {
+    def group_by(self, time=None, subj=None, first_by=None, time_field=None):
+        '''Group query results in SQL.
+
+        `time`: TimeArea.DAY, TimeArea.WEEK or TimeArea.MONTH buckets
+                of `time_field` (ticket creation time by default)
+        `subj`: SubjectArea.USER (by user area field, see `user_field`)
+                or SubjectArea.PROJECT
+        `first_by`: 'time' (default) or 'subj' - outer grouping level
+                    when both `time` and `subj` are specified
+
+        Query returns nested OrderedDicts with bucket start datetime (UTC)
+        or subject as keys, e.g. { <datetime>: { <username>: <count> } }.
+        '''
+        if time not in (None, TimeArea.DAY, TimeArea.WEEK, TimeArea.MONTH):
+            raise EvalSourceError(_('Unsupported time grouping for ticket query'))
+        if subj not in (None, SubjectArea.USER, SubjectArea.PROJECT):
+            raise EvalSourceError(_('Unsupported subject grouping for ticket query'))
+        if time is None and subj is None:
+            self._state['group_by'] = None
+            return self
+        if time_field is None:
+            time_field = CreateTime()
+        self._state['group_by'] = {
             'time': time,
             'subj': subj,
-            'first_by': first_by
+            'first_by': first_by or 'time',
+            'time_field': self._instantiate_expr(time_field),
         }
         return self
 
@@ -474,7 +561,7 @@ class Query(ModelSource):
         self.only(Count())
         if not self._state['group_by']:
             self._state['scalar'] = True
-            self._state['none_value'] = 0
+        self._state['none_value'] = 0
         return self.execute()
 
     def sum(self, expr):
@@ -486,7 +573,7 @@ class Query(ModelSource):
         self.only(Sum(expr))
         if not self._state['group_by']:
             self._state['scalar'] = True
-            self._state['none_value'] = 0
+        self._state['none_value'] = 0
         return self.execute()
 
     def get(self):
@@ -496,21 +583,74 @@ class Query(ModelSource):
     def execute(self):
         '''Execute query and return rows matching to query state.
         Return single value if state['scalar'] is True.
+        For batch areas (see `projects` and `users`) return
+        dict { <subject>: <value or rows>, ... }.
+        For grouped queries see `group_by`.
+
+        Compiled statements are cached in the model and reused
+        for queries of the same structure (see `_statement_key`).
         '''
-        conn = self.sa_conn
+        s = self._state
+        cache = self.model.source_cache.setdefault('ticket_statements', {})
+        key = self._statement_key()
+        stmt = cache.get(key) if key is not None else None
+        if stmt is None:
+            stmt = self._build_statement()
+            if key is not None:
+                if len(cache) >= self.statement_cache_size:
+                    cache.clear()
+                cache[key] = stmt
+
+        res = self.sa_conn.execute(stmt['compiled'], self._statement_params())
+        single_col = stmt['single_col']
+        if stmt['converters']:
+            ret = self._group_rows(res.fetchall(), stmt['converters'], single_col)
+            if stmt['batch']:
+                ret = OrderedDict((subj, ret.get(subj, OrderedDict()))
+                                  for subj in s['subjects'])
+            return ret
+        if stmt['batch']:
+            return self._group_by_subjects(res.fetchall(), single_col)
+        if s['scalar']:
+            val = res.scalar()
+            if val is None and 'none_value' in s:
+                return s['none_value']
+            return val
+        rows = res.fetchall()
+        if stmt['columns_count'] == 1:
+            return [r[0] for r in rows]
+        return rows
+
+    def _build_statement(self):
+        '''Build and compile query statement.
+        Values of subjects and parameters are left as bound parameters
+        (see `_statement_params`).'''
         metadata = self.sa_metadata
         s  = self._state
         qp = self._query_parts
         area = s['area']
+        subjects = s.get('subjects')
 
         tickets      = metadata.tables['ticket']
         project_info = metadata.tables['project_info']
 
+        key_col = None
+        subj_expr = None
         if area == SubjectArea.USER:
-            self.where(s['user_field_expr'] == s['username'])
+            user_col = s['user_field_expr'].process(self)
+            if subjects is None:
+                subj_expr = user_col == bindparam('q_username')
+            else:
+                subj_expr = user_col.in_(self._subject_params())
+                key_col = user_col
+        elif area == SubjectArea.PROJECT and subjects is not None:
+            key_col = tickets.c.project_id
 
         cols = OpExpression.process_args(s['columns'], self)
         where_exprs = OpExpression.process_args(s['where_exprs'], self)
+        # grouping by batch subjects is done already
+        group_keys = [(col, conv) for col, conv in self._group_by_keys()
+                      if col is not key_col]
 
         q_from = tickets
         if area == SubjectArea.SYLLABUS or area == SubjectArea.GROUP:
@@ -525,12 +665,26 @@ class Query(ModelSource):
 
         q = q_from.select()
 
-        if area == SubjectArea.USER or area == SubjectArea.PROJECT:
-            q = q.where(tickets.c.project_id==s['project_id'])
+        if area == SubjectArea.PROJECT and subjects is not None:
+            q = q.where(tickets.c.project_id.in_(self._subject_params()))
+        elif area == SubjectArea.USER or area == SubjectArea.PROJECT:
+            q = q.where(tickets.c.project_id==bindparam('q_project_id'))
         elif area == SubjectArea.SYLLABUS:
-            q = q.where(project_info.c.syllabus_id==s['syllabus_id'])
+            q = q.where(project_info.c.syllabus_id==bindparam('q_syllabus_id'))
         elif area == SubjectArea.GROUP:
-            q = q.where(project_info.c.group_id==s['group_id'])
+            q = q.where(project_info.c.group_id==bindparam('q_group_id'))
+        if subj_expr is not None:
+            q = q.where(subj_expr)
+
+        key_cols = [col for col, conv in group_keys]
+        if key_col is not None:
+            key_cols.insert(0, key_col)
+        if key_cols:
+            cols = key_cols + cols
+            if s['aggregate']:
+                q = q.group_by(*key_cols)
+            if group_keys:
+                q = q.order_by(*key_cols)
 
         if cols:
             q = q.with_only_columns(cols)
@@ -539,16 +693,152 @@ class Query(ModelSource):
             for expr in where_exprs:
                 q = q.where(expr)
 
-        res = conn.execute(q)
-        if s['scalar']:
-            val = res.scalar()
-            if val is None and 'none_value' in s:
-                return s['none_value']
-            return val
-        rows = res.fetchall()
-        if len(cols) == 1:
-            return [r[0] for r in rows]
-        return rows
+        converters = [conv for col, conv in group_keys]
+        if converters and key_col is not None:
+            converters.insert(0, None)
+        return {
+            'compiled': q.compile(bind=self.sa_conn),
+            'batch': key_col is not None,
+            'converters': converters,
+            'single_col': len(cols) - len(key_cols) == 1,
+            'columns_count': len(cols),
+        }
+
+    def _statement_key(self):
+        '''Return hashable key identifying structure of query statement
+        or None if statement can not be reused.'''
+        s = self._state
+        subjects = s.get('subjects')
+        gb = s['group_by']
+        if gb:
+            gb = (gb['time'], gb['subj'], gb['first_by'],
+                  OpExpression.value_key(gb['time_field']))
+        custom_fields = tuple(sorted((name, f['type'], f.get('value'))
+                                     for name, f in self._ticket_fields.iteritems()
+                                     if 'custom' in f))
+        key = (s['area'],
+               None if subjects is None else len(subjects),
+               OpExpression.value_key(s.get('user_field_expr')),
+               OpExpression.value_key(s['user_area_field']),
+               OpExpression.value_key(s['columns']),
+               OpExpression.value_key(s['where_exprs']),
+               gb, s['aggregate'], custom_fields)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _statement_params(self):
+        '''Return values for bound parameters of query statement'''
+        s = self._state
+        area = s['area']
+        subjects = s.get('subjects')
+        params = dict(('p_' + k, v) for k, v in s['params'].iteritems())
+        if area == SubjectArea.USER or area == SubjectArea.PROJECT:
+            if area == SubjectArea.USER or subjects is None:
+                params['q_project_id'] = s['project_id']
+            if area == SubjectArea.USER and subjects is None:
+                params['q_username'] = s['username']
+            if subjects is not None:
+                params.update(('q_subject_%d' % i, subj)
+                              for i, subj in enumerate(subjects))
+        elif area == SubjectArea.SYLLABUS:
+            params['q_syllabus_id'] = s['syllabus_id']
+        elif area == SubjectArea.GROUP:
+            params['q_group_id'] = s['group_id']
+        return params
+
+    def _subject_params(self):
+        return [bindparam('q_subject_%d' % i) for i in range(len(self._state['subjects']))]
+
+    def _group_by_subjects(self, rows, single_col):
+        '''Map batch query rows (subject is the first column) to subjects'''
+        s = self._state
+        if s['aggregate']:
+            values = dict((r[0], r[1] if single_col else r[1:]) for r in rows)
+            ret = {}
+            for subj in s['subjects']:
+                val = values.get(subj)
+                if val is None and 'none_value' in s:
+                    val = s['none_value']
+                ret[subj] = val
+            return ret
+        ret = dict((subj, []) for subj in s['subjects'])
+        for r in rows:
+            ret.setdefault(r[0], []).append(r[1] if single_col else r[1:])
+        return ret
+
+    def _group_rows(self, rows, converters, single_col):
+        '''Map grouped query rows (first columns are group keys)
+        to nested OrderedDicts'''
+        s = self._state
+        ret = OrderedDict()
+        nkeys = len(converters)
+        for r in rows:
+            keys = [conv(k) if conv and k is not None else k
+                    for conv, k in zip(converters, r[:nkeys])]
+            d = ret
+            for k in keys[:-1]:
+                d = d.setdefault(k, OrderedDict())
+            value = r[nkeys] if single_col else r[nkeys:]
+            if s['aggregate']:
+                if value is None and 'none_value' in s:
+                    value = s['none_value']
+                d[keys[-1]] = value
+            else:
+                d.setdefault(keys[-1], []).append(value)
+        return ret
+
+    def _group_by_keys(self):
+        '''Return list of (<column>, <key converter or None>)
+        for group by expressions (see `group_by`)'''
+        gb = self._state['group_by']
+        if not gb:
+            return []
+        keys = []
+        if gb['time'] is not None:
+            keys.append(self._time_bucket(gb['time'], gb['time_field']))
+        if gb['subj'] == SubjectArea.USER:
+            subj_key = (self._state['user_area_field'].process(self), None)
+        elif gb['subj'] == SubjectArea.PROJECT:
+            subj_key = (self.sa_metadata.tables['ticket'].c.project_id, None)
+        else:
+            subj_key = None
+        if subj_key is not None:
+            if gb['first_by'] == 'subj':
+                keys.insert(0, subj_key)
+            else:
+                keys.append(subj_key)
+        return keys
+
+    def _time_bucket(self, time_area, time_field):
+        '''Return (<bucket key column>, <key to bucket start datetime converter>).
+        Constants are rendered as literals, so that equal expressions
+        in SELECT and GROUP BY clauses are recognized by the database.'''
+        col = cast(time_field.process(self), BigInteger)
+        day = 86400 * 1000000
+        if time_area == TimeArea.DAY:
+            return (col / literal_column(str(day)),
+                    lambda k: from_utimestamp(int(k) * day))
+        if time_area == TimeArea.WEEK:
+            # 1970-01-01 is Thursday, shift buckets to start on Monday
+            week = 7 * day
+            return ((col + literal_column(str(3 * day))) / literal_column(str(week)),
+                    lambda k: from_utimestamp(int(k) * week - 3 * day))
+        dt = self._sql_datetime(col / literal_column('1000000'))
+        key = cast(extract('year', dt) * literal_column('12') +
+                   extract('month', dt) - literal_column('1'), Integer)
+        return (key, lambda k: datetime(int(k) // 12, int(k) % 12 + 1, 1, tzinfo=utc))
+
+    def _sql_datetime(self, seconds):
+        '''Convert unix time SQL expression to UTC datetime SQL expression'''
+        dialect = self.sa_conn.dialect.name
+        if dialect == 'sqlite':
+            return func.datetime(seconds, literal_column("'unixepoch'"))
+        elif dialect == 'mysql':
+            return func.from_unixtime(seconds)
+        return func.timezone(literal_column("'UTC'"), func.to_timestamp(seconds))
 
     def _instantiate_expr(self, expr):
         if not isinstance(expr, type):
@@ -565,7 +855,7 @@ class Info(ModelSource):
     def ticket_fields(self):
         self._check_ts_ready()
         kwargs = self._form_kwargs()
-        return self.ts.get_ticket_fields(**kwargs)
+        return self.ts.get_ticket_field_set(**kwargs)
 
     def min_max(self, field, project_id=None, syllabus_id=None):
         self._check_ts_ready()
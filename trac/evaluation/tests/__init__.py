@@ -0,0 +1,16 @@
+import unittest
+
+from trac.evaluation.tests import cache, components, memo, model, sources
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(cache.suite())
+    suite.addTest(components.suite())
+    suite.addTest(memo.suite())
+    suite.addTest(model.suite())
+    suite.addTest(sources.suite())
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
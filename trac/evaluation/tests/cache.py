@@ -0,0 +1,147 @@
+import unittest
+
+from trac.cache import CacheManager
+from trac.evaluation.api import EvaluationValueCache
+from trac.project.api import ProjectManagement
+from trac.test import EnvironmentStub
+from trac.ticket.api import TicketSystem
+from trac.ticket.model import Milestone, Ticket
+from trac.util.datefmt import utc
+
+from datetime import datetime, timedelta
+
+
+class EvaluationValueCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub(enable=['trac.ticket.*', 'trac.timeline.*',
+                                           EvaluationValueCache])
+        # listeners of all syllabuses are called for a project
+        # without syllabus
+        self._patched = [
+            (ProjectManagement, 'get_project_syllabus', lambda pm, pid: None),
+            (TicketSystem, 'get_ticket_fields',
+             lambda ts, pid=None, syllabus_id=None: self._get_ticket_fields()),
+            (TicketSystem, 'reset_ticket_fields',
+             lambda ts, pid=None, syllabus_id=None: None),
+        ]
+        for cls, name, stub in self._patched:
+            setattr(cls, '_orig_' + name, cls.__dict__[name])
+            setattr(cls, name, stub)
+        db = self.env.get_db_cnx()
+        cursor = db.cursor()
+        cursor.executemany("INSERT INTO projects (id,name) VALUES (%s,%s)",
+                           [(1, 'p1'), (2, 'p2')])
+        db.commit()
+        self.cache = EvaluationValueCache(self.env)
+
+    def tearDown(self):
+        for cls, name, stub in self._patched:
+            setattr(cls, name, cls.__dict__['_orig_' + name])
+            delattr(cls, '_orig_' + name)
+        self.env.reset_db()
+
+    def _get_ticket_fields(self):
+        return dict((name, {'name': name, 'type': type_, 'label': name})
+                    for name, type_ in [('project_id', 'select'),
+                                        ('summary', 'text'),
+                                        ('status', 'radio'),
+                                        ('resolution', 'radio'),
+                                        ('time', 'time'),
+                                        ('changetime', 'time')])
+
+    def _set_values(self):
+        for pid in (1, 2):
+            self.cache.set(1, pid, 'key', pid * 10)
+
+    def _assert_invalidated(self, pid=1):
+        self.assertEqual(None, self.cache.get(1, pid, 'key'))
+        other = 3 - pid
+        self.assertEqual(other * 10, self.cache.get(1, other, 'key'))
+
+    def _insert_ticket(self, when=None):
+        ticket = Ticket(self.env, pid=1)
+        ticket['summary'] = 'Foo'
+        ticket['status'] = 'new'
+        ticket.insert(when=when)
+        return ticket
+
+    def test_cached(self):
+        self._set_values()
+        self.assertEqual(10, self.cache.get(1, 1, 'key'))
+        self.assertEqual(None, self.cache.get(2, 1, 'key'))
+        self.assertEqual('default', self.cache.get(1, 3, 'key', 'default'))
+
+    def test_disabled(self):
+        self.env.config.set('evaluation', 'value_cache', 'false')
+        self.assertFalse(self.cache.enabled)
+
+    def test_ticket_created(self):
+        self._set_values()
+        self._insert_ticket()
+        self._assert_invalidated()
+
+    def test_ticket_changed(self):
+        ticket = self._insert_ticket()
+        self._set_values()
+        ticket['status'] = 'closed'
+        ticket.save_changes('joe', 'Closed')
+        self._assert_invalidated()
+
+    def test_ticket_deleted(self):
+        ticket = self._insert_ticket()
+        self._set_values()
+        ticket.delete()
+        self._assert_invalidated()
+
+    def test_ticket_change_deleted(self):
+        now = datetime.now(utc)
+        ticket = self._insert_ticket(now - timedelta(days=1))
+        ticket['status'] = 'closed'
+        ticket['resolution'] = 'fixed'
+        ticket.save_changes('joe', 'Closed', now)
+        self._set_values()
+        ticket.delete_change(1)
+        self.assertEqual('new', Ticket(self.env, ticket.id)['status'])
+        self._assert_invalidated()
+
+    def test_milestone_changes(self):
+        self._set_values()
+        milestone = Milestone(self.env, pid=2)
+        milestone.name = 'm1'
+        milestone.insert()
+        self._assert_invalidated(2)
+        self._set_values()
+        milestone.due = datetime(2020, 1, 1, tzinfo=utc)
+        milestone.update()
+        self._assert_invalidated(2)
+        self._set_values()
+        milestone.delete()
+        self._assert_invalidated(2)
+
+    def test_invalidated_by_other_process(self):
+        self._set_values()
+        # as done by `invalidate` in another process
+        CacheManager(self.env).invalidate(self.cache._project_cache_id(1))
+        self._assert_invalidated()
+        self._set_values()
+        CacheManager(self.env).invalidate(self.cache._syllabus_cache_id(1))
+        self.assertEqual(None, self.cache.get(1, 1, 'key'))
+        self.assertEqual(None, self.cache.get(1, 2, 'key'))
+
+    def test_invalidate_syllabus(self):
+        self._set_values()
+        self.cache.set(2, 1, 'key', 1)
+        self.cache.invalidate_syllabus(1)
+        self.assertEqual(None, self.cache.get(1, 1, 'key'))
+        self.assertEqual(None, self.cache.get(1, 2, 'key'))
+        self.assertEqual(1, self.cache.get(2, 1, 'key'))
+        self.cache.invalidate_syllabus()
+        self.assertEqual(None, self.cache.get(2, 1, 'key'))
+
+
+def suite():
+    return unittest.makeSuite(EvaluationValueCacheTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,215 @@
+import unittest
+
+from trac.evaluation.api import EvalModelError
+from trac.evaluation.components import TicketStatistics
+from trac.test import EnvironmentStub, Mock
+from trac.ticket.api import TicketSystem
+from trac.util.datefmt import to_utimestamp, utc
+
+from datetime import datetime
+
+
+class ModelStub(object):
+    '''Ticket value is the length of its summary.'''
+
+    def __init__(self, pid, failing=False, callback=None):
+        self.pid = pid
+        self.failing = failing
+        self.callback = callback
+
+    def get_ticket_values(self, tickets):
+        if self.failing:
+            raise EvalModelError('Failing model of project %s' % self.pid)
+        if self.callback:
+            self.callback(tickets)
+        return [len(t['summary']) for t in tickets]
+
+
+class TicketStatisticsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.env.config.set('evaluation', 'ticket_updates', 'deferred')
+        TicketSystem(self.env).get_ticket_fields = \
+            lambda pid=None, syllabus_id=None: \
+                {'summary': {'name': 'summary', 'type': 'text'}}
+        self.ts = TicketStatistics(self.env)
+        # the worker must not process the queue during the tests
+        self.ts.QUEUE_DELAY = 60
+        self.failing = set()
+        self.callback = None
+        self.ts.em = Mock(get_model_by_project=lambda pid:
+                          ModelStub(pid, pid in self.failing, self.callback))
+        db = self.env.get_db_cnx()
+        cursor = db.cursor()
+        cursor.executemany('''
+            INSERT INTO ticket (id, project_id, summary) VALUES (%s,%s,%s)
+            ''', [(1, 1, 'a'), (2, 1, 'bb'), (3, 2, 'ccc'), (4, 2, 'dddd')])
+        db.commit()
+
+    def tearDown(self):
+        self.ts.shutdown()
+        self.env.reset_db()
+
+    def _queue(self):
+        cursor = self.env.get_read_db().cursor()
+        cursor.execute('''
+            SELECT ticket_id, project_id, time, claimed_by
+            FROM ticket_evaluation_queue ORDER BY ticket_id
+            ''')
+        return cursor.fetchall()
+
+    def _values(self):
+        cursor = self.env.get_read_db().cursor()
+        cursor.execute('''
+            SELECT ticket_id, value FROM ticket_evaluation ORDER BY ticket_id
+            ''')
+        return cursor.fetchall()
+
+    def _enqueue(self, rows):
+        db = self.env.get_db_cnx()
+        cursor = db.cursor()
+        cursor.executemany('''
+            INSERT INTO ticket_evaluation_queue
+                (ticket_id, project_id, time, claimed_by, claim_time)
+            VALUES (%s,%s,%s,%s,%s)
+            ''', rows)
+        db.commit()
+
+    def test_enqueue(self):
+        self.ts.enqueue([(1, 1), (3, 2)])
+        queue = self._queue()
+        self.assertEqual([(1, 1, None), (3, 2, None)],
+                         [(r[0], r[1], r[3]) for r in queue])
+
+    def test_enqueue_coalesced(self):
+        self._enqueue([(1, 1, 10, None, None), (2, 1, 10, None, None)])
+        self.ts.enqueue([(1, 1)])
+        self.ts.enqueue([(1, 1)])
+        queue = self._queue()
+        self.assertEqual([1, 2], [r[0] for r in queue])
+        self.assertTrue(queue[0][2] > 10)
+        self.assertEqual(10, queue[1][2])
+
+    def test_worker_started_by_enqueue(self):
+        self.assertEqual(None, self.ts._worker)
+        self.ts.enqueue([])
+        self.assertEqual(None, self.ts._worker)
+        self.ts.enqueue([(1, 1)])
+        worker = self.ts._worker
+        self.assertTrue(worker.is_alive())
+        self.ts.enqueue([(2, 1)])
+        self.assertTrue(worker is self.ts._worker)
+        self.ts.shutdown()
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(None, self.ts._worker)
+        # no worker started after shutdown, the tickets stay queued
+        self.ts.enqueue([(3, 2)])
+        self.assertEqual(None, self.ts._worker)
+        self.assertEqual([1, 2, 3], [r[0] for r in self._queue()])
+
+    def test_worker_started_by_request(self):
+        # tickets left queued by a stopped process
+        self._enqueue([(1, 1, 10, None, None)])
+        handler = object()
+        self.assertTrue(handler is self.ts.pre_process_request(None, handler))
+        worker = self.ts._worker
+        self.assertTrue(worker.is_alive())
+        self.assertTrue(self.ts._wakeup.is_set())
+        self.ts.pre_process_request(None, handler)
+        self.assertTrue(worker is self.ts._worker)
+        self.ts.shutdown()
+        self.ts.pre_process_request(None, handler)
+        self.assertEqual(None, self.ts._worker)
+
+    def test_worker_not_started_if_immediate(self):
+        self.env.config.set('evaluation', 'ticket_updates', 'immediate')
+        self.ts.pre_process_request(None, None)
+        self.assertEqual(None, self.ts._worker)
+
+    def test_created_ticket_row(self):
+        self.ts.ticket_created(Mock(id=1, pid=1))
+        self.assertEqual([(1, 0)], self._values())
+        self.assertEqual([1], [r[0] for r in self._queue()])
+
+    def test_process_queue(self):
+        self.ts.enqueue([(1, 1), (3, 2), (4, 2)])
+        self.assertEqual(3, self.ts.process_queue())
+        self.assertEqual([], self._queue())
+        self.assertEqual([(1, 1), (3, 3), (4, 4)], self._values())
+        self.assertEqual(0, self.ts.process_queue())
+
+    def test_process_queue_batches(self):
+        self.ts.UPDATE_CHUNK_SIZE = 1
+        self.ts.update_ticket_values([(2, 0)])
+        self.ts.enqueue([(1, 1), (2, 1), (3, 2), (4, 2)])
+        self.assertEqual(4, self.ts.process_queue())
+        self.assertEqual([], self._queue())
+        self.assertEqual([(1, 1), (2, 2), (3, 3), (4, 4)], self._values())
+
+    def test_failing_project(self):
+        self.failing.add(2)
+        self.ts.enqueue([(1, 1), (3, 2), (4, 2)])
+        self.assertEqual(1, self.ts.process_queue())
+        self.assertEqual([(1, 1)], self._values())
+        # tickets of the project are released for the next run
+        self.assertEqual([(3, 2, None), (4, 2, None)],
+                         [(r[0], r[1], r[3]) for r in self._queue()])
+        self.failing.clear()
+        self.assertEqual(2, self.ts.process_queue())
+        self.assertEqual([], self._queue())
+
+    def test_queued_during_update(self):
+        def change_ticket(tickets):
+            # the ticket is changed while its value is computed
+            self.callback = None
+            self.ts.enqueue([(1, 1)])
+            cursor = self.env.get_db_cnx().cursor()
+            cursor.execute('''
+                UPDATE ticket_evaluation_queue SET time=time+1
+                WHERE ticket_id=1
+                ''')
+        self.callback = change_ticket
+        self._enqueue([(1, 1, 10, None, None), (2, 1, 10, None, None)])
+        self.assertEqual(1, self.ts.process_queue())
+        self.assertEqual([(2, 2)], self._values())
+        self.assertEqual([(1, 1, None)],
+                         [(r[0], r[1], r[3]) for r in self._queue()])
+        self.assertEqual(1, self.ts.process_queue())
+        self.assertEqual([(1, 1), (2, 2)], self._values())
+
+    def test_claimed_by_other_worker(self):
+        now = to_utimestamp(datetime.now(utc))
+        expired = now - (self.ts.CLAIM_TIMEOUT + 1) * 1000000
+        self._enqueue([(1, 1, 10, 'other:1', now),
+                       (2, 1, 10, 'other:2', expired),
+                       (3, 2, 10, None, None)])
+        self.assertEqual(2, self.ts.process_queue())
+        self.assertEqual([(2, 2), (3, 3)], self._values())
+        self.assertEqual([(1, 1, 10, 'other:1')], self._queue())
+
+    def test_update_project_tickets(self):
+        self.ts.UPDATE_CHUNK_SIZE = 1
+        self.ts.update_ticket_values([(2, 0), (3, 0)])
+        progress = []
+        self.assertEqual(2, self.ts.update_project_tickets(
+                    1, lambda pid, count: progress.append((pid, count))))
+        # the missing row of ticket 1 is inserted
+        self.assertEqual([(1, 1), (2, 2), (3, 0)], self._values())
+        self.assertEqual([(1, 1), (1, 2)], progress)
+        self.assertEqual(0, self.ts.update_project_tickets(
+                    3, lambda pid, count: progress.append((pid, count))))
+        self.assertEqual([(1, 1), (1, 2)], progress)
+
+    def test_update_ticket_values(self):
+        self.ts.update_ticket_values([(1, 5)])
+        self.ts.update_ticket_values([(1, 6), (2, 7)])
+        self.ts.update_ticket_values([])
+        self.assertEqual([(1, 6), (2, 7)], self._values())
+
+
+def suite():
+    return unittest.makeSuite(TicketStatisticsTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,192 @@
+import unittest
+
+from trac.evaluation.api import EvalModelError, EvalVariableError, \
+                                EvaluationModel, EvaluationPass, \
+                                SubjectArea, evaluation_pass, \
+                                get_evaluation_pass, make_key
+from trac.evaluation.api.model import ModelVariable
+
+
+class MemoModel(EvaluationModel):
+    '''Stub model counting evaluations of its variables.'''
+
+    def __init__(self, syllabus_id):
+        EvaluationModel.__init__(self, syllabus_id)
+        self.calls = {}
+
+    def count(self, alias):
+        self.calls[alias] = self.calls.get(alias, 0) + 1
+
+
+class CountedVariable(ModelVariable):
+    subject_support = (SubjectArea.PROJECT,)
+
+    def _get(self):
+        self.model.count(self.alias)
+        return self._get_counted()
+
+
+class Base(CountedVariable):
+    model_cls = MemoModel
+    alias = 'base'
+
+    def _get_counted(self):
+        return self['project_id'] * 10
+
+
+class Double(CountedVariable):
+    model_cls = MemoModel
+    alias = 'double'
+
+    def _get_counted(self):
+        base = self.model.vars['base']
+        self > base
+        return base.get() * 2
+
+
+class Sum(CountedVariable):
+    model_cls = MemoModel
+    alias = 'sum'
+
+    def _get_counted(self):
+        base = self.model.vars['base']
+        double = self.model.vars['double']
+        self > base
+        self > double
+        return base.get() + double.get()
+
+
+class Failing(CountedVariable):
+    model_cls = MemoModel
+    alias = 'failing'
+
+    def _get_counted(self):
+        raise EvalModelError('Failing variable')
+
+
+class UsingFailing(CountedVariable):
+    model_cls = MemoModel
+    alias = 'using_failing'
+
+    def _get_counted(self):
+        failing = self.model.vars['failing']
+        self > failing
+        return failing.get()
+
+
+class LoopA(CountedVariable):
+    model_cls = MemoModel
+    alias = 'loop_a'
+
+    def _get_counted(self):
+        var = self.model.vars['loop_b']
+        self > var
+        return var.get()
+
+
+class LoopB(CountedVariable):
+    model_cls = MemoModel
+    alias = 'loop_b'
+
+    def _get_counted(self):
+        var = self.model.vars['loop_a']
+        self > var
+        return var.get()
+
+
+class EvaluationPassTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = MemoModel(1)
+
+    def _get(self, alias, project=1):
+        return self.model.vars[alias].project(project).get()
+
+    def test_hits(self):
+        with evaluation_pass() as memo:
+            self.assertEqual(30, self._get('sum'))
+            self.assertEqual(20, self._get('double'))
+            self.assertEqual(10, self._get('base'))
+            self.assertEqual(60, self._get('sum', 2))
+        # shared sub-variables are computed once per subject
+        self.assertEqual({'base': 2, 'double': 2, 'sum': 2},
+                         self.model.calls)
+        self.assertEqual([('base', 3, 2, []),
+                          ('double', 1, 2, ['base']),
+                          ('sum', 0, 2, ['base', 'double'])],
+                         memo.get_stats())
+        self.assertEqual(4 / 10.0, memo.get_hit_rate())
+
+    def test_pass_per_get(self):
+        self.assertEqual(None, get_evaluation_pass())
+        self.assertEqual(30, self._get('sum'))
+        self.assertEqual(30, self._get('sum'))
+        self.assertEqual(None, get_evaluation_pass())
+        self.assertEqual({'base': 2, 'double': 2, 'sum': 2},
+                         self.model.calls)
+
+    def test_nested_pass(self):
+        memo = EvaluationPass()
+        with evaluation_pass(memo):
+            with evaluation_pass() as inner:
+                self.assertTrue(inner is memo)
+                self._get('base')
+            self.assertTrue(get_evaluation_pass() is memo)
+            self._get('base')
+        self.assertEqual(None, get_evaluation_pass())
+        self.assertEqual({'base': 1}, self.model.calls)
+
+    def test_error_memoized(self):
+        with evaluation_pass() as memo:
+            self.assertRaises(EvalModelError, self._get, 'failing')
+            self.assertRaises(EvalModelError, self._get, 'using_failing')
+            self.assertRaises(EvalModelError, self._get, 'using_failing')
+        self.assertEqual({'failing': 1, 'using_failing': 1},
+                         self.model.calls)
+        self.assertEqual([('failing', 1, 1, []),
+                          ('using_failing', 1, 1, ['failing'])],
+                         memo.get_stats())
+
+    def test_error_not_memoized(self):
+        memo = EvaluationPass()
+        def compute():
+            raise ValueError('Not a model error')
+        key = make_key(1, 'var', {'area': 1})
+        self.assertRaises(ValueError, memo.get, key, compute)
+        self.assertEqual((False, None), memo.lookup(key))
+        self.assertEqual(1, memo.get(key, lambda: 1))
+        self.assertEqual((True, 1), memo.lookup(key))
+
+    def test_circular_dependency(self):
+        with evaluation_pass():
+            self.assertRaises(EvalVariableError, self._get, 'loop_a')
+            self.assertRaises(EvalVariableError, self._get, 'loop_b')
+        self.assertEqual({'loop_a': 1, 'loop_b': 1}, self.model.calls)
+
+    def test_same_variable_other_state(self):
+        memo = EvaluationPass()
+        key1 = make_key(1, 'var', {'area': 1, 'project_id': 1})
+        key2 = make_key(1, 'var', {'area': 1, 'project_id': 2})
+        def compute():
+            return memo.get(key2, lambda: 2) + 1
+        self.assertEqual(3, memo.get(key1, compute))
+        memo = EvaluationPass()
+        def compute_loop():
+            return memo.get(key1, compute_loop)
+        self.assertRaises(EvalVariableError, memo.get, key1, compute_loop)
+
+    def test_make_key(self):
+        self.assertEqual(make_key(1, 'var', {'area': 1, 'subjects': [1, 2],
+                                             'groupby': {'a': 1, 'b': [2]}}),
+                         make_key(1, 'var', {'groupby': {'b': (2,), 'a': 1},
+                                             'area': 1}))
+        self.assertNotEqual(make_key(1, 'var', {'area': 1}),
+                            make_key(2, 'var', {'area': 1}))
+        self.assertEqual(None, make_key(1, 'var', {'area': set([1])}))
+
+
+def suite():
+    return unittest.makeSuite(EvaluationPassTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,214 @@
+import unittest
+
+from sqlalchemy import create_engine
+
+import trac.evaluation.api
+from trac.db_sqlalchemy import metadata
+from trac.evaluation.api import EvaluationManagement, EvaluationModel, \
+                                SubjectArea, ClusterArea, UnityScale, varlib
+from trac.evaluation.sources import tktsrc
+import trac.evaluation.sources.ticket as ticket_source
+from trac.test import EnvironmentStub
+
+
+class SourceEnvironmentStub(EnvironmentStub):
+    '''Environment stub querying ticket evaluation sources
+    from an in-memory SQLite database.'''
+
+    def __init__(self, **kwargs):
+        EnvironmentStub.__init__(self, **kwargs)
+        # the connection is shared by the evaluation threads
+        self.engine = create_engine('sqlite://', connect_args={
+                                        'check_same_thread': False})
+        self.sa_conn = self.engine.connect()
+        for name in ('ticket', 'ticket_custom', 'ticket_evaluation',
+                     'developer_projects', 'project_info'):
+            metadata.tables[name].create(self.engine)
+
+    def get_sa_metadata(self):
+        return metadata
+
+    def get_sa_connection(self, **kwargs):
+        return self.sa_conn
+
+
+class InfoStub(object):
+
+    def __init__(self, model):
+        pass
+
+    def reset(self):
+        return self
+
+    def project(self, pid):
+        return self
+
+    def ticket_fields(self):
+        return dict((name, {'name': name, 'type': 'text'})
+                    for name in ('owner', 'status', 'resolution', 'milestone',
+                                 'reporter', 'time', 'changetime'))
+
+
+class ProjectManagementStub(object):
+
+    users = {1: ['alice', 'bob'], 2: ['carol']}
+
+    def __init__(self, env):
+        pass
+
+    def get_project_users(self, pid, role=None):
+        return self.users.get(pid, [])
+
+
+class Model(EvaluationModel):
+    pass
+
+
+class ClosedTickets(varlib.CountTickets):
+    model_cls = Model
+    alias = 'closed'
+    subject_support = (SubjectArea.USER, SubjectArea.PROJECT)
+    cluster_support = (ClusterArea.NONE, ClusterArea.MILESTONE)
+    filter_tickets = (tktsrc.Status() == 'closed')
+
+
+class AllTickets(varlib.CountTickets):
+    model_cls = Model
+    alias = 'all'
+    subject_support = (SubjectArea.USER, SubjectArea.PROJECT)
+    cluster_support = (ClusterArea.NONE, ClusterArea.MILESTONE)
+
+
+class ClosedRatio(varlib.TwoVarsRatio):
+    model_cls = Model
+    alias = 'closed_ratio'
+    scale = UnityScale()
+    subject_support = (SubjectArea.USER, SubjectArea.PROJECT)
+    var1 = 'closed'
+    var2 = 'all'
+
+
+class OwnQueryTickets(varlib.CountTickets):
+    '''Overrides `_get` only: must not be evaluated by the batch query
+    of `CountTickets`.'''
+    model_cls = Model
+    alias = 'own_query'
+    subject_support = (SubjectArea.USER, SubjectArea.PROJECT)
+
+    def _get(self):
+        return self._prepare_query().count() * 10
+
+
+class BatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = SourceEnvironmentStub()
+        self.env.config.set('evaluation', 'value_cache', 'false')
+        self._info = ticket_source.Info
+        self._pm = ticket_source.ProjectManagement
+        ticket_source.Info = InfoStub
+        ticket_source.ProjectManagement = ProjectManagementStub
+        self.model = Model(1)
+        self.model.env = self.env
+        owners = ['alice', 'bob', 'carol', 'dave']
+        self.env.sa_conn.execute(metadata.tables['ticket'].insert(), [
+            dict(id=i, project_id=1 + i % 2, owner=owners[(i // 2) % 4],
+                 status=i % 3 and 'closed' or 'new',
+                 milestone='m%d' % (i % 2))
+            for i in range(1, 25)])
+        self.env.sa_conn.execute(
+            metadata.tables['developer_projects'].insert(),
+            [dict(username=username, project_id=pid)
+             for pid, users in ProjectManagementStub.users.iteritems()
+             for username in users])
+
+    def tearDown(self):
+        EvaluationManagement(self.env).shutdown()
+        ticket_source.Info = self._info
+        ticket_source.ProjectManagement = self._pm
+        self.env.sa_conn.close()
+
+    def _get(self, alias, project, user=None, milestone=None):
+        var = self.model.vars[alias].project(project)
+        if user:
+            var.user(user)
+        if milestone:
+            var.milestone(milestone)
+        return var.get()
+
+    def _assert_batch_equal(self, alias, milestone=None):
+        var = self.model.vars[alias]
+        if milestone:
+            var.milestone(milestone)
+        projects = [1, 2, 3]
+        self.assertEqual([self._get(alias, p, milestone=milestone)
+                          for p in projects],
+                         var.batch(projects=projects).values())
+        users = ['alice', 'bob', 'carol', 'nobody']
+        var.project(1)
+        self.assertEqual([self._get(alias, 1, u, milestone) for u in users],
+                         var.batch(users=users).values())
+
+    def test_count_tickets(self):
+        self._assert_batch_equal('closed')
+        self._assert_batch_equal('all')
+
+    def test_count_tickets_milestone(self):
+        self._assert_batch_equal('closed', milestone='m1')
+
+    def test_two_vars_ratio(self):
+        self._assert_batch_equal('closed_ratio')
+
+    def test_overridden_get(self):
+        var = self.model.vars['own_query']
+        self.assertFalse(var.supports_batch())
+        self.assertTrue(self.model.vars['closed'].supports_batch())
+        self._assert_batch_equal('own_query')
+
+    def test_single_subject(self):
+        var = self.model.vars['closed']
+        self.assertEqual({1: self._get('closed', 1)},
+                         dict(var.batch(projects=[1])))
+
+    def test_users_without_project(self):
+        var = self.model.vars['closed']
+        self.assertRaises(trac.evaluation.api.EvalVariableError,
+                          var.batch, users=['alice'])
+        self.assertEqual(['alice'],
+                         var.batch(users=['alice'], catch_errors=True).keys())
+
+    def test_threads(self):
+        em = EvaluationManagement(self.env)
+        variables = [self.model.vars[alias] for alias
+                     in ('closed', 'all', 'closed_ratio', 'own_query')]
+        for var in variables:
+            var.project(1)
+        for kwargs in (dict(projects=[1, 2, 3]),
+                       dict(users=['alice', 'bob', 'carol', 'nobody'],
+                            catch_errors=True)):
+            self.env.config.set('evaluation', 'threads', '1')
+            expected = em.batch(variables, **kwargs)
+            self.env.config.set('evaluation', 'threads', '3')
+            values = em.batch(variables, **kwargs)
+            self.assertNotEqual(None, em._pool)
+            self.assertEqual(variables, values.keys())
+            for var in variables:
+                self.assertEqual(expected[var].items(), values[var].items())
+
+    def test_shutdown(self):
+        em = EvaluationManagement(self.env)
+        self.env.config.set('evaluation', 'threads', '2')
+        pool = em._get_pool()
+        em.shutdown()
+        self.assertEqual(None, em._pool)
+        self.assertFalse([w for w in pool._pool if w.is_alive()])
+        # a new pool is started on the next use
+        self.assertNotEqual(pool, em._get_pool())
+
+
+
+def suite():
+    return unittest.makeSuite(BatchTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,270 @@
+import unittest
+from collections import OrderedDict
+from datetime import datetime
+
+from trac.db_sqlalchemy import metadata
+from trac.evaluation.api import EvalSourceError, SubjectArea, TimeArea
+from trac.evaluation.sources import tktsrc
+import trac.evaluation.sources.ticket as ticket_source
+from trac.evaluation.tests.model import InfoStub, Model, \
+                                        ProjectManagementStub, \
+                                        SourceEnvironmentStub
+from trac.util.datefmt import utc
+
+
+def dt(*args):
+    return datetime(*args, **{'tzinfo': utc})
+
+
+class TicketQueryTestCase(unittest.TestCase):
+    '''Base class of tests querying the ticket evaluation source.'''
+
+    def setUp(self):
+        self.env = SourceEnvironmentStub()
+        self._info = ticket_source.Info
+        self._pm = ticket_source.ProjectManagement
+        ticket_source.Info = InfoStub
+        ticket_source.ProjectManagement = ProjectManagementStub
+        self.model = Model(1)
+        self.model.env = self.env
+
+    def tearDown(self):
+        ticket_source.Info = self._info
+        ticket_source.ProjectManagement = self._pm
+        self.env.sa_conn.close()
+
+    def _insert_tickets(self, tickets):
+        self.env.sa_conn.execute(metadata.tables['ticket'].insert(), [
+            dict(id=i, **values) for i, values in enumerate(tickets, 1)])
+
+    def _query(self, project=1):
+        return self.model.sources['ticket'].project(project)
+
+
+class GroupByTestCase(TicketQueryTestCase):
+
+    def setUp(self):
+        TicketQueryTestCase.setUp(self)
+        # 2011-01-31 is Monday
+        self._insert_tickets([
+            dict(project_id=1, owner='alice', time=dt(2011, 1, 30, 23)),
+            dict(project_id=1, owner='alice', time=dt(2011, 1, 31, 1)),
+            dict(project_id=1, owner='bob', time=dt(2011, 1, 31, 12)),
+            dict(project_id=1, owner='bob', time=dt(2011, 2, 1, 0, 30)),
+            dict(project_id=1, owner='alice', time=dt(2011, 2, 1, 10)),
+            dict(project_id=2, owner='alice', time=dt(2011, 2, 1, 10)),
+        ])
+
+    def _count(self, **kwargs):
+        return self._query().group_by(**kwargs).count()
+
+    def test_day(self):
+        self.assertEqual(OrderedDict([(dt(2011, 1, 30), 1),
+                                      (dt(2011, 1, 31), 2),
+                                      (dt(2011, 2, 1), 2)]),
+                         self._count(time=TimeArea.DAY))
+
+    def test_week(self):
+        self.assertEqual(OrderedDict([(dt(2011, 1, 24), 1),
+                                      (dt(2011, 1, 31), 4)]),
+                         self._count(time=TimeArea.WEEK))
+
+    def test_month(self):
+        self.assertEqual(OrderedDict([(dt(2011, 1, 1), 3),
+                                      (dt(2011, 2, 1), 2)]),
+                         self._count(time=TimeArea.MONTH))
+
+    def test_subject(self):
+        self.assertEqual(OrderedDict([('alice', 3), ('bob', 2)]),
+                         self._count(subj=SubjectArea.USER))
+
+    def test_time_first(self):
+        self.assertEqual(OrderedDict([
+                (dt(2011, 1, 30), OrderedDict([('alice', 1)])),
+                (dt(2011, 1, 31), OrderedDict([('alice', 1), ('bob', 1)])),
+                (dt(2011, 2, 1), OrderedDict([('alice', 1), ('bob', 1)]))]),
+            self._count(time=TimeArea.DAY, subj=SubjectArea.USER))
+        self.assertEqual(OrderedDict([
+                (dt(2011, 1, 24), OrderedDict([('alice', 1)])),
+                (dt(2011, 1, 31), OrderedDict([('alice', 2), ('bob', 2)]))]),
+            self._count(time=TimeArea.WEEK, subj=SubjectArea.USER,
+                        first_by='time'))
+
+    def test_subject_first(self):
+        self.assertEqual(OrderedDict([
+                ('alice', OrderedDict([(dt(2011, 1, 1), 2),
+                                       (dt(2011, 2, 1), 1)])),
+                ('bob', OrderedDict([(dt(2011, 1, 1), 1),
+                                     (dt(2011, 2, 1), 1)]))]),
+            self._count(time=TimeArea.MONTH, subj=SubjectArea.USER,
+                        first_by='subj'))
+
+    def test_change_time(self):
+        self.env.sa_conn.execute(metadata.tables['ticket'].update().
+                                 values(changetime=dt(2011, 3, 5)))
+        self.assertEqual(OrderedDict([(dt(2011, 3, 1), 5)]),
+                         self._count(time=TimeArea.MONTH,
+                                     time_field=tktsrc.ChangeTime()))
+
+    def test_filtered(self):
+        query = self._query().where(tktsrc.Owner() == 'bob')
+        self.assertEqual(OrderedDict([(dt(2011, 1, 31), 1),
+                                      (dt(2011, 2, 1), 1)]),
+                         query.group_by(time=TimeArea.DAY).count())
+
+    def test_batch_users(self):
+        query = self._query().users(['alice', 'bob', 'carol'])
+        self.assertEqual(OrderedDict([
+                ('alice', OrderedDict([(dt(2011, 1, 1), 2),
+                                       (dt(2011, 2, 1), 1)])),
+                ('bob', OrderedDict([(dt(2011, 1, 1), 1),
+                                     (dt(2011, 2, 1), 1)])),
+                ('carol', OrderedDict())]),
+            query.group_by(time=TimeArea.MONTH).count())
+
+    def test_batch_projects(self):
+        query = self.model.sources['ticket'].projects([1, 2])
+        self.assertEqual(OrderedDict([
+                (1, OrderedDict([(dt(2011, 1, 24), 1),
+                                 (dt(2011, 1, 31), 4)])),
+                (2, OrderedDict([(dt(2011, 1, 31), 1)]))]),
+            query.group_by(time=TimeArea.WEEK).count())
+
+    def test_unsupported(self):
+        query = self._query()
+        self.assertRaises(EvalSourceError,
+                          query.group_by, time='year')
+        self.assertRaises(EvalSourceError,
+                          query.group_by, subj=SubjectArea.GROUP)
+        query.group_by()
+        self.assertEqual(5, query.count())
+
+
+class StatementCacheTestCase(TicketQueryTestCase):
+
+    def setUp(self):
+        TicketQueryTestCase.setUp(self)
+        owners = ['alice', 'bob', 'carol', 'dave', None]
+        self._insert_tickets([
+            dict(project_id=1 + i % 2, owner=owners[i % 5],
+                 status=i % 3 and 'closed' or 'new',
+                 milestone='m%d' % (i % 4 // 2), time=dt(2011, 1, 1 + i))
+            for i in range(20)])
+        self.env.sa_conn.execute(
+            metadata.tables['developer_projects'].insert(),
+            [dict(username=username, project_id=pid)
+             for pid, users in ProjectManagementStub.users.iteritems()
+             for username in users])
+
+    def _statements(self):
+        return self.model.source_cache.get('ticket_statements', {})
+
+    def _assert_uncached(self, prepare, *subjects):
+        '''Check that queries prepared by `prepare(query, subject)`
+        return the same results as with a new statement cache.'''
+        results = []
+        for subj in subjects:
+            result = prepare(self.model.sources['ticket'], subj)
+            model = Model(1)
+            model.env = self.env
+            self.assertEqual(prepare(model.sources['ticket'], subj), result)
+            results.append(result)
+        return results
+
+    def test_project(self):
+        count = lambda q, pid: q.project(pid).where(
+                    tktsrc.Status() == 'closed').count()
+        self.assertEqual([6, 7, 0], self._assert_uncached(count, 1, 2, 3))
+        self.assertEqual(1, len(self._statements()))
+
+    def test_user(self):
+        count = lambda q, user: q.project(1).user(user).count()
+        self.assertEqual([2, 2, 0], self._assert_uncached(count, 'alice',
+                                                          'bob', 'eve'))
+        self.assertEqual(1, len(self._statements()))
+
+    def test_milestone(self):
+        count = lambda q, name: q.project(1).milestone(name).count()
+        self.assertEqual([5, 5, 0], self._assert_uncached(count, 'm0', 'm1',
+                                                          'm2'))
+        self.assertEqual(1, len(self._statements()))
+
+    def test_literals(self):
+        count = lambda q, status: q.project(1).where(
+                    tktsrc.Status() == status).count()
+        self.assertEqual([4, 6], self._assert_uncached(count, 'new',
+                                                       'closed'))
+        self.assertEqual(2, len(self._statements()))
+        count = lambda q, owners: q.project(1).where(
+                    tktsrc.Owner().in_(owners)).count()
+        self.assertEqual([2, 4, 2],
+                         self._assert_uncached(count, ['alice'],
+                                               ['alice', 'carol'], ['carol']))
+        self.assertEqual(5, len(self._statements()))
+
+    def test_operators(self):
+        count = lambda q, expr: q.project(1).where(expr).count()
+        status = tktsrc.Status()
+        self.assertEqual([4, 6, 0],
+                         self._assert_uncached(count, status == 'new',
+                                               status != 'new',
+                                               (status == 'new') &
+                                               (status != 'new')))
+        self.assertEqual(3, len(self._statements()))
+
+    def test_subjects(self):
+        count = lambda q, pids: q.projects(pids).count()
+        self.assertEqual([{1: 10, 2: 10}, {1: 10, 2: 10, 3: 0},
+                          {2: 10, 1: 10}],
+                         self._assert_uncached(count, [1, 2], [1, 2, 3],
+                                               [2, 1]))
+        self.assertEqual(2, len(self._statements()))
+        count = lambda q, users: q.project(1).users(users).count()
+        self.assertEqual([{'alice': 2, 'carol': 2}, {'alice': 2, 'eve': 0}],
+                         self._assert_uncached(count, ['alice', 'carol'],
+                                               ['alice', 'eve']))
+        self.assertEqual(3, len(self._statements()))
+
+    def test_project_users(self):
+        count = lambda q, (pid, allow_empty): q.project(pid). \
+                    limit_to_project_users(tktsrc.Owner(),
+                                           allow_empty=allow_empty).count()
+        self.assertEqual([4, 6, 2, 4],
+                         self._assert_uncached(count, (1, False), (1, True),
+                                               (2, False), (2, True)))
+        self.assertEqual(2, len(self._statements()))
+        count = lambda q, role: q.project(1). \
+                    limit_to_project_users(tktsrc.Owner(), role=role).count()
+        self._assert_uncached(count, None, 1, 2)
+        self.assertEqual(4, len(self._statements()))
+
+    def test_columns(self):
+        rows = lambda q, col: sorted(q.project(2).where(
+                    tktsrc.Owner() == 'dave').only(col).get())
+        self.assertEqual([['dave', 'dave'], ['closed', 'new']],
+                         self._assert_uncached(rows, tktsrc.Owner(),
+                                               tktsrc.Status()))
+        self.assertEqual(2, len(self._statements()))
+
+    def test_cache_size(self):
+        count = lambda q, status: q.project(1).where(
+                    tktsrc.Status() == status).count()
+        size = ticket_source.Query.statement_cache_size
+        ticket_source.Query.statement_cache_size = 2
+        try:
+            self.assertEqual([4, 6, 0, 4],
+                             self._assert_uncached(count, 'new', 'closed',
+                                                   'other', 'new'))
+        finally:
+            ticket_source.Query.statement_cache_size = size
+        self.assertEqual(2, len(self._statements()))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(GroupByTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(StatementCacheTestCase, 'test'))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -1,5 +1,4 @@
 import pkg_resources
-from collections import OrderedDict
 
 from trac.util.translation import _
 from trac.util.text import exception_to_unicode
@@ -9,11 +8,13 @@ from genshi.builder import tag
 from trac.core import Component, implements, TracError
 from trac.web.api import IRequestHandler
 from trac.project.api import ProjectManagement
+from trac.user.api import UserManagement
 from trac.web.chrome import ITemplateProvider, INavigationContributor, add_warning, add_package
 from trac.perm import IPermissionRequestor
 
 from trac.evaluation.api import EvaluationManagement
 from trac.evaluation.api.model import EvalModelError
+from trac.evaluation.api.memo import EvaluationPass, evaluation_pass
 
 from trac.evaluation.project import ProjectEvaluation
 
@@ -91,6 +92,7 @@ class EvaluationStatsModule(Component):
         all_vars = sorted(all_vars, key=lambda v: v.label)
         var = None
         var_value = None
+        memo = EvaluationPass()
 
         if not do_not_process and var_name:
             if var_project is None:
@@ -114,7 +116,8 @@ class EvaluationStatsModule(Component):
             # try to get var value here to prevent
             # unhandled exception in template
             try:
-                var_value = var.get()
+                with evaluation_pass(memo):
+                    var_value = var.get()
             except EvalModelError, e:
                 add_warning(req, exception_to_unicode(e))
 
@@ -126,6 +129,8 @@ class EvaluationStatsModule(Component):
             'var_milestone': var_milestone,
             'var': var,
             'var_value': var_value,
+            'memo_stats': memo.get_stats(),
+            'memo_hit_rate': memo.get_hit_rate(),
         }
 
         return 'show_var.html', data, None
@@ -139,21 +144,17 @@ class EvaluationStatsModule(Component):
         model = self.evmanager.get_model(syllabus_id)
         user_vars = model.get_individual_rating_vars()
 
-        ivalues = OrderedDict()
+        # evaluate the whole variables x users table at once: variables
+        # supporting batch evaluation need one query for all users
         for var in user_vars:
-            uvalues = OrderedDict()
             var.project(project_id)
-            for user in users:
-                try:
-                    var.user(user)
-                    var_value = var.get()
-                except EvalModelError, e:
-                    var_value = e.message
-                uvalues[user] = var_value
-            ivalues[var] = uvalues
+        ivalues = self.evmanager.batch(user_vars, users=users,
+                                       catch_errors=True)
 
         if req.authname in users:
             data['current_user'] = req.authname
+        # prefetch fullnames shown in template
+        UserManagement(self.env).get_user_fullnames(users, req)
 
         data.update({
             'users': users,
@@ -991,7 +991,10 @@ class Mimeview(Component):
     def send_converted(self, req, in_type, content, selector, filename='file'):
         """Helper method for converting `content` and sending it directly.
 
-        `selector` can be either a key or a MIME Type."""
+        `selector` can be either a key or a MIME Type.
+        
+        The converted content can also be an iterable of `str` strings,
+        which is streamed to the client as it is produced."""
         from trac.web.api import RequestDone
         content, output_type, ext = self.convert_content(req, in_type,
                                                          content, selector)
@@ -999,7 +1002,8 @@ class Mimeview(Component):
             content = content.encode('utf-8')
         req.send_response(200)
         req.send_header('Content-Type', output_type)
-        req.send_header('Content-Length', len(content))
+        if isinstance(content, str):
+            req.send_header('Content-Length', len(content))
         if filename:
             req.send_header('Content-Disposition',
                             content_disposition(filename='%s.%s' % 
@@ -19,6 +19,7 @@
 from time import time
 
 from trac.admin import AdminCommandError, IAdminCommandProvider
+from trac.cache import CacheManager
 from trac.config import ExtensionOption, OrderedExtensionsOption
 from trac.core import *
 from trac.resource import Resource, get_resource_name
@@ -159,6 +160,17 @@ class IPermissionPolicy(Interface):
         this will probably change in the future (e.g. `'VIEW' in ...`).
         """
 
+    # Policies may also provide an optional batch method:
+    #
+    #   def check_permissions(action, username, resources, perm, req=None):
+    #       """Check the action for each resource of the `resources` list
+    #       at once and return the list of decisions (`True`, `False` or
+    #       `None`) in the same order."""
+    #
+    # It is used by `PermissionCache.filter` instead of calling
+    # `check_permission` for every resource of a list view. Policies
+    # without it are asked for every resource separately.
+
 
 class DefaultPermissionStore(Component):
     """Default implementation of permission storage and group management.
@@ -170,6 +182,12 @@ class DefaultPermissionStore(Component):
 
     group_providers = ExtensionPoint(IPermissionGroupProvider)
 
+    def __init__(self):
+        # (generation, {level: {subject: set(targets)}},
+        #  {level: {target: set(subjects)}}, {(levels, subject): actions})
+        # where level is 'g', ('s', syllabus_id) or ('p', project_id)
+        self._closure_cache = (None, {}, {}, {})
+
     def get_user_permissions(self, username, project_id=None, syllabus_id=None, inherit=True):
         """Return the permissions of the specified user.
         See `IPermissionStore.get_user_permissions`."""
@@ -179,50 +197,42 @@ class DefaultPermissionStore(Component):
 
         levels = self._get_perm_levels(project_id, syllabus_id, inherit)
 
-        args = []
-        qs   = []
-        if levels['p']:
-            qs.append('''
-                SELECT username, action
-                FROM project_permissions
-                WHERE project_id=%s AND username=%s
-            ''')
-            args.append(project_id)
-            args.append(username)
+        # levels where groups of all subjects are expanded
+        shared = []
         if levels['s']:
             if levels['p']:
                 syllabus_id = ProjectManagement(self.env).get_project_syllabus(project_id)
-            qs.append('''
-                SELECT username, action
-                FROM syllabus_permissions
-                WHERE syllabus_id=%s
-            ''')
-            args.append(syllabus_id)
+            shared.append(('s', syllabus_id))
         if levels['g']:
-            qs.append('SELECT username, action FROM permission')
-
-        q = u'\nUNION\n'.join(qs)
-        db = self.env.get_read_db()
-        cursor = db.cursor()
-        cursor.execute(q, args)
-        rows = cursor.fetchall()
+            shared.append('g')
+        shared = tuple(shared)
 
         actions = set()
-        while True:
-            num_users = len(subjects)
-            num_actions = len(actions)
-            for user, action in rows:
-                if user in subjects:
-                    if action.isupper() and action not in actions:
-                        actions.add(action)
-                    if not action.isupper() and action not in subjects:
-                        # action is actually the name of the permission group
-                        # here
-                        subjects.add(action)
-            if num_users == len(subjects) and num_actions == len(actions):
-                break
+        if levels['p']:
+            # only user's own project permissions are taken into account
+            for target in self._get_level_graph(('p', project_id)).get(username, ()):
+                if target.isupper():
+                    actions.add(target)
+                else:
+                    # target is actually the name of the permission group
+                    subjects.add(target)
+        for subject in subjects:
+            actions.update(self._get_closure(shared, subject))
         return list(actions)
 
+    def get_subjects_with_groups(self, groups, project_id=None):
+        """Return set of subjects which are directly granted with any of
+        `groups` (or actions) on global level or in specified project."""
+        levels = ['g']
+        if project_id is not None:
+            levels.append(('p', project_id))
+        subjects = set()
+        for level in levels:
+            reverse = self._get_level_reverse(level)
+            for group in groups:
+                subjects.update(reverse.get(group, ()))
+        return subjects
+
     def get_users_with_permissions(self, permissions):
         """Retrieve a list of users that have any of the specified permissions
         
@@ -333,6 +343,81 @@ class DefaultPermissionStore(Component):
             cursor.execute(q, args)
         self.log.info('Revoked permission for %s to %s %s' % (action, username, log))
 
+    # Permission closure cache
+
+    def _get_closure_cache(self):
+        generation = CacheManager(self.env).get_generation(PermissionSystem.cache_id)
+        cache = self._closure_cache
+        if cache[0] != generation:
+            cache = self._closure_cache = (generation, {}, {}, {})
+        return cache
+
+    def _get_level_graph(self, level):
+        """Return {subject: set(targets)} of permission rows of the level."""
+        graphs = self._get_closure_cache()[1]
+        graph = graphs.get(level)
+        if graph is None:
+            if level == 'g':
+                q, args = 'SELECT username, action FROM permission', ()
+            elif level[0] == 's':
+                q = '''
+                    SELECT username, action
+                    FROM syllabus_permissions
+                    WHERE syllabus_id=%s
+                '''
+                args = (level[1],)
+            else:
+                q = '''
+                    SELECT username, action
+                    FROM project_permissions
+                    WHERE project_id=%s
+                '''
+                args = (level[1],)
+            db = self.env.get_read_db()
+            cursor = db.cursor()
+            cursor.execute(q, args)
+            graph = {}
+            for subject, target in cursor:
+                graph.setdefault(subject, set()).add(target)
+            graphs[level] = graph
+        return graph
+
+    def _get_level_reverse(self, level):
+        """Return {target: set(subjects)} of permission rows of the level."""
+        reverses = self._get_closure_cache()[2]
+        reverse = reverses.get(level)
+        if reverse is None:
+            reverse = {}
+            for subject, targets in self._get_level_graph(level).iteritems():
+                for target in targets:
+                    reverse.setdefault(target, set()).add(subject)
+            reverses[level] = reverse
+        return reverse
+
+    def _get_closure(self, levels, subject):
+        """Return frozenset of actions granted to `subject` directly
+        or through permission groups on specified `levels`."""
+        closures = self._get_closure_cache()[3]
+        key = (levels, subject)
+        actions = closures.get(key)
+        if actions is None:
+            graphs = [self._get_level_graph(level) for level in levels]
+            actions = set()
+            seen = set([subject])
+            stack = [subject]
+            while stack:
+                s = stack.pop()
+                for graph in graphs:
+                    for target in graph.get(s, ()):
+                        if target.isupper():
+                            actions.add(target)
+                        elif target not in seen:
+                            # target is actually the name of the permission group
+                            seen.add(target)
+                            stack.append(target)
+            actions = closures[key] = frozenset(actions)
+        return actions
+
     def _get_perm_levels(self, project_id=None, syllabus_id=None, inherit=True):
         levels = {
             'g': False, # global
@@ -387,34 +472,56 @@ class DefaultPermissionPolicy(Component):
 
     def __init__(self):
         self.permission_cache = {}
+        # {(username, project_id): permissions}
+        self.project_permission_cache = {}
+        self.cache_generation = None
         self.last_reap = time()
 
     # IPermissionPolicy methods
 
     def check_permission(self, action, username, resource, perm, req):
         pid = resource.pid if resource else None
-        if pid is None and req:
+        return action in self._get_permissions(username, pid, req) or None
+
+    def check_permissions(self, action, username, resources, perm, req):
+        current_pid = False
+        permissions = {}
+        decisions = []
+        for resource in resources:
+            pid = resource.pid if resource else None
+            if pid is None:
+                if current_pid is False:
+                    current_pid = None
+                    if req:
+                        current_pid = ProjectManagement(self.env) \
+                            .get_current_project(req, fail_on_none=False)
+                pid = current_pid
+            perms = permissions.get(pid)
+            if perms is None:
+                perms = permissions[pid] = \
+                    self._get_permissions(username, pid, req, False)
+            decisions.append(action in perms or None)
+        return decisions
+
+    # Internal methods
+
+    def _get_permissions(self, username, pid, req, lookup_project=True):
+        if pid is None and req and lookup_project:
             pid = ProjectManagement(self.env).get_current_project(req, fail_on_none=False)
         if pid is not None:
             if req:
                 cache = req.data['project_perm_cache']
                 perms = cache.get(pid)
-                if not perms:
-                    perms = PermissionSystem(self.env). \
-                            get_user_permissions(username, pid)
-                    cache[pid] = perms
+                if perms is None:
+                    perms = cache[pid] = self._get_project_permissions(username, pid)
             else:
-                perms = PermissionSystem(self.env). \
-                        get_user_permissions(username, pid)
-            return action in perms or None
+                perms = self._get_project_permissions(username, pid)
+            return perms
 
         # Check only global permissions
 
         now = time()
-
-        if now - self.last_reap > self.CACHE_REAP_TIME:
-            self.permission_cache = {}
-            self.last_reap = time()
+        self._reap_if_needed(now)
 
         timestamp, permissions = self.permission_cache.get(username, (0, None))
 
@@ -425,7 +532,27 @@ class DefaultPermissionPolicy(Component):
                           get_user_permissions(username)
             self.permission_cache[username] = (now, permissions)
 
-        return action in permissions or None
+        return permissions
+
+    def _get_project_permissions(self, username, pid):
+        """Return project permissions of the user. Permissions are cached
+        until the next permission changes (in any process) or cache reap."""
+        self._reap_if_needed(time())
+        key = (username, pid)
+        perms = self.project_permission_cache.get(key)
+        if perms is None:
+            perms = PermissionSystem(self.env).get_user_permissions(username, pid)
+            self.project_permission_cache[key] = perms
+        return perms
+
+    def _reap_if_needed(self, now):
+        generation = CacheManager(self.env).get_generation(PermissionSystem.cache_id)
+        if generation != self.cache_generation or \
+                now - self.last_reap > self.CACHE_REAP_TIME:
+            self.permission_cache = {}
+            self.project_permission_cache = {}
+            self.cache_generation = generation
+            self.last_reap = now
 
 
 
@@ -459,6 +586,9 @@ class PermissionSystem(Component):
     # How frequently to clear the entire permission cache
     CACHE_REAP_TIME = 60
 
+    # generation of cached permissions
+    cache_id = 'trac.perm.PermissionSystem.permissions'
+
     def __init__(self):
         self.permission_cache = {}
         self.last_reap = time()
@@ -472,10 +602,18 @@ class PermissionSystem(Component):
             raise TracError(_('%(name)s is not a valid action.', name=action))
 
         self.store.grant_permission(username, action, project_id, syllabus_id)
+        self.invalidate_permission_cache()
 
     def revoke_permission(self, username, action, project_id=None, syllabus_id=None):
         """Revokes the permission of the specified user to perform an action."""
         self.store.revoke_permission(username, action, project_id, syllabus_id)
+        self.invalidate_permission_cache()
+
+    def invalidate_permission_cache(self):
+        """Invalidate cached user permissions in all processes.
+        Must be called after permissions are changed bypassing
+        `grant_permission` and `revoke_permission`."""
+        CacheManager(self.env).invalidate(self.cache_id)
 
     def get_actions(self):
         actions = []
@@ -598,6 +736,53 @@ class PermissionSystem(Component):
                        (username, action, resource))
         return False
 
+    def check_permissions(self, action, username=None, resources=(), perm=None,
+                          req=None):
+        """Return the list of decisions whether permission to perform action
+        is allowed for each of the given resources.
+
+        Policies implementing `check_permissions` decide for all remaining
+        resources at once, other policies are asked for every resource.
+        """
+        if username is None:
+            username = 'anonymous'
+        resources = [r if not r or r.realm is not None else None
+                     for r in resources]
+        decisions = [None] * len(resources)
+        pending = range(len(resources))
+        for policy in self.policies:
+            if not pending:
+                break
+            batch_check = getattr(policy, 'check_permissions', None)
+            if batch_check is not None:
+                results = batch_check(action, username,
+                                      [resources[i] for i in pending],
+                                      perm, req)
+            else:
+                results = []
+                for i in pending:
+                    resource = resources[i]
+                    sub_perm = perm
+                    if perm is not None and resource is not None:
+                        sub_perm = perm(resource)
+                    results.append(policy.check_permission(
+                        action, username, resource, sub_perm, req))
+            remaining = []
+            for i, decision in zip(pending, results):
+                if decision is None:
+                    remaining.append(i)
+                else:
+                    decisions[i] = decision
+            if len(remaining) < len(pending):
+                self.log.debug("%s decided %s performing %s on %d of %d "
+                               "resources", policy.__class__.__name__,
+                               username, action,
+                               len(pending) - len(remaining), len(pending))
+            pending = remaining
+        for i in pending:
+            decisions[i] = False
+        return decisions
+
     # IPermissionRequestor methods
 
     def get_permission_actions(self):
@@ -707,6 +892,34 @@ class PermissionCache(object):
 
     __contains__ = has_permission
 
+    def filter(self, action, resources):
+        """Return the list of resources for which the action is allowed.
+
+        Unlike checking `action in perm(resource)` for every resource,
+        uncached decisions are taken by the permission policies at once:
+
+            tickets = perm.filter('TICKET_VIEW', ticket_resources)
+        """
+        resources = list(resources)
+        decisions = [None] * len(resources)
+        missing = []
+        for i, resource in enumerate(resources):
+            cached = self._cache.get((self.username, hash(resource), action))
+            if cached and resource == cached[1]:
+                decisions[i] = cached[0]
+            else:
+                missing.append(i)
+        if missing:
+            checked = PermissionSystem(self.env).check_permissions(
+                action, self.username, [resources[i] for i in missing],
+                self, self._req)
+            for i, decision in zip(missing, checked):
+                resource = resources[i]
+                decisions[i] = decision
+                self._cache[(self.username, hash(resource), action)] = \
+                    (decision, resource)
+        return [r for r, decision in zip(resources, decisions) if decision]
+
     def require(self, action, realm_or_resource=None, id=False, version=False, pid=False):
         resource = self._normalize_resource(realm_or_resource, pid, id, version)
         if not self._has_permission(action, resource):
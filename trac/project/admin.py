@@ -148,6 +148,7 @@ class ProjectManagementAdmin(Component):
                         session.query(Syllabus).\
                                 filter(Syllabus.id.in_(ids)).delete(False)
                         session.commit()
+                        self.pm.invalidate_syllabus_cache()
                         for id in ids:
                             Syllabus.remove_config(self.env, id)
                         add_notice(req, _('The selected items have been removed.'))
@@ -187,6 +188,7 @@ class ProjectManagementAdmin(Component):
                         for key, val in changes.iteritems():
                             setattr(project, key, val)
                         session.commit()
+                        self.pm.invalidate_project_info_cache()
                         add_notice(req, _('Your changes have been saved.'))
                         req.redirect(req.panel_href())
                 elif req.args.has_key('remove_conf'):
@@ -215,6 +217,7 @@ class ProjectManagementAdmin(Component):
                         new_s = Project(**args)
                         session.add(new_s)
                         session.commit()
+                        self.pm.invalidate_syllabus_cache()
                         add_notice(req, _('New project have been added.'))
                         req.redirect(req.panel_href())
                 elif req.args.has_key('remove'):
@@ -225,6 +228,7 @@ class ProjectManagementAdmin(Component):
                         session.query(Project).\
                                 filter(Project.id.in_(ids)).delete(False)
                         session.commit()
+                        self.pm.invalidate_syllabus_cache()
                         for id in ids:
                             Project.remove_config(self.env, id)
                         add_notice(req, _('The selected items have been removed.'))
@@ -282,6 +286,7 @@ class ProjectManagementAdmin(Component):
 
                         if not err:
                             session.commit()
+                            self.pm.invalidate_syllabus_cache()
                             add_notice(req, _('Your changes have been saved.'))
                             req.redirect(req.panel_href())
 
@@ -346,6 +351,7 @@ class ProjectManagementAdmin(Component):
 
                         if not err:
                             session.commit()
+                            self.pm.invalidate_syllabus_cache()
                             add_notice(req, _('Your changes have been saved.'))
                             req.redirect(req.panel_href())
 
@@ -1,6 +1,8 @@
 import threading
 
 from trac.core import Component, Interface, TracError
+from trac.cache import cached, CacheManager
+from trac.db.api import get_column_names
 from trac.resource import GLOBAL_PID, ResourceNotFound
 
 from trac.user.api import UserManagement, GroupLevel, UserRole
@@ -54,11 +56,13 @@ class ProjectManagement(Component):
     This class provides API to manage projects.
     """
 
+    _project_info_cache_id = 'trac.project.api.ProjectManagement.project_info'
 
     def __init__(self):
-        self._syl_cache_lock = threading.Lock()
-        self._proj_syl_cache = {}
-        self._meta_syl_cache = {}
+        self._project_info_lock = threading.Lock()
+        # (generation, {project_id: info})
+        self._project_info = (None, {})
+
 
     def get_user_roles(self, username):
         db = self.env.get_read_db()
@@ -101,6 +105,64 @@ class ProjectManagement(Component):
 
         return roles
 
+    def get_user_access(self, username):
+        '''Resolve user roles, accessible projects and their info in one query.
+
+        Returns dict {
+            'roles': [<role>, ...],
+            'projects': {<role code>: [(<project_id>, <project_name>), ...], ...},
+            'project_info': {<project_id>: <info dict> or None, ...},
+        }
+        See `get_user_roles`, `get_user_projects` and `get_project_info`.
+        '''
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        info_cols = '''
+            pi.active AS project_active, pi.project_description,
+            pi.team_id, pi.group_id, pi.metagroup_id, pi.syllabus_id
+        '''
+        query = '''
+            SELECT {dev} AS role, dp.project_id, dp.project_name, pi.project_id, {info}
+            FROM developer_projects dp
+            LEFT JOIN project_info pi ON pi.project_id=dp.project_id
+            WHERE dp.username=%s
+            UNION ALL
+            SELECT {man} AS role, mp.project_id, mp.project_name, pi.project_id, {info}
+            FROM manager_projects mp
+            LEFT JOIN project_info pi ON pi.project_id=mp.project_id
+            WHERE mp.username=%s
+            UNION ALL
+            SELECT {adm} AS role, p.id, p.name, pi.project_id, {info}
+            FROM permission perm
+            LEFT JOIN projects p ON 1=1
+            LEFT JOIN project_info pi ON pi.project_id=p.id
+            WHERE perm.username=%s AND perm.action='TRAC_ADMIN'
+        '''.format(dev=int(UserRole.DEVELOPER), man=int(UserRole.MANAGER),
+                   adm=int(UserRole.ADMIN), info=info_cols)
+        cursor.execute(query, (username, username, username))
+        names = ['project_id', 'project_name'] + get_column_names(cursor)[4:]
+        projects = {}
+        project_info = {}
+        for row in cursor.fetchall():
+            role, pid, name, info_pid = row[:4]
+            user_projects = projects.setdefault(role, [])
+            if pid is None:
+                # admin without any projects
+                continue
+            user_projects.append((pid, name))
+            if info_pid is None:
+                project_info[pid] = None
+            else:
+                project_info[pid] = dict(zip(names, (pid, name) + tuple(row[4:])))
+        roles = [UserRole(code) for code in (int(UserRole.DEVELOPER), int(UserRole.MANAGER),
+                                             int(UserRole.ADMIN))
+                 if code in projects]
+        return {
+            'roles': roles,
+            'projects': projects,
+            'project_info': project_info,
+        }
+
     def get_user_projects(self, username, role=UserRole.DEVELOPER, with_names=False):
         db = self.env.get_read_db()
         cursor = db.cursor()
@@ -208,12 +270,11 @@ class ProjectManagement(Component):
 
     def get_project_syllabus(self, pid, fail_on_none=True):
         pid = int(pid)
-        db = self.env.get_read_db() # #4465
-        with self._syl_cache_lock:
-            if pid not in self._proj_syl_cache:
-                s = self._get_syllabus(pid=pid, db=db)
-                self._proj_syl_cache[pid] = s
-            s = self._proj_syl_cache[pid]
+        projects = self._syllabus_maps[0]
+        if pid in projects:
+            s = projects[pid]
+        else:
+            s = self._get_syllabus(pid=pid)
         if fail_on_none and s is None:
             raise TracError(_('Project #%(pid)s is not associated with any syllabus', pid=pid))
         return s
@@ -228,38 +289,61 @@ class ProjectManagement(Component):
 
     def get_metagroup_syllabus(self, gid, fail_on_none=True):
         gid = int(gid)
-        db = self.env.get_read_db() # #4465
-        with self._syl_cache_lock:
-            if gid not in self._meta_syl_cache:
-                s = self._get_syllabus(metagroup_id=gid, db=db)
-                self._meta_syl_cache[gid] = s
-            s = self._meta_syl_cache[gid]
+        metagroups = self._syllabus_maps[1]
+        if gid in metagroups:
+            s = metagroups[gid]
+        else:
+            s = self._get_syllabus(metagroup_id=gid)
         if fail_on_none and s is None:
             raise TracError(_('Metagroup #%(gid)s is not associated with any syllabus', gid=gid))
         return s
 
-    def get_project_info(self, pid, fail_on_none=True):
+    def get_project_info(self, pid, fail_on_none=True, req=None):
         """Returns dict (project_id, project_active, project_name, project_description,
                          team_id, group_id, metagroup_id, syllabus_id)
+
+        If `req` is given, info is cached for the rest of the request.
         """
-        db = self.env.get_read_db()
-        cursor = db.cursor()
-        query = '''
-            SELECT project_id, active AS project_active, project_name, project_description,
-                   team_id, group_id AS group_id, metagroup_id, syllabus_id
-            FROM project_info
-            WHERE project_id=%s
-        '''
-        cursor.execute(query, (pid,))
-        values = cursor.fetchone()
-        if values is None:
-            if fail_on_none:
-                raise TracError(_('Project #%(pid)s is not associated with any syllabus / group info', pid=pid))
-            else:
-                return None
-        from trac.db.api import get_column_names
-        names  = get_column_names(cursor)
-        return dict(zip(names, values))
+        pid = int(pid)
+        info = self.get_projects_info((pid,), req)[pid]
+        if info is None and fail_on_none:
+            raise TracError(_('Project #%(pid)s is not associated with any syllabus / group info', pid=pid))
+        return info
+
+    def get_projects_info(self, pids, req=None):
+        """Returns dict {<project_id>: <info dict> or None, ...}
+        (see `get_project_info`) for all `pids`.
+
+        Info is looked up in the request cache (if `req` is given),
+        then in the process cache, and missing projects are fetched
+        from database in one query. So handlers can prefetch info
+        of all projects they will show.
+        """
+        pids = set(int(pid) for pid in pids)
+        if req is not None:
+            req_cache = req.data.setdefault('project_info_cache', {})
+        else:
+            req_cache = {}
+        infos = dict((pid, req_cache[pid]) for pid in pids if pid in req_cache)
+        missing = pids.difference(infos)
+        if missing:
+            generation = CacheManager(self.env).get_generation(self._project_info_cache_id)
+            with self._project_info_lock:
+                cache_gen, cache = self._project_info
+                if cache_gen != generation:
+                    cache = {}
+                    self._project_info = (generation, cache)
+                infos.update((pid, cache[pid]) for pid in missing if pid in cache)
+            missing.difference_update(infos)
+            if missing:
+                fetched = self._fetch_projects_info(missing)
+                with self._project_info_lock:
+                    if self._project_info[0] == generation:
+                        self._project_info[1].update(fetched)
+                infos.update(fetched)
+            req_cache.update(infos)
+        # cached dicts are shared, so return copies
+        return dict((pid, info and dict(info)) for pid, info in infos.iteritems())
 
     def get_syllabus_projects(self, syllabus_id, with_names=False):
         '''Return all projects connected with specified syllabus'''
@@ -354,8 +438,61 @@ class ProjectManagement(Component):
         url = req.href.copy_for_project(project_id) + q
         req.redirect(url)
 
+    def invalidate_syllabus_cache(self):
+        '''Invalidate cached project and metagroup syllabuses in all processes.
+        Must be called after changes of projects, teams, groups, metagroups
+        or syllabuses connections.
+        Project info cache is invalidated too.'''
+        del self._syllabus_maps
+        self.invalidate_project_info_cache()
+        # syllabus level permissions of projects may change
+        from trac.perm import PermissionSystem
+        PermissionSystem(self.env).invalidate_permission_cache()
+
+    def invalidate_project_info_cache(self):
+        '''Invalidate cached project info in all processes.
+        Must be called after changes of project attributes.'''
+        CacheManager(self.env).invalidate(self._project_info_cache_id)
+        with self._project_info_lock:
+            self._project_info = (None, {})
+
     # Internal methods
 
+    @cached
+    def _syllabus_maps(self, db):
+        '''Return syllabuses of all projects and metagroups as tuple
+        ({<project_id>: <syllabus_id>, ...}, {<metagroup_id>: <syllabus_id>, ...})'''
+        cursor = db.cursor()
+        cursor.execute('''
+            SELECT project_id, syllabus_id
+            FROM project_info
+        ''')
+        projects = dict(cursor.fetchall())
+        cursor.execute('''
+            SELECT metagroup_id, syllabus_id
+            FROM metagroup_syllabus_rel
+        ''')
+        metagroups = dict(cursor.fetchall())
+        return projects, metagroups
+
+    def _fetch_projects_info(self, pids):
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        pids = list(pids)
+        query = '''
+            SELECT project_id, active AS project_active, project_name, project_description,
+                   team_id, group_id AS group_id, metagroup_id, syllabus_id
+            FROM project_info
+            WHERE project_id IN ({0})
+        '''.format(','.join(['%s'] * len(pids)))
+        cursor.execute(query, pids)
+        names = get_column_names(cursor)
+        infos = dict.fromkeys(pids)
+        for values in cursor:
+            info = dict(zip(names, values))
+            infos[info['project_id']] = info
+        return infos
+
     def _get_syllabus(self, pid=None, metagroup_id=None, db=None):
         if pid is not None:
             query = '''
@@ -88,6 +88,8 @@ class Project(ModelBase):
         def do_revoke(db):
             cursor = db.cursor()
             cursor.execute(q.format(and_action=ext), args)
+        from trac.perm import PermissionSystem
+        PermissionSystem(env).invalidate_permission_cache()
 
     @classmethod
     def grant_permission(cls, env, id, username, action):
@@ -111,6 +113,8 @@ class Project(ModelBase):
                 (project_id, username, action)
                 VALUES (%s, %s, %s)
             ''', args)
+        from trac.perm import PermissionSystem
+        PermissionSystem(env).invalidate_permission_cache()
 
     @classmethod
     def set_permission(cls, env, id, username, action, grant=True):
@@ -1,5 +1,10 @@
 import re
 
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
 from trac.core import Component, implements, ExtensionPoint, TracError
 from trac.web.main import IRequestHandler, IRequestFilter
 
@@ -71,17 +76,62 @@ class ProjectSystem(Component):
 
     # API
 
-    def set_request_data(self, req, project_id):
+    def get_user_access(self, req, refresh=False):
+        '''Return user roles and projects
+        (see `ProjectManagement.get_user_access`).
+
+        Roles and projects are cached in session for the life of the
+        login, pass `refresh`=True to reload them from database.
+        Project info is not part of the result: it may change during
+        the login, use `ProjectManagement.get_projects_info` instead.
+        '''
+        if not refresh and 'user_access' in req.data:
+            return req.data['user_access']
+        s = req.session
+        sid = 'trac_auth' in req.incookie and req.incookie['trac_auth'].value
+        access = None
+        if not refresh and sid and s.get('user_access_sid') == sid:
+            try:
+                access = self._load_user_access(s['user_access'])
+            except (KeyError, TypeError, ValueError):
+                access = None
+        if access is None:
+            access = self.pm.get_user_access(req.authname)
+            del access['project_info']
+            if sid:
+                s['user_access'] = self._dump_user_access(access)
+                s['user_access_sid'] = sid
+        req.data['user_access'] = access
+        return access
+
+    def get_user_projects(self, req, role, refresh=False):
+        '''Return list of (project_id, project_name) available
+        for user in specified `role`.'''
+        projects = self.get_user_access(req, refresh)['projects']
+        if role == UserRole.ADMIN:
+            return projects.get(int(UserRole.ADMIN), [])
+        elif role == UserRole.DEVELOPER:
+            return projects.get(int(UserRole.DEVELOPER), [])
+        elif UserRole.PROJECT_MANAGER in role:
+            return projects.get(int(UserRole.MANAGER), [])
+        return []
+
+    def set_request_data(self, req, project_id, info=None):
         '''Set project info data for current request.
         Other components consider this data as reliable and
         can use it directly without preliminary check.
         But they must check if 'project_id' in req.data.
         If True, then all project info keys are in data.
+
+        `info`: project info dict if it is already known,
+        otherwise it is taken from the project info cache
+        (see `ProjectManagement.get_projects_info`).
         '''
         if not req.session.authenticated:
             return False
         try:
-            info = self.pm.get_project_info(project_id, fail_on_none=True)
+            if info is None:
+                info = self.pm.get_project_info(project_id, fail_on_none=True, req=req)
         except TracError, e:
             add_warning(req, exception_to_unicode(e))
             req.session.pop('postlogin', None)
@@ -89,6 +139,28 @@ class ProjectSystem(Component):
         # see `ProjectManagement.get_project_info` for list of info keys
         req.data.update(info)
 
+    # Internal methods
+
+    def _dump_user_access(self, access):
+        # roles are stored explicitly: e.g. an admin may have no projects
+        return json.dumps({
+            'roles': [int(role) for role in access['roles']],
+            'projects': [(role, pid, name)
+                         for role, projects in access['projects'].iteritems()
+                         for pid, name in projects],
+        })
+
+    def _load_user_access(self, value):
+        value = json.loads(value)
+        roles = [UserRole(code) for code in value['roles']]
+        projects = dict((int(role), []) for role in roles)
+        for role, pid, name in value['projects']:
+            projects.setdefault(role, []).append((pid, name))
+        return {
+            'roles': roles,
+            'projects': projects,
+        }
+
 
 STEP_SET_ROLE    = 1
 STEP_SET_PROJECT = 10
@@ -209,7 +281,8 @@ class PostloginModule(Component):
 
         def step_preprocess(step):
             if step == STEP_SET_ROLE:
-                roles = self.pm.get_user_roles(req.authname)
+                # roles and projects are reloaded at each login
+                roles = self.ps.get_user_access(req, refresh=True)['roles']
                 if not roles:
                     raise TracError(tag(tag_(
                         'User has no roles. Can not continue login.'
@@ -219,7 +292,8 @@ class PostloginModule(Component):
                 data['roles'] = [(r, UserRole.label(r)) for r in roles]
             elif step == STEP_SET_PROJECT:
                 role = UserRole(s['role'])
-                data['projects'] = self.pm.get_user_projects(req.authname, role, with_names=True)
+                data['projects'] = self.ps.get_user_projects(req, role,
+                                                             refresh=change_param)
                 s['projects'] = ' '.join([str(p[0]) for p in data['projects']])
                 if 'project' not in req.args:
                     prev_project_id = s.get('project')
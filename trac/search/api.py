@@ -39,6 +39,36 @@ class ISearchSource(Interface):
         """
 
 
+class ISearchIndexSource(Interface):
+    """Extension point interface for search sources whose documents are
+    stored in the full-text search index (see `trac.search.index`).
+    """
+
+    def get_search_index_realms():
+        """Return a list of `(filter, realm, action)` tuples.
+
+        Documents of `realm` are searched when the `filter` search filter
+        is enabled, and shown to users having the `action` permission on
+        the resource of the document.
+        """
+
+    def get_search_documents(realm, keys=None):
+        """Generate the documents of `realm` to store in the index.
+
+        Documents must be `(id, pid, title, author, time, text)` tuples,
+        where `id` identifies the resource within `realm` and `pid` within
+        the projects (`None` for global resources), and `time` is a
+        timestamp in microseconds or `None`.
+
+        If `keys` is given, only the documents of these `(id, pid)` pairs
+        which still exist are generated, otherwise all the documents of
+        `realm` are.
+        """
+
+    def get_search_index_resource(realm, id, pid):
+        """Return the resource of the `(id, pid)` document of `realm`."""
+
+
 def search_to_sql(db, columns, terms):
     """Convert a search query into an SQL WHERE clause and corresponding
     parameters.
@@ -0,0 +1,393 @@
+import re
+from datetime import datetime
+
+from trac.admin.api import IAdminCommandProvider
+from trac.config import BoolOption
+from trac.core import *
+from trac.project.api import ProjectManagement
+from trac.resource import get_resource_url
+from trac.search.api import ISearchIndexSource, shorten_result
+from trac.ticket.api import ITicketChangeListener, IMilestoneChangeListener
+from trac.util.datefmt import from_utimestamp, utc
+from trac.util.html import plaintext
+from trac.util.text import printout
+from trac.util.translation import _, ngettext
+from trac.versioncontrol.api import IRepositoryChangeListener
+from trac.wiki.api import IWikiChangeListener
+
+__all__ = ['SearchIndex']
+
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+# Longer words are not indexed
+MAX_TERM_LENGTH = 64
+
+# Weight of the words of the document titles relative to the text
+TITLE_WEIGHT = 5
+
+# Minimum number of documents read at once when searching the index
+SEARCH_BATCH_SIZE = 100
+
+
+def _get_words(text):
+    return [word for word in _word_re.findall((text or '').lower())
+            if len(word) <= MAX_TERM_LENGTH]
+
+
+def _get_weights(title, text):
+    weights = {}
+    for word in _get_words(title):
+        weights[word] = weights.get(word, 0) + TITLE_WEIGHT
+    for word in _get_words(text):
+        weights[word] = weights.get(word, 0) + 1
+    return weights
+
+
+class SearchIndex(Component):
+    '''Full-text search index of the documents of `ISearchIndexSource`s.
+
+    The index is an inverted index stored in the database: the
+    `search_document` table holds the documents, the `search_term` table
+    the weight of each word in each document. It is kept up to date by
+    the ticket, milestone, wiki and repository change listeners and can be
+    rebuilt with `trac-admin $ENV search reindex`.
+    '''
+
+    implements(IAdminCommandProvider, ITicketChangeListener,
+               IMilestoneChangeListener, IWikiChangeListener,
+               IRepositoryChangeListener)
+
+    sources = ExtensionPoint(ISearchIndexSource)
+
+    enabled = BoolOption('search', 'index', 'true',
+        """Search tickets, milestones, wiki pages and changesets using the
+        full-text search index instead of scanning their tables. The index
+        is updated as the resources change, run
+        `trac-admin $ENV search reindex` after enabling it.""")
+
+    # IAdminCommandProvider methods
+
+    def get_admin_commands(self):
+        yield ('search reindex', '[realm]',
+               'Rebuild the full-text search index',
+               self._complete_reindex, self._do_reindex)
+
+    def _complete_reindex(self, args):
+        if len(args) == 1:
+            return self._get_realms().keys()
+
+    def _do_reindex(self, realm=None):
+        if realm is not None and realm not in self._get_realms():
+            raise TracError(_('Unknown search index realm "%(realm)s"',
+                              realm=realm))
+        for realm, count in sorted(self.reindex(realm).iteritems()):
+            printout(ngettext('%(realm)s: %(num)s document indexed.',
+                              '%(realm)s: %(num)s documents indexed.',
+                              num=count, realm=realm))
+
+    # ITicketChangeListener methods
+
+    def ticket_created(self, ticket):
+        self.update('ticket', [(ticket.id, ticket.pid)])
+
+    def ticket_changed(self, ticket, comment, author, old_values):
+        self.update('ticket', [(ticket.id, ticket.pid)])
+
+    def ticket_deleted(self, ticket):
+        self.update('ticket', [(ticket.id, ticket.pid)])
+
+    # IMilestoneChangeListener methods
+
+    def milestone_created(self, milestone):
+        self.update('milestone', [(milestone.name, milestone.pid)])
+
+    def milestone_changed(self, milestone, old_values):
+        keys = [(milestone.name, milestone.pid)]
+        if old_values.get('name'):
+            keys.append((old_values['name'], milestone.pid))
+        self.update('milestone', keys)
+
+    def milestone_deleted(self, milestone):
+        self.update('milestone', [(milestone.name, milestone.pid)])
+
+    # IWikiChangeListener methods
+
+    def wiki_page_added(self, page):
+        self.update('wiki', [(page.name, page.pid or None)])
+
+    def wiki_page_changed(self, page, version, t, comment, author, ipnr):
+        self.update('wiki', [(page.name, page.pid or None)])
+
+    def wiki_page_deleted(self, page):
+        self.update('wiki', [(page.name, page.pid or None)])
+
+    def wiki_page_version_deleted(self, page):
+        self.update('wiki', [(page.name, page.pid or None)])
+
+    def wiki_page_renamed(self, page, old_name):
+        self.update('wiki', [(old_name, page.pid or None),
+                             (page.name, page.pid or None)])
+
+    # IRepositoryChangeListener methods
+
+    def changeset_added(self, repos, changeset):
+        self.update('changeset',
+                    [('%s/%s' % (repos.reponame, changeset.rev), repos.pid)])
+
+    def changeset_modified(self, repos, changeset, old_changeset):
+        self.update('changeset',
+                    [('%s/%s' % (repos.reponame, changeset.rev), repos.pid)])
+
+    # API
+
+    def is_indexed(self, realm):
+        '''Return whether the documents of `realm` are searched using
+        the index.'''
+        return self.enabled and realm in self._get_realms()
+
+    def update(self, realm, keys):
+        '''Update the index for the `(id, pid)` documents of `realm`,
+        documents of deleted resources are removed.'''
+        source = self._get_realms().get(realm, (None, None, None))[2]
+        if not self.enabled or source is None or not keys:
+            return
+        keys = [(unicode(id), pid) for id, pid in keys]
+        @self.env.with_transaction()
+        def do_update(db):
+            cursor = db.cursor()
+            for id, pid in keys:
+                self._remove_document(cursor, realm, id, pid)
+            for doc in source.get_search_documents(realm, keys):
+                self._insert_document(db, cursor, realm, doc)
+
+    def reindex(self, realm=None):
+        '''Rebuild the index for the documents of `realm` or of all realms.
+
+        Return a `{realm: number of documents}` dictionary.'''
+        realms = self._get_realms()
+        if realm is not None:
+            realms = {realm: realms[realm]}
+        counts = {}
+        @self.env.with_transaction()
+        def do_reindex(db):
+            cursor = db.cursor()
+            for realm, (filter_, action, source) in realms.iteritems():
+                cursor.execute("""
+                    DELETE FROM search_term WHERE document IN (
+                        SELECT id FROM search_document WHERE realm=%s)
+                    """, (realm,))
+                cursor.execute("DELETE FROM search_document WHERE realm=%s",
+                               (realm,))
+                counts[realm] = 0
+                for doc in source.get_search_documents(realm):
+                    self._insert_document(db, cursor, realm, doc)
+                    counts[realm] += 1
+        return counts
+
+    def search(self, req, terms, filters, limit=None):
+        '''Return the results of the indexed realms of `filters` matching
+        all the `terms`, best ranked first.
+
+        Documents of other projects than the current one are skipped.
+        Results are `(href, title, date, author, excerpt, document, score)`
+        tuples, where `excerpt` is `None`: use `get_excerpts` for the
+        results actually shown.
+
+        If `limit` is given, only the `limit` best ranked results are
+        returned: the documents are read by batches in rank order until
+        enough of them may be viewed.
+
+        A term ending with `*` matches the words it starts.
+        '''
+        query = self._get_query(req, terms, filters)
+        if query is None:
+            return []
+        realms, sql, args = query
+        sql += " ORDER BY score DESC,d.time DESC,d.id"
+        batch_size = limit and max(limit, SEARCH_BATCH_SIZE)
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        results = []
+        offset = 0
+        while True:
+            if limit:
+                cursor.execute(sql + " LIMIT %d OFFSET %d"
+                               % (batch_size, offset), args)
+            else:
+                cursor.execute(sql, args)
+            rows = cursor.fetchall()
+            results.extend(self._get_viewable_results(req, realms, rows))
+            if not limit or len(rows) < batch_size or len(results) >= limit:
+                break
+            offset += batch_size
+        return limit and results[:limit] or results
+
+    def count(self, req, terms, filters):
+        '''Return the number of documents of the indexed realms of
+        `filters` matching all the `terms` that the user may view.
+
+        As in `search`, the permissions are checked, but the documents are
+        neither sorted nor turned into results.
+        '''
+        query = self._get_query(req, terms, filters)
+        if query is None:
+            return 0
+        realms, sql, args = query
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        cursor.execute("""
+            SELECT id,realm,resource,project_id FROM (%s) AS documents
+            """ % sql, args)
+        return len(self._get_viewable_hits(req, realms, cursor.fetchall()))
+
+    def rank(self, results, terms):
+        '''Return the `(href, title, date, author, excerpt)` search results
+        of the other search sources ranked as the documents of the index,
+        as `(href, title, date, author, excerpt, None, score)` tuples.
+
+        The score is computed from the title and the excerpt only.
+        '''
+        words = self._get_query_words(terms)
+        ranked = []
+        for result in results:
+            weights = _get_weights(plaintext(result[1] or ''),
+                                   plaintext(result[4] or ''))
+            score = sum(weight for term, weight in weights.iteritems()
+                        if any(term == word or prefix and
+                               term.startswith(word)
+                               for word, prefix in words))
+            ranked.append(tuple(result[:5]) + (None, score))
+        ranked.sort(key=lambda result: (result[6], result[2]), reverse=True)
+        return ranked
+
+    def get_excerpts(self, documents, terms):
+        '''Return a `{document: excerpt}` dictionary of the excerpts
+        of the `documents` text showing the `terms`.'''
+        if not documents:
+            return {}
+        keywords = [term.rstrip('*') for term in terms]
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        cursor.execute("SELECT id,text FROM search_document WHERE id IN (%s)"
+                       % ','.join(['%s'] * len(documents)), list(documents))
+        return dict((id, shorten_result(text, keywords))
+                    for id, text in cursor)
+
+    # Internal methods
+
+    def _get_query_words(self, terms):
+        # [(word, prefix)]
+        words = []
+        for term in terms:
+            term_words = _get_words(term)
+            words.extend((word, False) for word in term_words)
+            if term_words and term.endswith('*'):
+                words[-1] = (words[-1][0], True)
+        return words
+
+    def _get_query(self, req, terms, filters):
+        """Return the `(realms, sql, args)` of the query selecting the
+        documents matching `terms` with their score, or `None` if no
+        document can match."""
+        realms = dict((realm, info) for realm, info
+                      in self._get_realms().iteritems() if info[0] in filters)
+        words = self._get_query_words(terms)
+        if not self.enabled or not realms or not words:
+            return None
+
+        db = self.env.get_read_db()
+        matches = []
+        match_args = []
+        for word, prefix in words:
+            if prefix:
+                matches.append('term %s' % db.like())
+                match_args.append(db.like_escape(word) + '%')
+            else:
+                matches.append('term=%s')
+                match_args.append(word)
+
+        where = ['d.realm IN (%s)' % ','.join(['%s'] * len(realms))]
+        args = match_args + realms.keys()
+        pid = ProjectManagement(self.env).get_current_project(
+                                                    req, fail_on_none=False)
+        if pid is not None:
+            where.append('(d.project_id=%s OR d.project_id IS NULL)')
+            args.append(pid)
+        for match, arg in zip(matches, match_args):
+            where.append('d.id IN (SELECT document FROM search_term '
+                         'WHERE %s)' % match)
+            args.append(arg)
+
+        sql = """
+            SELECT d.id,d.realm,d.resource,d.project_id,d.title,d.author,
+                   d.time,SUM(s.weight) AS score
+            FROM search_document AS d
+              JOIN search_term AS s ON (s.document=d.id AND (%s))
+            WHERE %s
+            GROUP BY d.id,d.realm,d.resource,d.project_id,d.title,d.author,
+                     d.time
+            """ % (' OR '.join(matches), ' AND '.join(where))
+        return realms, sql, args
+
+    def _get_viewable_hits(self, req, realms, rows):
+        """Return the `(row, resource)` of the `rows`, starting with the
+        `id,realm,resource,project_id` columns, that the user may view."""
+        hits = [(row, realms[row[1]][2].get_search_index_resource(
+                          row[1], row[2], row[3]))
+                for row in rows]
+        # Check the permissions of all the documents of a realm at once
+        viewable = set()
+        for realm, (filter_, action, source) in realms.iteritems():
+            viewable.update(req.perm.filter(action,
+                            [res for row, res in hits if row[1] == realm]))
+        return [(row, resource) for row, resource in hits
+                if resource in viewable]
+
+    def _get_viewable_results(self, req, realms, rows):
+        results = []
+        for row, resource in self._get_viewable_hits(req, realms, rows):
+            document, title, author, ts, score = (row[0], row[4], row[5],
+                                                  row[6], row[7])
+            results.append((get_resource_url(self.env, resource, req.href),
+                            title,
+                            ts and from_utimestamp(ts) or datetime.now(utc),
+                            author, None, document, score))
+        return results
+
+    def _get_realms(self):
+        # {realm: (filter, action, source)}
+        realms = {}
+        for source in self.sources:
+            for filter_, realm, action in source.get_search_index_realms():
+                realms[realm] = (filter_, action, source)
+        return realms
+
+    def _remove_document(self, cursor, realm, id, pid):
+        if pid is None:
+            pid_sql, args = 'project_id IS NULL', (realm, id)
+        else:
+            pid_sql, args = 'project_id=%s', (realm, id, pid)
+        cursor.execute("""
+            DELETE FROM search_term WHERE document IN (
+                SELECT id FROM search_document
+                WHERE realm=%%s AND resource=%%s AND %s)
+            """ % pid_sql, args)
+        cursor.execute("""
+            DELETE FROM search_document
+            WHERE realm=%%s AND resource=%%s AND %s
+            """ % pid_sql, args)
+
+    def _insert_document(self, db, cursor, realm, doc):
+        id, pid, title, author, ts, text = doc
+        cursor.execute("""
+            INSERT INTO search_document
+                (realm,resource,project_id,title,author,time,text)
+            VALUES (%s,%s,%s,%s,%s,%s,%s)
+            """, (realm, unicode(id), pid, title, author, ts, text))
+        document = db.get_last_id(cursor, 'search_document')
+        weights = _get_weights(title, text)
+        cursor.executemany("""
+            INSERT INTO search_term (term,document,weight) VALUES (%s,%s,%s)
+            """, [(word, document, weight)
+                  for word, weight in weights.iteritems()])
@@ -0,0 +1,12 @@
+import unittest
+
+from trac.search.tests import index, web_ui
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(index.suite())
+    suite.addTest(web_ui.suite())
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,194 @@
+from trac.core import Component, implements
+from trac.resource import Resource
+from trac.search.api import ISearchIndexSource
+from trac.search import index
+from trac.search.index import SearchIndex
+from trac.test import EnvironmentStub, Mock
+from trac.web.href import Href
+
+import unittest
+
+
+class DocumentSource(Component):
+    """Search index source of the documents of its `documents` dictionary,
+    `{(realm, id, pid): (title, author, time, text)}`."""
+
+    implements(ISearchIndexSource)
+
+    documents = {}
+
+    def get_search_index_realms(self):
+        yield ('wiki', 'wiki', 'WIKI_VIEW')
+        yield ('ticket', 'ticket', 'TICKET_VIEW')
+
+    def get_search_documents(self, realm, keys=None):
+        for (doc_realm, id, pid), doc in sorted(self.documents.iteritems()):
+            if doc_realm == realm and \
+                    (keys is None or (unicode(id), pid) in keys):
+                yield (id, pid) + doc
+
+    def get_search_index_resource(self, realm, id, pid):
+        return Resource(realm, id, pid=pid)
+
+
+class PermissionCacheStub(object):
+    """Denies all actions on the `denied` resource ids."""
+
+    def __init__(self, denied=()):
+        self.denied = denied
+
+    def filter(self, action, resources):
+        return [r for r in resources if r.id not in self.denied]
+
+
+class SearchIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub(enable=['trac.search.*', DocumentSource])
+        self.index = SearchIndex(self.env)
+        DocumentSource.documents = {
+            ('wiki', 'WikiStart', None):
+                ('WikiStart: Welcome', 'joe', 1000, 'Welcome to the wiki'),
+            ('wiki', 'Project', 1):
+                ('Project: Welcome', 'joe', 2000,
+                 'The project wiki, welcome welcome'),
+            ('wiki', 'Other', 2):
+                ('Other: Welcome', 'ann', 3000, 'Welcome to another project'),
+            ('ticket', '1', 1):
+                ('#1: Searching', 'bob', 4000, 'Search welcomed pages'),
+        }
+        self.index.reindex()
+
+    def tearDown(self):
+        DocumentSource.documents = {}
+        self.env.reset_db()
+
+    def _search(self, query, filters=('wiki', 'ticket'), project_id=1,
+                limit=None, denied=()):
+        req = Mock(href=Href('/trac'), perm=PermissionCacheStub(denied),
+                   data={'project_id': project_id})
+        return [(result[0], result[6]) for result
+                in self.index.search(req, query.split(), filters, limit)]
+
+    def test_reindex(self):
+        self.assertEqual({'wiki': 3, 'ticket': 1}, self.index.reindex())
+        self.assertEqual({'ticket': 1}, self.index.reindex('ticket'))
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        cursor.execute("SELECT COUNT(*) FROM search_document")
+        self.assertEqual(4, cursor.fetchone()[0])
+
+    def test_ranked(self):
+        # title words weigh more than text words
+        self.assertEqual([('/trac/wiki/Project', 7),
+                          ('/trac/wiki/WikiStart', 6)],
+                         self._search('welcome'))
+
+    def test_all_terms(self):
+        self.assertEqual([('/trac/wiki/Project', 8),
+                          ('/trac/wiki/WikiStart', 7)],
+                         self._search('welcome wiki'))
+        self.assertEqual([], self._search('welcome missing'))
+
+    def test_prefix(self):
+        self.assertEqual([('/trac/ticket/1', 6)], self._search('search*'))
+        self.assertEqual([('/trac/wiki/Project', 7),
+                          ('/trac/wiki/WikiStart', 6),
+                          ('/trac/ticket/1', 1)],
+                         self._search('welcome*'))
+        self.assertEqual([], self._search('searc'))
+
+    def test_filters(self):
+        self.assertEqual([('/trac/wiki/Project', 7),
+                          ('/trac/wiki/WikiStart', 6)],
+                         self._search('welcome*', filters=['wiki']))
+        self.assertEqual([], self._search('welcome', filters=['milestone']))
+
+    def test_project(self):
+        self.assertEqual([('/trac/wiki/Other', 6),
+                          ('/trac/wiki/WikiStart', 6)],
+                         self._search('welcome', project_id=2))
+        self.assertEqual(3, len(self._search('welcome', project_id=None)))
+
+    def test_permissions(self):
+        self.assertEqual([('/trac/wiki/WikiStart', 6)],
+                         self._search('welcome', denied=['Project']))
+
+    def test_limit(self):
+        self.assertEqual([('/trac/wiki/Project', 7)],
+                         self._search('welcome*', limit=1))
+        self.assertEqual([('/trac/wiki/WikiStart', 6)],
+                         self._search('welcome*', limit=1,
+                                      denied=['Project']))
+
+    def test_limit_batches(self):
+        batch_size = index.SEARCH_BATCH_SIZE
+        index.SEARCH_BATCH_SIZE = 1
+        try:
+            self.assertEqual([('/trac/wiki/WikiStart', 6),
+                              ('/trac/ticket/1', 1)],
+                             self._search('welcome*', limit=2,
+                                          denied=['Project']))
+            self.assertEqual([('/trac/ticket/1', 1)],
+                             self._search('welcome*', limit=2,
+                                          denied=['Project', 'WikiStart']))
+        finally:
+            index.SEARCH_BATCH_SIZE = batch_size
+
+    def _count(self, query, filters=('wiki', 'ticket'), denied=()):
+        req = Mock(perm=PermissionCacheStub(denied), data={'project_id': 1})
+        return self.index.count(req, query.split(), filters)
+
+    def test_count(self):
+        self.assertEqual(3, self._count('welcome*'))
+        self.assertEqual(0, self._count('missing', ['wiki']))
+
+    def test_count_permissions(self):
+        # only the documents returned by `search` are counted
+        self.assertEqual(2, self._count('welcome*', denied=['Project']))
+        self.assertEqual(1, self._count('welcome*',
+                                        denied=['Project', 'WikiStart']))
+
+    def test_rank(self):
+        from datetime import datetime
+        results = [('/a', 'Welcome', datetime(2010, 1, 1), 'joe', 'hello'),
+                   ('/b', 'Hello', datetime(2010, 1, 2), 'joe', 'welcome'),
+                   ('/c', 'Hello', datetime(2010, 1, 3), 'joe', 'welcomed')]
+        self.assertEqual([('/a', 5), ('/c', 1), ('/b', 1)],
+                         [(result[0], result[6]) for result
+                          in self.index.rank(results, ['welcome*'])])
+
+    def test_listener_updates(self):
+        page = Mock(name='New', pid=1)
+        DocumentSource.documents[('wiki', 'New', 1)] = \
+            ('New: Welcome', 'joe', 5000, '')
+        self.index.wiki_page_added(page)
+        self.assertEqual('/trac/wiki/New', self._search('new')[0][0])
+
+        DocumentSource.documents[('wiki', 'New', 1)] = \
+            ('New: Changed', 'joe', 6000, '')
+        self.index.wiki_page_changed(page, 2, None, '', 'joe', None)
+        self.assertEqual([], self._search('welcome new'))
+        self.assertEqual('/trac/wiki/New', self._search('changed')[0][0])
+
+        del DocumentSource.documents[('wiki', 'New', 1)]
+        self.index.wiki_page_deleted(page)
+        self.assertEqual([], self._search('new'))
+
+    def test_disabled(self):
+        self.env.config.set('search', 'index', 'false')
+        self.assertEqual(False, self.index.is_indexed('wiki'))
+        self.assertEqual([], self._search('welcome'))
+        page = Mock(name='New', pid=1)
+        DocumentSource.documents[('wiki', 'New', 1)] = \
+            ('New: Welcome', 'joe', 5000, '')
+        self.index.wiki_page_added(page)
+        self.env.config.set('search', 'index', 'true')
+        self.assertEqual([], self._search('new'))
+
+
+def suite():
+    return unittest.makeSuite(SearchIndexTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
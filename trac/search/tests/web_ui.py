@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from trac.core import Component, implements
+from trac.search.api import ISearchSource
+from trac.search.tests.index import DocumentSource, PermissionCacheStub
+from trac.search.web_ui import SearchModule
+from trac.search.index import SearchIndex
+from trac.test import EnvironmentStub, Mock
+from trac.util.datefmt import utc
+from trac.web.href import Href
+
+import unittest
+
+
+class AttachmentSource(Component):
+    """Search source of results which are not indexed."""
+
+    implements(ISearchSource)
+
+    def get_search_filters(self, req):
+        yield ('wiki', 'Wiki')
+
+    def get_search_results(self, req, terms, filters):
+        yield ('/trac/attachment/1', 'Welcome.txt',
+               datetime(2010, 1, 1, tzinfo=utc), 'joe', 'welcome')
+        yield ('/trac/attachment/2', 'notes.txt',
+               datetime(2010, 1, 2, tzinfo=utc), 'joe', 'Welcome here')
+
+
+class SearchModuleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub(enable=['trac.search.*', DocumentSource,
+                                           AttachmentSource])
+        DocumentSource.documents = {
+            ('wiki', 'WikiStart', None):
+                ('WikiStart: Welcome', 'joe', 1000, 'Welcome to the wiki'),
+            ('wiki', 'Project', 1):
+                ('Project: Welcome', 'joe', 2000,
+                 'The project wiki, welcome welcome'),
+            ('wiki', 'Other', 1):
+                ('Other: Hello', 'ann', 3000, 'Welcome'),
+        }
+        SearchIndex(self.env).reindex()
+        self.search = SearchModule(self.env)
+        self.req = Mock(href=Href('/trac'), perm=PermissionCacheStub(),
+                        data={'project_id': 1})
+
+    def tearDown(self):
+        DocumentSource.documents = {}
+        self.env.reset_db()
+
+    def _do_search(self, limit=None):
+        results, num_items = self.search._do_search(self.req, ['welcome'],
+                                                    ['wiki'], limit)
+        return [result[0] for result in results], num_items
+
+    def test_ranked_together(self):
+        # by score, then by date
+        self.assertEqual((['/trac/wiki/Project', '/trac/attachment/1',
+                           '/trac/wiki/WikiStart', '/trac/attachment/2',
+                           '/trac/wiki/Other'], 5),
+                         self._do_search())
+
+    def test_limit(self):
+        self.assertEqual((['/trac/wiki/Project', '/trac/attachment/1'], 5),
+                         self._do_search(2))
+        self.assertEqual((['/trac/wiki/Project', '/trac/attachment/1',
+                           '/trac/wiki/WikiStart', '/trac/attachment/2'], 5),
+                         self._do_search(4))
+
+    def test_limit_permissions(self):
+        # documents the user may not view aren't in the number of results
+        self.req.perm = PermissionCacheStub(['Project'])
+        self.assertEqual((['/trac/attachment/1'], 4), self._do_search(1))
+        self.assertEqual(4, len(self._do_search()[0]))
+
+    def test_index_disabled(self):
+        self.env.config.set('search', 'index', 'false')
+        self.assertEqual((['/trac/attachment/2', '/trac/attachment/1'], 2),
+                         self._do_search())
+
+
+def suite():
+    return unittest.makeSuite(SearchModuleTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -14,6 +14,8 @@
 #
 # Author: Jonas Borgström <jonas@edgewall.com>
 
+from heapq import merge
+from itertools import islice
 import pkg_resources
 import re
 
@@ -24,7 +26,8 @@ from trac.core import *
 from trac.mimeview import Context
 from trac.perm import IPermissionRequestor
 from trac.search.api import ISearchSource
-from trac.util.datefmt import format_datetime
+from trac.search.index import SearchIndex
+from trac.util.datefmt import format_datetime, to_utimestamp
 from trac.util.html import find_element
 from trac.util.presentation import Paginator
 from trac.util.text import quote_query_string
@@ -102,9 +105,12 @@ class SearchModule(Component):
 
             terms = self._parse_query(req, query)
             if terms:
-                results = self._do_search(req, terms, filters)
+                page = int(req.args.get('page', '1'))
+                results, num_items = self._do_search(
+                    req, terms, filters, page * self.RESULTS_PER_PAGE)
                 if results:
-                    data.update(self._prepare_results(req, filters, results))
+                    data.update(self._prepare_results(req, filters, results,
+                                                      num_items, terms))
 
         add_stylesheet(req, 'common/css/search.css')
         return 'search.html', data, None
@@ -206,17 +212,48 @@ class SearchModule(Component):
                            'Query must be at least %(num)s characters long.',
                            num=self.min_query_length))
 
-    def _do_search(self, req, terms, filters):
+    def _do_search(self, req, terms, filters, limit=None):
+        """Return the search results and their number.
+
+        When the search index is enabled, the results of the index and
+        of the other search sources are ranked alike, best first, and only
+        the `limit` best results of the index are read. Otherwise the
+        results are sorted by date, most recent first.
+        """
         results = []
         for source in self.search_sources:
             results.extend(source.get_search_results(req, terms, filters)
                            or [])
-        return sorted(results, key=lambda x: x[2], reverse=True)
+        index = SearchIndex(self.env)
+        if not index.enabled:
+            results.sort(key=lambda x: x[2], reverse=True)
+            return results, len(results)
+        indexed = index.search(req, terms, filters, limit)
+        num_items = len(results)
+        if limit and len(indexed) == limit:
+            num_items += index.count(req, terms, filters)
+        else:
+            num_items += len(indexed)
+        key = lambda result: (-result[6], -to_utimestamp(result[2]))
+        results = merge([(key(r), r) for r in indexed],
+                        [(key(r), r) for r in index.rank(results, terms)])
+        return [result for key, result in islice(results, limit)], num_items
 
-    def _prepare_results(self, req, filters, results):
+    def _prepare_results(self, req, filters, results, num_items, terms=()):
         page = int(req.args.get('page', '1'))
-        results = Paginator(results, page - 1, self.RESULTS_PER_PAGE)
+        offset = (page - 1) * self.RESULTS_PER_PAGE
+        results = Paginator(results[offset:offset + self.RESULTS_PER_PAGE],
+                            page - 1, self.RESULTS_PER_PAGE, num_items)
+        # Only load the excerpts of the indexed documents shown
+        excerpts = SearchIndex(self.env).get_excerpts(
+            [result[5] for result in results
+             if len(result) > 5 and result[5] is not None], terms)
         for idx, result in enumerate(results):
+            if len(result) > 5:
+                excerpt = result[4]
+                if result[5] is not None:
+                    excerpt = excerpts.get(result[5])
+                result = result[:4] + (excerpt,)
             results[idx] = {'href': result[0], 'title': result[1],
                             'date': format_datetime(result[2]),
                             'author': result[3], 'excerpt': result[4]}
@@ -113,6 +113,9 @@ class MockPerm(object):
         pass
     assert_permission = require
 
+    def filter(self, action, resources):
+        return list(resources)
+
 
 class TestSetup(unittest.TestSuite):
     """
@@ -274,6 +277,8 @@ class EnvironmentStub(Environment):
         load_workflow_config_snippet(self.config, 'basic-workflow.ini')
         self.config.set('logging', 'log_level', 'DEBUG')
         self.config.set('logging', 'log_type', 'stderr')
+        # Update ticket evaluation values synchronously
+        self.config.set('evaluation', 'ticket_updates', 'immediate')
         if enable is not None:
             self.config.set('components', 'trac.*', 'disabled')
         for name_or_class in enable or ():
@@ -428,8 +433,11 @@ def suite():
     import trac.tests
     import trac.admin.tests
     import trac.db.tests
+    import trac.evaluation.tests
     import trac.mimeview.tests
+    import trac.search.tests
     import trac.ticket.tests
+    import trac.timeline.tests
     import trac.util.tests
     import trac.versioncontrol.tests
     import trac.versioncontrol.web_ui.tests
@@ -443,8 +451,11 @@ def suite():
         suite.addTest(trac.tests.functionalSuite())
     suite.addTest(trac.admin.tests.suite())
     suite.addTest(trac.db.tests.suite())
+    suite.addTest(trac.evaluation.tests.suite())
     suite.addTest(trac.mimeview.tests.suite())
+    suite.addTest(trac.search.tests.suite())
     suite.addTest(trac.ticket.tests.suite())
+    suite.addTest(trac.timeline.tests.suite())
     suite.addTest(trac.util.tests.suite())
     suite.addTest(trac.versioncontrol.tests.suite())
     suite.addTest(trac.versioncontrol.web_ui.tests.suite())
@@ -571,6 +571,23 @@ class ConfigurationSwitcherTestCase(unittest.TestCase):
         self.assertEquals('zzz', foo.option_c.syllabus(self.syllabus_id))
         self.assertEquals('z',   foo.option_c.project(self.project_id))
 
+    def test_preload(self):
+        warnings = []
+        self.env.log = Mock(warning=lambda *args: warnings.append(args))
+        # a broken project file must not prevent preloading the others
+        broken = os.path.join(self.tmpdir, 'project', 'id71.ini')
+        fileobj = open(broken, 'w')
+        try:
+            fileobj.write('option without section\n')
+        finally:
+            fileobj.close()
+        self.env.configs.preload()
+        cache = self.env.conf_switcher_cache
+        self.assertEquals([self.syllabus_id], cache['syllabus'].keys())
+        self.assertEquals([self.project_id], cache['project'].keys())
+        self.assertEquals(1, len(warnings))
+        self.assertEquals(broken, warnings[0][1])
+
 
 def suite():
     suite = unittest.TestSuite()
@@ -1,5 +1,6 @@
 from trac import perm
 from trac.core import *
+from trac.resource import Resource
 from trac.test import EnvironmentStub
 
 import unittest
@@ -76,6 +77,30 @@ class DefaultPermissionStoreTestCase(unittest.TestCase):
         for res in self.store.get_all_permissions():
             self.failIf(res not in expected)
 
+    def test_project_permissions(self):
+        db = self.env.get_db_cnx()
+        cursor = db.cursor()
+        cursor.executemany("INSERT INTO project_permissions "
+                           "(project_id, username, action) VALUES (%s,%s,%s)", [
+                           (1, 'john', 'WIKI_MODIFY'), (1, 'john', 'dev'),
+                           (1, 'dev', 'REPORT_ADMIN'), (2, 'kate', 'dev')])
+        self.assertEquals(['WIKI_MODIFY'],
+                          self.store.get_user_permissions('john', 1, inherit=False))
+        self.assertEquals([], self.store.get_user_permissions('kate', 1, inherit=False))
+
+    def test_subjects_with_groups(self):
+        db = self.env.get_db_cnx()
+        cursor = db.cursor()
+        cursor.executemany("INSERT INTO permission VALUES (%s,%s)", [
+                           ('dev', 'WIKI_MODIFY'), ('john', 'dev')])
+        cursor.executemany("INSERT INTO project_permissions "
+                           "(project_id, username, action) VALUES (%s,%s,%s)", [
+                           (1, 'kate', 'dev'), (2, 'jane', 'dev')])
+        self.assertEquals(['john'],
+                          sorted(self.store.get_subjects_with_groups(['dev'])))
+        self.assertEquals(['john', 'kate'],
+                          sorted(self.store.get_subjects_with_groups(['dev'], 1)))
+
 
 class TestPermissionRequestor(Component):
     implements(perm.IPermissionRequestor)
@@ -191,6 +216,15 @@ class PermissionCacheTestCase(unittest.TestCase):
         # Using cached GRANT here (from shared cache)
         perm2.assert_permission('TEST_ADMIN')
 
+    def test_filter(self):
+        tickets = [Resource('ticket', 1), Resource('ticket', 2)]
+        self.assertEqual(tickets, self.perm.filter('TEST_ADMIN', tickets))
+        self.assertEqual([], self.perm.filter('TRAC_ADMIN', tickets))
+        self.perm_system.revoke_permission('testuser', 'TEST_ADMIN')
+        # Using cached GRANT here (filled by filter)
+        self.assertEqual(True, 'TEST_ADMIN' in self.perm('ticket', 2))
+        self.assertEqual(tickets[:1], self.perm.filter('TEST_ADMIN', tickets[:1]))
+
 
 class TestPermissionPolicy(Component):
     implements(perm.IPermissionPolicy)
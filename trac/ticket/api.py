@@ -18,6 +18,7 @@
 import copy
 import re
 import threading
+from collections import OrderedDict
 from datetime import date, datetime
 
 from genshi.builder import tag
@@ -31,7 +32,7 @@ from trac.util import Ranges
 from trac.util.datefmt import from_utimestamp, parse_date_only, to_utimestamp,\
                             format_date, utc
 from trac.util.text import shorten_line
-from trac.util.translation import _, N_, gettext
+from trac.util.translation import _, N_, gettext, get_active_locale_key
 from trac.wiki import IWikiSyntaxProvider, WikiParser
 
 from trac.project.api import ProjectManagement
@@ -243,6 +244,65 @@ class IMilestoneChangeListener(Interface):
         """Called when a milestone is deleted."""
 
 
+class FrozenTicketField(dict):
+    """Read-only ticket field of `TicketFieldSet`.
+
+    Copies of the field (`copy.copy`, `copy.deepcopy`, `mutable`)
+    are ordinary dicts.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('Ticket field is read-only, use a copy to change it')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = \
+    update = _readonly
+
+    def mutable(self):
+        """Return mutable copy of the field. List values are copied too."""
+        return dict((k, list(v) if isinstance(v, list) else v)
+                    for k, v in self.iteritems())
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+class TicketFieldSet(OrderedDict):
+    """Read-only ordered map {<field name>: <`FrozenTicketField`>, ...}
+    with localized field labels.
+
+    Field sets are shared between callers, use `copy` to get
+    mutable fields.
+    """
+
+    def __init__(self, fields=()):
+        OrderedDict.__init__(self)
+        for name, field in fields:
+            OrderedDict.__setitem__(self, name, FrozenTicketField(field))
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError('Ticket field set is read-only, use copy() to change it')
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = \
+    update = _readonly
+
+    def copy(self):
+        """Return mutable copy of the fields as `OrderedDict`."""
+        return OrderedDict((name, field.mutable())
+                           for name, field in self.iteritems())
+
+    def __copy__(self):
+        return self.copy()
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+
 class TicketFieldsStore(object):
     """Project/syllabus dependent store for ticket fields.
 
@@ -565,6 +625,9 @@ class TicketSystem(Component):
         from trac.ticket.default_workflow import ConfigurableTicketWorkflow
         self.workflow = ConfigurableTicketWorkflow(self.env)
         self.pm = ProjectManagement(self.env)
+        # {(fields cache id, locale key): (fields, TicketFieldSet)}
+        self._field_sets = {}
+        self._field_sets_lock = threading.Lock()
 
     # Public API
 
@@ -584,7 +647,7 @@ class TicketSystem(Component):
     def get_ticket_field_labels(self, pid=None, syllabus_id=None):
         """Produce a (name,label) mapping from `get_ticket_fields`."""
         labels = dict((n, f['label'])
-                      for n, f in TicketSystem(self.env).get_ticket_fields(
+                      for n, f in TicketSystem(self.env).get_ticket_field_set(
                                 pid=pid, syllabus_id=syllabus_id).iteritems())
         labels['attachment'] = _("Attachment")
         return labels
@@ -596,13 +659,35 @@ class TicketSystem(Component):
         and 'type' keys.
         It may in addition contain the 'custom' key, the 'optional' and the
         'options' keys. When present 'custom' and 'optional' are always `True`.
+
+        Returned fields are a mutable copy, use `get_ticket_field_set`
+        if fields are only read.
+        """
+        return self.get_ticket_field_set(pid, syllabus_id).copy()
+
+    def get_ticket_field_set(self, pid=None, syllabus_id=None):
+        """Returns read-only `TicketFieldSet` of fields available for tickets
+        (see `get_ticket_fields`).
+
+        Field set is built once per fields cache generation and locale
+        and then returned to all callers without copying.
         """
         stor = TicketFieldsStore(self.env, pid=pid, syllabus_id=syllabus_id, ts=self, pm=self.pm)
-        fields = copy.deepcopy(stor.fields)
+        fields = stor.fields
+        locale_key = get_active_locale_key()
+        key = (stor._cache_fields, locale_key)
+        with self._field_sets_lock:
+            entry = self._field_sets.get(key)
+        if entry is not None and entry[0] is fields:
+            return entry[1]
         label = 'label' # workaround gettext extraction bug
-        for n, f in fields.iteritems():
-            f[label] = gettext(f[label])
-        return fields
+        field_set = TicketFieldSet((n, dict(f, label=gettext(f[label])))
+                                   for n, f in fields.iteritems())
+        if locale_key is not None:
+            # labels are lazy proxies when translations are not active
+            with self._field_sets_lock:
+                self._field_sets[key] = (fields, field_set)
+        return field_set
 
     def reset_ticket_fields(self, pid=None, syllabus_id=None):
         """Invalidate ticket field cache."""
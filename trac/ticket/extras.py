@@ -1,7 +1,6 @@
-from trac.core import implements, Component, TracError
+from trac.core import implements, Component
 from trac.perm import IPermissionRequestor, IPermissionPolicy
 from trac.ticket.api import ITicketManipulator
-from trac.ticket.model import Ticket
 from trac.config import ListOption, IntOption
 from trac.util.translation import _
 
@@ -96,15 +95,49 @@ class VirtualTicketPermissionsPolicy(Component):
             # In this case, checking makes no sense
             return True
 
-        # Look up the resource parentage for a ticket.
-        while resource:
-            if resource.realm == 'ticket':
-                break
-            resource = resource.parent
-        if resource and resource.realm == 'ticket' and resource.id is not None:
+        resource = self._get_ticket_resource(resource)
+        if resource is not None:
             return self._check_ticket_permissions(action, perm, resource)
         return None
 
+    def check_permissions(self, action, username, resources, perm, req):
+        decisions = [None] * len(resources)
+        if username == 'anonymous' or \
+           not action in self.virtual_permissions:
+            return decisions
+
+        # Same decisions as `check_permission`: TRAC_ADMIN on any
+        # resource allows the action
+        admin = set(perm.filter('TRAC_ADMIN',
+                                [r for r in resources if r is not None]))
+        tickets = {}
+        for i, resource in enumerate(resources):
+            if resource is None:
+                if 'TRAC_ADMIN' in perm:
+                    decisions[i] = True
+                continue
+            if resource in admin:
+                decisions[i] = True
+                continue
+            resource = self._get_ticket_resource(resource)
+            if resource is not None:
+                tickets.setdefault(resource, []).append(i)
+        ids = set(self._get_ticket_id(resource) for resource in tickets)
+        ids.discard(None)
+        if not ids:
+            return decisions
+
+        values = self._get_tickets_values(ids)
+        for resource, indexes in tickets.iteritems():
+            tkt_id = self._get_ticket_id(resource)
+            if tkt_id not in values:
+                continue
+            owner, reporter, cc = values[tkt_id]
+            decision = self._decide(action, username, owner, reporter, cc)
+            for i in indexes:
+                decisions[i] = decision
+        return decisions
+
     # IPermissionRequestor
 
     def get_permission_actions(self):
@@ -112,22 +145,52 @@ class VirtualTicketPermissionsPolicy(Component):
 
     # Internal methods
 
+    def _get_ticket_resource(self, resource):
+        """Look up the resource parentage for a ticket."""
+        while resource:
+            if resource.realm == 'ticket':
+                break
+            resource = resource.parent
+        if resource and resource.realm == 'ticket' and resource.id is not None:
+            return resource
+        return None
+
+    def _get_ticket_id(self, resource):
+        try:
+            return int(resource.id)
+        except ValueError:
+            return None
+
     def _check_ticket_permissions(self, action, perm, res):
         """Return if this req is generating permissions for the given ticket."""
-        try:
-            tkt = Ticket(self.env, res.id)
-        except TracError:
+        tkt_id = self._get_ticket_id(res)
+        values = tkt_id is not None and self._get_tickets_values([tkt_id])
+        if not values:
             return None # Ticket doesn't exist
+        owner, reporter, cc = values[tkt_id]
+        return self._decide(action, perm.username, owner, reporter, cc)
+
+    def _get_tickets_values(self, ids):
+        """Return `{id: (owner, reporter, cc)}` for the existing tickets."""
+        ids = list(ids)
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        cursor.execute('SELECT id, owner, reporter, cc FROM ticket '
+                       'WHERE id IN ({0})'.format(','.join(['%s'] * len(ids))),
+                       ids)
+        return dict((id, (owner, reporter, cc))
+                    for id, owner, reporter, cc in cursor)
 
+    def _decide(self, action, username, owner, reporter, cc):
         if action == 'TICKET_IS_OWNER':
-            return perm.username == tkt['owner']
+            return username == owner
 
         if action == 'TICKET_IS_NOT_OWNER':
-            return perm.username != tkt['owner']
+            return username != owner
 
         if action == 'TICKET_IS_REPORTER':
-            return tkt['reporter'] == perm.username
+            return reporter == username
 
         if action == 'TICKET_IS_CC':
-            return perm.username in [x.strip() for x in tkt['cc'].split(',')]
+            return username in [x.strip() for x in (cc or '').split(',')]
 
@@ -219,7 +219,7 @@ class TicketFieldFilters(Component):
                         res.append(f)
                         break
         if with_labels:
-            fs = TicketSystem(self.env).get_ticket_fields(syllabus_id=syllabus_id)
+            fs = TicketSystem(self.env).get_ticket_field_set(syllabus_id=syllabus_id)
             res = [(r, fs[r]['label']) for r in res]
         return res
 
@@ -15,22 +15,33 @@
 #
 # Author: Christopher Lenz <cmlenz@gmx.de>
 
+import base64
 import csv
-from itertools import groupby
+import logging
+from itertools import groupby, islice
 from math import ceil
 from datetime import datetime, timedelta
 import re
 from StringIO import StringIO
 from collections import OrderedDict
+import threading
+from time import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
 
 from genshi.builder import tag
 
-from trac.config import Option, IntOption 
+from trac.cache import CacheManager
+from trac.config import Option, IntOption, BoolOption
 from trac.core import *
 from trac.db import get_column_names
 from trac.mimeview.api import Mimeview, IContentConverter, Context
 from trac.resource import Resource
-from trac.ticket.api import TicketSystem, convert_field_value
+from trac.ticket.api import TicketSystem, ITicketChangeListener, \
+                           convert_field_value
 from trac.util import Ranges, as_bool, as_int
 from trac.util.datefmt import format_datetime, from_utimestamp, parse_date, \
                               to_timestamp, to_utimestamp, utc, parse_date_only
@@ -48,6 +59,14 @@ from trac.wiki.macros import WikiMacroBase # TODO: should be moved in .api
 
 from trac.project.api import ProjectManagement
 
+# SQL types of the custom fields values, which are stored as text
+_custom_casts = {
+    'int': 'INTEGER',
+    'float': 'NUMERIC',
+    'date': 'DATE',
+}
+
+
 class QuerySyntaxError(TracError):
     """Exception raised when a ticket query cannot be parsed from a string."""
 
@@ -66,7 +85,8 @@ class Query(object):
     def __init__(self, env, report=None, constraints=None, cols=None,
                  order=None, desc=0, group=None, groupdesc=0, verbose=0,
                  rows=None, page=None, max=None, format=None,
-                 area='project', project=None, group_id=None, syllabus=None):
+                 area='project', project=None, group_id=None, syllabus=None,
+                 after=None):
         self.env = env
         self.id = report # if not None, it's the corresponding saved query
         self.area = area
@@ -100,6 +120,7 @@ class Query(object):
         self.format = format
         self.default_page = 1
         self.items_per_page = QueryModule(self.env).items_per_page
+        self.next_after = None
 
         # getting page number (default_page if unspecified)
         if not page:
@@ -133,6 +154,14 @@ class Query(object):
             self.has_more_pages = True
             self.offset = self.max * (self.page - 1)
 
+        # keyset pagination: pages are sorted by the whole sort key and
+        # a page following the shown one is selected by the key of its
+        # last ticket (`after`) instead of skipping `offset` tickets
+        self.keyset = self.max and QueryModule(self.env).keyset_pagination
+        self.after = None
+        if self.keyset and after and self.page > 1:
+            self.after = self._decode_sort_key(after)
+
         if rows == None:
             rows = []
         if verbose and 'description' not in rows: # 0.10 compatibility
@@ -190,7 +219,7 @@ class Query(object):
     
     @classmethod
     def from_string(cls, env, string, **kw):
-        kw_strs = ['order', 'group', 'page', 'max', 'format', 'area']
+        kw_strs = ['order', 'group', 'page', 'max', 'format', 'area', 'after']
         kw_arys = ['rows']
         kw_bools = ['desc', 'groupdesc', 'verbose']
         kw_ints = ['project', 'group_id', 'syllabus']
@@ -329,6 +358,14 @@ class Query(object):
         return self._count(sql, args)
 
     def _count(self, sql, args, db=None):
+        qm = QueryModule(self.env)
+        key = qm.get_count_key(self.area == 'project' and self.pid or None,
+                               sql, args)
+        cnt = qm.get_cached_count(key)
+        if cnt is not None:
+            self.env.log.debug("Count results in Query (cached): %d" % cnt)
+            return cnt
+
         if not db:
             db = self.env.get_db_cnx()
         cursor = db.cursor()
@@ -346,6 +383,7 @@ class Query(object):
         for cnt, in cursor:
             break
         self.env.log.debug("Count results in Query: %d" % cnt)
+        qm.set_cached_count(key, cnt)
         return cnt
 
     def execute(self, req=None, db=None, cached_ids=None, authname=None,
@@ -367,26 +405,99 @@ class Query(object):
             max = self.max
             if self.group:
                 max += 1
-            sql = sql + " LIMIT %d OFFSET %d" % (max, self.offset)
+            sql, args = self._paginate_sql(sql, args, max, req, cached_ids,
+                                           authname, tzinfo)
             if (self.page > int(ceil(float(self.num_items) / self.max)) and
                 self.num_items != 0):
                 raise TracError(_('Page %(page)s is beyond the number of '
                                   'pages in the query', page=self.page))
 
-        self.env.log.debug("Query SQL: " + sql % tuple([repr(a) for a in args]))     
+        if self.env.log.isEnabledFor(logging.DEBUG):
+            self.env.log.debug("Query SQL: " + sql %
+                               tuple([repr(a) for a in args]))
         try:
             cursor.execute(sql, args)
         except:
             db.rollback()
             raise
-        columns = get_column_names(cursor)
-        fields = []
-        for column in columns:
-            fields.append(self.fields.get(column))
+        convert_row = self._get_row_converter(get_column_names(cursor), href)
         results = []
+        sort_keys = []
+        for row in cursor:
+            result, sort_key = convert_row(row)
+            results.append(result)
+            sort_keys.append(sort_key)
+        cursor.close()
 
+        if sort_keys and sort_keys[0] is not None and self.has_more_pages \
+                and self.page * self.max < self.num_items:
+            last = sort_keys[min(len(sort_keys), self.max) - 1]
+            self.next_after = self._encode_sort_key(last)
+        return results
+
+    def execute_iter(self, req=None, db=None, cached_ids=None, authname=None,
+                     tzinfo=None, href=None):
+        """Return an iterator over the results of the query.
+
+        Unlike `execute`, tickets are not counted and rows are converted
+        one at a time while iterating. The rows are read through a
+        server-side cursor if the database supports it, so that memory use
+        doesn't depend on the number of tickets.
+        """
+        if req is not None:
+            href = req.href
+        if not db:
+            db = self.env.get_read_db()
+        sql, args = self.get_sql(req, cached_ids, authname, tzinfo)
+        if self.has_more_pages:
+            sql, args = self._paginate_sql(sql, args, self.max, req,
+                                           cached_ids, authname, tzinfo)
+        cursor_factory = getattr(db, 'server_cursor', None) or db.cursor
+
+        if self.env.log.isEnabledFor(logging.DEBUG):
+            self.env.log.debug("Query SQL: " + sql %
+                               tuple([repr(a) for a in args]))
+        cursor = cursor_factory()
+        try:
+            try:
+                cursor.execute(sql, args)
+                rows = iter(cursor)
+                # server-side cursors describe columns after the first fetch
+                first = next(rows, None)
+            except:
+                db.rollback()
+                raise
+            if first is None:
+                return
+            convert_row = self._get_row_converter(get_column_names(cursor),
+                                                  href)
+            yield convert_row(first)[0]
+            for row in rows:
+                yield convert_row(row)[0]
+        finally:
+            cursor.close()
+
+    def _paginate_sql(self, sql, args, max, req, cached_ids, authname,
+                      tzinfo):
+        if self.keyset and self.after is not None and \
+                len(self.after) == self._sort_key_size:
+            sql, args = self.get_sql(req, cached_ids, authname, tzinfo,
+                                     after=self.after)
+            return sql + " LIMIT %d" % max, args
+        return sql + " LIMIT %d OFFSET %d" % (max, self.offset), args
+
+    def _get_row_converter(self, columns, href):
+        """Return a function converting a result row to a `(result,
+        sort_key)` tuple, `sort_key` is `None` without keyset pagination."""
+        fields = [self.fields.get(column) for column in columns]
         column_indices = range(len(columns))
-        for row in cursor:
+        key_indices = [i for i in column_indices
+                       if columns[i].startswith('_key')]
+        if key_indices:
+            column_indices = column_indices[:key_indices[0]] + \
+                             column_indices[key_indices[-1] + 1:]
+
+        def convert_row(row):
             result = {}
             for i in column_indices:
                 name, field, val = columns[i], fields[i], row[i]
@@ -399,12 +510,28 @@ class Query(object):
                 else:
                     val = convert_field_value(field, val)
                 result[name] = val
-            results.append(result)
-        cursor.close()
-        return results
+            sort_key = None
+            if key_indices:
+                sort_key = [row[i] for i in key_indices]
+            return result, sort_key
+        return convert_row
+
+    def _encode_sort_key(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values))
+
+    def _decode_sort_key(self, token):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(str(token)))
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(values, list) or \
+                not all(isinstance(v, (int, long, float, basestring))
+                        for v in values):
+            return None
+        return values
 
     def get_href(self, href, id=None, order=None, desc=None, format=None,
-                 max=None, page=None):
+                 max=None, page=None, after=None):
         """Create a link corresponding to this query.
 
         :param href: the `Href` object used to build the URL
@@ -415,6 +542,8 @@ class Query(object):
         :param max: optionally override the max items per page
         :param page: optionally specify which page of results (defaults to
                      the first)
+        :param after: optionally specify the sort key of the last ticket
+                      of the previous page (see `next_after`)
 
         Note: `get_resource_url` of a 'query' resource?
         """
@@ -470,6 +599,7 @@ class Query(object):
                           row=self.rows,
                           max=max,
                           page=page,
+                          after=after,
                           format=format,
                           **extra)
 
@@ -483,15 +613,19 @@ class Query(object):
         query_string = query_string.split('?', 1)[-1]
         return 'query:?' + query_string.replace('&', '\n&\n')
 
-    def get_sql(self, req=None, cached_ids=None, authname=None, tzinfo=None):
-        """Return a (sql, params) tuple for the query."""
+    def get_sql(self, req=None, cached_ids=None, authname=None, tzinfo=None,
+                after=None):
+        """Return a (sql, params) tuple for the query.
+
+        If `after` sort key is given, only tickets following it are
+        selected (keyset pagination).
+        """
         if req is not None:
             authname = req.authname
             tzinfo = req.tz
         self.get_columns()
         db = self.env.get_db_cnx()
 
-        enum_columns = ('resolution', 'priority', 'severity')
         # Build the list of actual columns to query
         cols = self.cols[:]
         def add_cols(*args):
@@ -507,34 +641,10 @@ class Query(object):
 
         custom_fields = [n for n, f in self.fields.iteritems() if 'custom' in f]
 
-        sql = []
-        args = []
-        sql.append("SELECT " + ",".join(['t.%s AS %s' % (c, c) for c in cols
-                                         if c not in custom_fields]))
-        sql.append(",priority.value AS priority_value")
-        for k in [db.quote(k) for k in cols if k in custom_fields]:
-            sql.append(",%s.value AS %s" % (k, k))
-        sql.append("\nFROM ticket AS t")
-
-        # Join with ticket_custom table as necessary
-        for k in [k for k in cols if k in custom_fields]:
-            qk = db.quote(k)
-            sql.append("\n  LEFT OUTER JOIN ticket_custom AS %s ON " \
-                       "(id=%s.ticket AND %s.name='%s')" % (qk, qk, qk, k))
-
-        # Join with the enum table for proper sorting
-        for col in [c for c in enum_columns
-                    if c == self.order or c == self.group or c == 'priority']:
-            sql.append("\n  LEFT OUTER JOIN enum_syllabus AS %s ON "
-                       "(%s.type='%s' AND %s.name=%s AND %s.syllabus_id=%%s)"
-                       % (col, col, col, col, col, col))
-            args.append(self.syllabus_id)
-
-        # Join with the version/milestone tables for proper sorting
-        for col in [c for c in ['milestone', 'version']
-                    if c == self.order or c == self.group]:
-            sql.append("\n  LEFT OUTER JOIN %s ON (%s.name=%s AND %s.project_id=t.project_id)"
-                       % (col, col, col, col))
+        select, from_, enum_joins, order, sort_key = \
+            self._get_sql_plan(db, cols, custom_fields)
+        sql = [select, from_]
+        args = [self.syllabus_id] * enum_joins
 
         def get_timestamp(date):
             if date:
@@ -564,12 +674,6 @@ class Query(object):
             '>~': '>=',
             '<~': '<='
         }
-        map_cast = {
-            'int': 'INTEGER',
-            'float': 'NUMERIC',
-            'date': 'DATE',
-        }
-
         def get_constraint_sql(name, value, mode, neg):
             value = value[len(mode) + neg:]
             field = self.all_fields[name]
@@ -578,7 +682,7 @@ class Query(object):
             custom = field.get('custom')
 
             if custom:
-                col = '%s.value' % db.quote(name)
+                col = self._custom_col(db, name)
             else:
                 col = 't.' + name
 
@@ -648,8 +752,8 @@ class Query(object):
 
             op = None
             if type_ in ('int', 'float'):
-                if custom and type_ in map_cast:
-                    col = db.cast(col, map_cast[type_])
+                if custom and type_ in _custom_casts:
+                    col = db.cast(col, _custom_casts[type_])
                 if mode in _map_compare_op:
                     if neg:
                         neg = False
@@ -725,7 +829,7 @@ class Query(object):
                     if k not in custom_fields:
                         col = 't.' + k
                     else:
-                        col = '%s.value' % db.quote(k)
+                        col = self._custom_col(db, k)
                     # for group area query
                     if k == 'project_id':
                         clauses.append('%s IN %%s' % col)
@@ -753,17 +857,114 @@ class Query(object):
 
         errors = []
         clauses = filter(None, (get_clause_sql(c) for c in self.constraints))
+        where = []
         if clauses:
-            sql.append("\nWHERE ")
-            sql.append(" OR ".join('(%s)' % c for c in clauses))
+            where.append(" OR ".join('(%s)' % c for c in clauses))
             if cached_ids:
-                sql.append(" OR ")
-                sql.append("id in (%s)" %
-                           (','.join([str(id) for id in cached_ids])))
-            
-        sql.append("\nORDER BY ")
+                where.append("id in (%s)" %
+                             (','.join([str(id) for id in cached_ids])))
+        where = " OR ".join(where)
+
+        self._sort_key_size = len(sort_key)
+
+        if self.keyset:
+            # select the sort key of every ticket for the next page link
+            sql[1:1] = [",%s AS _key%d" % (expr, i)
+                        for i, (expr, _) in enumerate(sort_key)]
+            if after is not None:
+                seek = []
+                for i, (expr, is_desc) in enumerate(sort_key):
+                    terms = ['%s=%%s' % e for e, _ in sort_key[:i]]
+                    terms.append('%s%s%%s' % (expr, is_desc and '<' or '>'))
+                    seek.append('(%s)' % ' AND '.join(terms))
+                    args.extend(after[:i + 1])
+                seek = ' OR '.join(seek)
+                where = where and '(%s) AND (%s)' % (where, seek) or seek
+        if where:
+            sql.append("\nWHERE " + where)
+        if QueryModule(self.env).keyset_pagination:
+            # order unpaged queries by the sort key too, so that they list
+            # the tickets in the order of the pages (empty and NULL values
+            # are equal in the sort key, unlike in `order`)
+            sql.append("\nORDER BY ")
+            sql.append(",".join('%s%s' % (expr, is_desc and ' DESC' or '')
+                                for expr, is_desc in sort_key))
+        else:
+            sql.append("\nORDER BY " + order)
+
+        if errors:
+            raise QueryValueError(errors)
+        return "".join(sql), args
+
+    def _get_sql_plan(self, db, cols, custom_fields):
+        """Return the `(select, from, enum_joins, order, sort_key)` parts of
+        the query SQL.
+
+        These parts only depend on the columns, the ordering and the ticket
+        fields, not on the constraint values, so they are built once and
+        shared by all the queries of the same shape. `enum_joins` is the
+        number of syllabus parameters expected by `from`.
+        """
+        sort_fields = [self.all_fields[name] for name in (self.order, self.group)
+                       if name]
+        key = (self.area, tuple(cols),
+               tuple([c for c in cols if c in custom_fields]),
+               self.order, bool(self.desc), self.group, bool(self.groupdesc),
+               tuple([(f['type'], 'custom' in f) for f in sort_fields]))
+        qm = QueryModule(self.env)
+        plan = qm.get_sql_plan(key)
+        if plan is None:
+            plan = self._build_sql_plan(db, cols, custom_fields)
+            qm.set_sql_plan(key, plan)
+        return plan
+
+    def _build_sql_plan(self, db, cols, custom_fields):
+        enum_columns = ('resolution', 'priority', 'severity')
+        custom_cols = [k for k in cols if k in custom_fields]
+
+        sql = []
+        sql.append("SELECT " + ",".join(['t.%s AS %s' % (c, c) for c in cols
+                                         if c not in custom_fields]))
+        sql.append(",priority.value AS priority_value")
+        for k in custom_cols:
+            sql.append(",%s AS %s" % (self._custom_col(db, k), db.quote(k)))
+        select = "".join(sql)
+
+        sql = ["\nFROM ticket AS t"]
+        # Join with the ticket_custom table pivoted to one row per ticket,
+        # instead of joining it once per custom field
+        if custom_cols:
+            sql.append("\n  LEFT OUTER JOIN (SELECT ticket,%s"
+                       "\n    FROM ticket_custom WHERE name IN (%s)"
+                       "\n    GROUP BY ticket) AS tc ON (tc.ticket=t.id)"
+                       % (",".join(["MAX(CASE WHEN name='%s' THEN value END)"
+                                    " AS %s" % (k, db.quote(k))
+                                    for k in custom_cols]),
+                          ",".join(["'%s'" % k for k in custom_cols])))
+
+        # Join with the enum table for proper sorting
+        enum_joins = 0
+        for col in [c for c in enum_columns
+                    if c == self.order or c == self.group or c == 'priority']:
+            sql.append("\n  LEFT OUTER JOIN enum_syllabus AS %s ON "
+                       "(%s.type='%s' AND %s.name=%s AND %s.syllabus_id=%%s)"
+                       % (col, col, col, col, col, col))
+            enum_joins += 1
+
+        # Join with the version/milestone tables for proper sorting
+        for col in [c for c in ['milestone', 'version']
+                    if c == self.order or c == self.group]:
+            sql.append("\n  LEFT OUTER JOIN %s ON (%s.name=%s AND %s.project_id=t.project_id)"
+                       % (col, col, col, col))
+        from_ = "".join(sql)
+
+        # ORDER BY and the equivalent list of (expression, desc) terms
+        # without NULLs, used for keyset pagination
+        order = []
+        sort_key = []
         if self.area == 'group':
-            sql.append('t.project_id, ')
+            order.append('t.project_id, ')
+            sort_key.append(('t.project_id', False))
         order_cols = [(self.order, self.desc)]
         if self.group and self.group != self.order:
             order_cols.insert(0, (self.group, self.groupdesc))
@@ -773,42 +974,65 @@ class Query(object):
                 col = name + '.value'
                 desc = not desc
             elif name in custom_fields:
-                col = '%s.value' % db.quote(name)
+                col = self._custom_col(db, name)
             else:
                 col = 't.' + name
+            is_desc = bool(desc)
             desc = desc and ' DESC' or ''
 
             field = self.all_fields[name]
             type_ = field['type']
             custom = field.get('custom')
             if type_ in ('id', 'int', 'float', 'time'):
-                if custom and type_ in map_cast:
-                    col = db.cast(col, map_cast[type_])
-                sql.append("COALESCE(%s,0)=0%s," % (col, desc))
+                if custom and type_ in _custom_casts:
+                    col = db.cast(col, _custom_casts[type_])
+                order.append("COALESCE(%s,0)=0%s," % (col, desc))
+                sort_key.append(("CASE WHEN COALESCE(%s,0)=0 THEN 1 ELSE 0 END"
+                                 % col, is_desc))
+                empty_value = '0'
             else:
-                sql.append("COALESCE(%s,'')=''%s," % (col, desc))
+                order.append("COALESCE(%s,'')=''%s," % (col, desc))
+                sort_key.append(("CASE WHEN COALESCE(%s,'')='' THEN 1 ELSE 0 END"
+                                 % col, is_desc))
+                empty_value = "''"
             if name in enum_columns:
                 # These values must be compared as ints, not as strings
-                db = self.env.get_db_cnx()
-                sql.append(db.cast(col, 'int') + desc)
+                order.append(db.cast(col, 'int') + desc)
+                sort_key.append(("COALESCE(%s,0)" % db.cast(col, 'int'), is_desc))
             elif name == 'milestone':
-                sql.append("COALESCE(milestone.completed,0)=0%s,"
-                           "milestone.completed%s,"
-                           "COALESCE(milestone.due,0)=0%s,milestone.due%s,"
-                           "%s%s" % (desc, desc, desc, desc, col, desc))
+                order.append("COALESCE(milestone.completed,0)=0%s,"
+                             "milestone.completed%s,"
+                             "COALESCE(milestone.due,0)=0%s,milestone.due%s,"
+                             "%s%s" % (desc, desc, desc, desc, col, desc))
+                sort_key.extend([
+                    ("CASE WHEN COALESCE(milestone.completed,0)=0 "
+                     "THEN 1 ELSE 0 END", is_desc),
+                    ("COALESCE(milestone.completed,0)", is_desc),
+                    ("CASE WHEN COALESCE(milestone.due,0)=0 "
+                     "THEN 1 ELSE 0 END", is_desc),
+                    ("COALESCE(milestone.due,0)", is_desc),
+                    ("COALESCE(%s,'')" % col, is_desc)])
             elif name == 'version':
-                sql.append("COALESCE(version.time,0)=0%s,version.time%s,%s%s"
-                           % (desc, desc, col, desc))
+                order.append("COALESCE(version.time,0)=0%s,version.time%s,%s%s"
+                             % (desc, desc, col, desc))
+                sort_key.extend([
+                    ("CASE WHEN COALESCE(version.time,0)=0 "
+                     "THEN 1 ELSE 0 END", is_desc),
+                    ("COALESCE(version.time,0)", is_desc),
+                    ("COALESCE(%s,'')" % col, is_desc)])
             else:
-                sql.append("%s%s" % (col, desc))
+                order.append("%s%s" % (col, desc))
+                sort_key.append(("COALESCE(%s,%s)" % (col, empty_value), is_desc))
             if name == self.group and not name == self.order:
-                sql.append(",")
+                order.append(",")
         if self.order != 'id':
-            sql.append(",t.id")  
+            order.append(",t.id")
+        sort_key.append(('t.id', False))
+        return select, from_, enum_joins, "".join(order), tuple(sort_key)
 
-        if errors:
-            raise QueryValueError(errors)
-        return "".join(sql), args
+    @staticmethod
+    def _custom_col(db, name):
+        return 'tc.%s' % db.quote(name)
 
     @staticmethod
     def get_modes():
@@ -972,7 +1196,8 @@ class Query(object):
         if req:
             if results.has_next_page:
                 next_href = self.get_href(req.href, max=self.max, 
-                                          page=self.page + 1)
+                                          page=self.page + 1,
+                                          after=self.next_after)
                 add_link(req, 'next', next_href, _('Next Page'))
 
             if results.has_previous_page:
@@ -985,7 +1210,9 @@ class Query(object):
         pagedata = []
         shown_pages = results.get_shown_pages(21)
         for page in shown_pages:
-            pagedata.append([self.get_href(context.href, page=page), None,
+            after = page == self.page + 1 and self.next_after or None
+            pagedata.append([self.get_href(context.href, page=page,
+                                           after=after), None,
                              str(page), _('Page %(num)d', num=page)])
 
         results.shown_pages = [dict(zip(['href', 'class', 'string', 'title'],
@@ -1043,7 +1270,7 @@ class Query(object):
 class QueryModule(Component):
 
     implements(IRequestHandler, INavigationContributor, IWikiSyntaxProvider,
-               IContentConverter)
+               IContentConverter, ITicketChangeListener)
                
     default_query = Option('query', 'default_query',
         default='status!=closed&owner=$USER', 
@@ -1065,6 +1292,110 @@ class QueryModule(Component):
         """Number of tickets displayed per page in ticket queries,
         by default (''since 0.11'')""")
 
+    keyset_pagination = BoolOption('query', 'keyset_pagination', 'true',
+        """Select the next page of query results by the sort key of the
+        last ticket of the previous page instead of skipping all tickets
+        of the previous pages.""")
+
+    count_cache_ttl = IntOption('query', 'count_cache_ttl', 30,
+        """Number of seconds the number of tickets matching a query is
+        cached for paging through the results. Only counts of project
+        queries are cached; cached counts of a project are dropped in all
+        processes when one of its tickets is created, changed or deleted.
+        Set to 0 to disable.""")
+
+    # Maximum number of cached query counts
+    COUNT_CACHE_SIZE = 1000
+
+    # Maximum number of cached SQL plans
+    PLAN_CACHE_SIZE = 200
+
+    # Number of exported tickets checked for permissions at once
+    EXPORT_BATCH_SIZE = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {(project_id, generation, sql, args): (count, time)}
+        self._counts = {}
+        # {query shape: (select, from, enum_joins, order, sort_key)}
+        self._plans = {}
+
+    # ITicketChangeListener methods
+
+    def ticket_created(self, ticket):
+        self.invalidate_counts(ticket.pid)
+
+    def ticket_changed(self, ticket, comment, author, old_values):
+        self.invalidate_counts(ticket.pid)
+
+    def ticket_deleted(self, ticket):
+        self.invalidate_counts(ticket.pid)
+
+    # Query counts cache
+
+    def get_count_key(self, project_id, sql, args):
+        """Return the key of the number of tickets of a query of the
+        project in the counts cache or `None` if it can't be cached.
+
+        The key includes the current generation of the project counts,
+        so counts computed before an invalidation are never returned.
+        """
+        if project_id is None or self.count_cache_ttl <= 0:
+            return None
+        generation = CacheManager(self.env).get_generation(
+                                        self._counts_cache_id(project_id))
+        return (project_id, generation, sql, tuple(args))
+
+    def get_cached_count(self, key):
+        """Return the cached number of tickets for the `key` (see
+        `get_count_key`) or `None` if there is no fresh value."""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._counts.get(key)
+        if entry is not None and time() - entry[1] < self.count_cache_ttl:
+            return entry[0]
+        return None
+
+    def set_cached_count(self, key, count):
+        ttl = self.count_cache_ttl
+        if key is None or ttl <= 0:
+            return
+        now = time()
+        with self._lock:
+            if len(self._counts) >= self.COUNT_CACHE_SIZE:
+                self._counts = dict((k, v) for k, v in self._counts.iteritems()
+                                    if now - v[1] < ttl)
+                if len(self._counts) >= self.COUNT_CACHE_SIZE:
+                    self._counts = {}
+            self._counts[key] = (count, now)
+
+    # Query SQL plans cache
+
+    def get_sql_plan(self, key):
+        """Return the SQL plan of the queries of the `key` shape or `None`
+        if it is not built yet."""
+        return self._plans.get(key)
+
+    def set_sql_plan(self, key, plan):
+        with self._lock:
+            if len(self._plans) >= self.PLAN_CACHE_SIZE:
+                self._plans = {}
+            self._plans[key] = plan
+
+    def invalidate_counts(self, project_id):
+        """Drop cached query counts of the project in all processes."""
+        if project_id is None or self.count_cache_ttl <= 0:
+            return
+        project_id = int(project_id)
+        CacheManager(self.env).invalidate(self._counts_cache_id(project_id))
+        with self._lock:
+            self._counts = dict((k, v) for k, v in self._counts.iteritems()
+                                if k[0] != project_id)
+
+    def _counts_cache_id(self, project_id):
+        return 'trac.ticket.query.QueryModule.counts.project:%s' % project_id
+
     # IContentConverter methods
 
     def get_supported_conversions(self):
@@ -1192,7 +1523,7 @@ class QueryModule(Component):
                     else:
                         del clause[field]
 
-        fields = TicketSystem(self.env).get_ticket_fields(**ts_kwargs)
+        fields = TicketSystem(self.env).get_ticket_field_set(**ts_kwargs)
         has_date = False
         for n, f in fields.iteritems():
             if f['type'] == 'date':
@@ -1232,6 +1563,7 @@ class QueryModule(Component):
                       rows,
                       args.get('page'), 
                       max,
+                      after=args.get('after'),
                       **query_area_args)
 
         if 'update' in req.args:
@@ -1436,43 +1768,71 @@ class QueryModule(Component):
         return 'query.html', data, None
 
     def export_csv(self, req, query, sep=',', mimetype='text/plain'):
+        results = query.execute_iter(req, self.env.get_db_cnx())
+        content = self._iter_csv(req, query, results, sep)
+        return (content, '%s;charset=utf-8' % mimetype)
+
+    def export_rss(self, req, query):
+        context = Context.from_request(req, 'query', absurls=True)
+        query_href = query.get_href(context.href)
+        if 'description' not in query.rows:
+            query.rows.append('description')
+        db = self.env.get_db_cnx()
+        results = query.execute_iter(req, db)
+        data = {
+            'context': context,
+            'results': self._iter_viewable(req, results),
+            'query_href': query_href
+        }
+        output = Chrome(self.env).render_template(req, 'query.rss', data,
+                                                  'application/rss+xml',
+                                                  iterable=True)
+        return output, 'application/rss+xml'
+
+    def _iter_csv(self, req, query, results, sep):
+        """Generate the CSV content one batch of tickets at a time."""
         content = StringIO()
         cols = query.get_columns()
         writer = csv.writer(content, delimiter=sep, quoting=csv.QUOTE_MINIMAL)
         writer.writerow([unicode(c).encode('utf-8') for c in cols])
+        yield content.getvalue()
 
+        chrome = Chrome(self.env)
         context = Context.from_request(req)
-        results = query.execute(req, self.env.get_db_cnx())
-        for result in results:
-            ticket = Resource('ticket', result['id'])
-            if 'TICKET_VIEW' in req.perm(ticket):
+        for batch in self._iter_viewable_batches(req, results):
+            content.seek(0)
+            content.truncate()
+            for result in batch:
+                ticket = Resource('ticket', result['id'])
                 values = []
                 for col in cols:
                     value = result[col]
                     if col in ('cc', 'reporter'):
-                        value = Chrome(self.env).format_emails(context(ticket),
-                                                               value)
+                        value = chrome.format_emails(context(ticket), value)
                     elif col in query.time_fields:
                         value = format_datetime(value, tzinfo=req.tz)
                     values.append(unicode(value).encode('utf-8'))
                 writer.writerow(values)
-        return (content.getvalue(), '%s;charset=utf-8' % mimetype)
-
-    def export_rss(self, req, query):
-        context = Context.from_request(req, 'query', absurls=True)
-        query_href = query.get_href(context.href)
-        if 'description' not in query.rows:
-            query.rows.append('description')
-        db = self.env.get_db_cnx()
-        results = query.execute(req, db)
-        data = {
-            'context': context,
-            'results': results,
-            'query_href': query_href
-        }
-        output = Chrome(self.env).render_template(req, 'query.rss', data,
-                                                  'application/rss+xml')
-        return output, 'application/rss+xml'
+            yield content.getvalue()
+
+    def _iter_viewable(self, req, results):
+        for batch in self._iter_viewable_batches(req, results):
+            for result in batch:
+                yield result
+
+    def _iter_viewable_batches(self, req, results):
+        """Generate lists of the `results` the user is allowed to view,
+        checking permissions for `EXPORT_BATCH_SIZE` tickets at once."""
+        results = iter(results)
+        while True:
+            batch = list(islice(results, self.EXPORT_BATCH_SIZE))
+            if not batch:
+                break
+            viewable = set(req.perm.filter('TICKET_VIEW',
+                           [Resource('ticket', result['id'])
+                            for result in batch]))
+            yield [result for result in batch
+                   if Resource('ticket', result['id']) in viewable]
 
     # IWikiSyntaxProvider methods
     
@@ -1625,8 +1985,9 @@ class TicketQueryMacro(WikiMacroBase):
         # 'table' format had its own permission checks, here we need to
         # do it explicitly:
 
-        tickets = [t for t in tickets 
-                   if 'TICKET_VIEW' in req.perm('ticket', t['id'])]
+        viewable = set(r.id for r in req.perm.filter('TICKET_VIEW',
+                       [Resource('ticket', t['id']) for t in tickets]))
+        tickets = [t for t in tickets if t['id'] in viewable]
 
         if not tickets:
             return tag.span(_("No results"), class_='query_no_results')
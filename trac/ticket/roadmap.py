@@ -18,17 +18,21 @@
 from StringIO import StringIO
 from datetime import datetime, timedelta
 import re
+import threading
 
 from genshi.builder import tag
 
 from trac import __version__
 from trac.attachment import AttachmentModule
+from trac.cache import CacheManager
 from trac.config import ExtensionOption, BoolOption
 from trac.core import *
 from trac.mimeview import Context
 from trac.perm import IPermissionRequestor
 from trac.resource import *
-from trac.search import ISearchSource, search_to_sql, shorten_result
+from trac.search import ISearchSource, ISearchIndexSource, search_to_sql, \
+                        shorten_result
+from trac.search.index import SearchIndex
 from trac.util import as_bool
 from trac.util.datefmt import parse_date, utc, to_utimestamp, \
                               get_datetime_format_hint, format_date, \
@@ -36,8 +40,11 @@ from trac.util.datefmt import parse_date, utc, to_utimestamp, \
 from trac.util.text import CRLF
 from trac.util.translation import _, tag_
 from trac.ticket import Milestone, Ticket, TicketSystem, group_milestones
+from trac.ticket.api import ITicketChangeListener, IMilestoneChangeListener
 from trac.ticket.query import QueryModule
-from trac.timeline.api import ITimelineEventProvider
+from trac.timeline.api import ITimelineEventProvider, iter_recent_rows, \
+                             merge_events
+from trac.timeline.cache import TimelineEventCache
 from trac.web import IRequestHandler, RequestDone
 from trac.web.chrome import add_link, add_notice, add_script, add_stylesheet, \
                             add_warning, Chrome, INavigationContributor
@@ -55,6 +62,15 @@ class ITicketGroupStatsProvider(Interface):
         This method returns a valid TicketGroupStats object.
         """
 
+    # Providers may also implement an optional method:
+    #
+    #   def get_status_stats(status_cnt, pid):
+    #       """Gather statistics on a group of tickets counted by status
+    #       in the `status_cnt` dict."""
+    #
+    # It is used by `get_ticket_stats` when ticket statuses are already
+    # known, so that no query is needed.
+
 class TicketGroupStats(object):
     """Encapsulates statistics on a group of tickets."""
 
@@ -173,6 +189,11 @@ class DefaultTicketGroupStatsProvider(Component):
         {'name': 'active', 'status': '*', 'css_class': 'open'}
         ]
 
+    def __init__(self):
+        self._groups_lock = threading.Lock()
+        # {syllabus_id: (key, (all_statuses, groups))}
+        self._status_groups = {}
+
     def _get_ticket_groups(self, syllabus_id):
         """Returns a list of dict describing the ticket groups
         in the expected order of appearance in the milestone progress bars.
@@ -194,27 +215,27 @@ class DefaultTicketGroupStatsProvider(Component):
         else:
             return self.default_milestone_groups
 
-    def get_ticket_group_stats(self, ticket_ids, pid):
-        total_cnt = len(ticket_ids)
-        all_statuses = set(TicketSystem(self.env).get_all_status(pid=pid))
-        status_cnt = {}
-        for s in all_statuses:
-            status_cnt[s] = 0
-        if total_cnt:
-            db = self.env.get_db_cnx()
-            cursor = db.cursor()
-            str_ids = [str(x) for x in sorted(ticket_ids)]
-            cursor.execute("SELECT status, count(status) FROM ticket "
-                           "WHERE project_id=%s AND id IN %s "
-                           "GROUP BY status",
-                           (pid, tuple(str_ids)))
-            for s, cnt in cursor:
-                status_cnt[s] = cnt
+    def _get_status_groups(self, pid):
+        """Return all ticket statuses of the project and the list of ticket
+        groups with resolved `statuses` sets.
 
-        stat = TicketGroupStats(_('ticket status'), _('tickets'))
-        remaining_statuses = set(all_statuses)
+        Groups are cached per syllabus until its `[milestone-groups]`
+        section or ticket statuses change.
+        """
         syllabus_id = ProjectManagement(self.env).get_project_syllabus(pid)
-        groups =  self._get_ticket_groups(syllabus_id)
+        all_statuses = set(TicketSystem(self.env).get_all_status(
+                                                    syllabus_id=syllabus_id))
+        config = self.configs.syllabus(syllabus_id)
+        options = None
+        if 'milestone-groups' in config:
+            options = tuple(config.options('milestone-groups'))
+        key = (options, tuple(sorted(all_statuses)))
+        entry = self._status_groups.get(syllabus_id)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        remaining_statuses = set(all_statuses)
+        groups = [dict(group) for group in self._get_ticket_groups(syllabus_id)]
         catch_all_group = None
         # we need to go through the groups twice, so that the catch up group
         # doesn't need to be the last one in the sequence
@@ -244,10 +265,34 @@ class DefaultTicketGroupStatsProvider(Component):
                 group['statuses'] = group_statuses
         if catch_all_group:
             catch_all_group['statuses'] = remaining_statuses
+        with self._groups_lock:
+            self._status_groups[syllabus_id] = (key, (all_statuses, groups))
+        return all_statuses, groups
+
+    def get_ticket_group_stats(self, ticket_ids, pid):
+        status_cnt = {}
+        if ticket_ids:
+            db = self.env.get_db_cnx()
+            cursor = db.cursor()
+            str_ids = [str(x) for x in sorted(ticket_ids)]
+            cursor.execute("SELECT status, count(status) FROM ticket "
+                           "WHERE project_id=%s AND id IN %s "
+                           "GROUP BY status",
+                           (pid, tuple(str_ids)))
+            for s, cnt in cursor:
+                status_cnt[s] = cnt
+        return self.get_status_stats(status_cnt, pid)
+
+    def get_status_stats(self, status_cnt, pid):
+        all_statuses, groups = self._get_status_groups(pid)
+        counts = dict.fromkeys(all_statuses, 0)
+        counts.update(status_cnt)
+
+        stat = TicketGroupStats(_('ticket status'), _('tickets'))
         for group in groups:
             group_cnt = 0
             query_args = {}
-            for s, cnt in status_cnt.iteritems():
+            for s, cnt in counts.iteritems():
                 if s in group['statuses']:
                     group_cnt += cnt
                     query_args.setdefault('status', []).append(s)
@@ -263,14 +308,113 @@ class DefaultTicketGroupStatsProvider(Component):
         return stat
 
 
+class RoadmapStatsEngine(Component):
+    """Ticket statistics for all milestones of a project.
+
+    Ticket statuses of all milestones of a project are read by one query
+    and memoized until a ticket or a milestone of the project changes
+    (in any process). Only permissions are checked on every request.
+    """
+
+    implements(ITicketChangeListener, IMilestoneChangeListener)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {project_id: (generation, {milestone: [(ticket_id, status)]})}
+        self._tickets = {}
+
+    # ITicketChangeListener methods
+
+    def ticket_created(self, tkt):
+        self.invalidate(tkt.pid)
+
+    def ticket_changed(self, tkt, comment, author, old_values):
+        self.invalidate(tkt.pid)
+
+    def ticket_deleted(self, tkt):
+        self.invalidate(tkt.pid)
+
+    # IMilestoneChangeListener methods
+
+    def milestone_created(self, milestone):
+        self.invalidate(milestone.pid)
+
+    def milestone_changed(self, milestone, old_values):
+        self.invalidate(milestone.pid)
+
+    def milestone_deleted(self, milestone):
+        self.invalidate(milestone.pid)
+
+    # API
+
+    def get_milestones_stats(self, req, provider, milestones):
+        """Return the list of `TicketGroupStats` of viewable tickets
+        for every milestone of `milestones`."""
+        milestone_tickets = []
+        projects = {}
+        for milestone in milestones:
+            if milestone.pid not in projects:
+                projects[milestone.pid] = self.get_milestone_tickets(milestone.pid)
+            milestone_tickets.append(
+                    projects[milestone.pid].get(milestone.name, []))
+        resources = [Resource('ticket', tkt_id, pid=milestone.pid)
+                     for milestone, tickets in zip(milestones, milestone_tickets)
+                     for tkt_id, status in tickets]
+        viewable = set(r.id for r in req.perm.filter('TICKET_VIEW', resources))
+        return [get_ticket_stats(provider,
+                                 [{'id': tkt_id, 'status': status}
+                                  for tkt_id, status in tickets
+                                  if tkt_id in viewable],
+                                 milestone.pid)
+                for milestone, tickets in zip(milestones, milestone_tickets)]
+
+    def get_milestone_tickets(self, pid):
+        """Return `{milestone: [(ticket_id, status)]}` for the project."""
+        pid = int(pid)
+        generation = CacheManager(self.env).get_generation(self._cache_id(pid))
+        entry = self._tickets.get(pid)
+        if entry is not None and entry[0] == generation:
+            return entry[1]
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        cursor.execute("SELECT milestone, id, status FROM ticket "
+                       "WHERE project_id=%s ORDER BY milestone, id", (pid,))
+        tickets = {}
+        for milestone, tkt_id, status in cursor:
+            tickets.setdefault(milestone, []).append((tkt_id, status))
+        with self._lock:
+            self._tickets[pid] = (generation, tickets)
+        return tickets
+
+    def invalidate(self, project_id):
+        """Invalidate memoized tickets of the project."""
+        if project_id is None:
+            return
+        project_id = int(project_id)
+        CacheManager(self.env).invalidate(self._cache_id(project_id))
+        with self._lock:
+            self._tickets.pop(project_id, None)
+
+    # Internal methods
+
+    def _cache_id(self, project_id):
+        return 'trac.ticket.roadmap.RoadmapStatsEngine.project:%s' % project_id
+
+
 def get_ticket_stats(provider, tickets, pid):
+    get_status_stats = getattr(provider, 'get_status_stats', None)
+    if get_status_stats is not None:
+        status_cnt = {}
+        for t in tickets:
+            status_cnt[t['status']] = status_cnt.get(t['status'], 0) + 1
+        return get_status_stats(status_cnt, pid)
     return provider.get_ticket_group_stats([t['id'] for t in tickets], pid)
 
 def get_tickets_for_milestone(env, db, milestone, field='component'):
     cursor = db.cursor()
     pid  = milestone.pid
     name = milestone.name
-    fields = TicketSystem(env).get_ticket_fields(pid)
+    fields = TicketSystem(env).get_ticket_field_set(pid)
     f = fields.get(field)
     if f and not f.get('custom'):
         cursor.execute("SELECT id,status,%s FROM ticket WHERE project_id=%%s AND milestone=%%s "
@@ -288,8 +432,9 @@ def get_tickets_for_milestone(env, db, milestone, field='component'):
 def apply_ticket_permissions(env, req, tickets):
     """Apply permissions to a set of milestone tickets as returned by
     get_tickets_for_milestone()."""
-    return [t for t in tickets
-            if 'TICKET_VIEW' in req.perm('ticket', t['id'])]
+    viewable = set(r.id for r in req.perm.filter('TICKET_VIEW',
+                   [Resource('ticket', t['id']) for t in tickets]))
+    return [t for t in tickets if t['id'] in viewable]
 
 def milestone_stats_data(env, req, stat, milestone, grouped_by='component',
                          group=None):
@@ -359,17 +504,13 @@ class RoadmapModule(Component):
         milestones = [m for m in milestones
                       if 'MILESTONE_VIEW' in req.perm(m.resource)]
 
-        stats = []
         queries = []
 
-        for milestone in milestones:
-            tickets = get_tickets_for_milestone(self.env, db, milestone,
-                                                'owner')
-            tickets = apply_ticket_permissions(self.env, req, tickets)
-            stat = get_ticket_stats(self.stats_provider, tickets, pid)
-            stats.append(milestone_stats_data(self.env, req, stat,
-                                              milestone))
-            #milestone['tickets'] = tickets # for the iCalendar view
+        stats = [milestone_stats_data(self.env, req, stat, milestone)
+                 for stat, milestone in zip(RoadmapStatsEngine(self.env)
+                        .get_milestones_stats(req, self.stats_provider,
+                                              milestones),
+                        milestones)]
 
         total_weight = Milestone.get_total_weight(self.env, pid)
 
@@ -516,7 +657,7 @@ class MilestoneModule(Component):
 
     implements(INavigationContributor, IPermissionRequestor, IRequestHandler,
                ITimelineEventProvider, IWikiSyntaxProvider, IResourceManager,
-               ISearchSource)
+               ISearchSource, ISearchIndexSource)
  
     stats_provider = ExtensionOption('milestone', 'stats_provider',
                                      ITicketGroupStatsProvider,
@@ -552,36 +693,48 @@ class MilestoneModule(Component):
             yield ('milestone', _('Milestones reached'))
 
     def get_timeline_events(self, req, start, stop, filters, pid, syllabus_id):
+        return self.get_recent_timeline_events(req, start, stop, filters, 0,
+                                               pid, syllabus_id)
+
+    def get_recent_timeline_events(self, req, start, stop, filters, maxrows,
+                                   pid, syllabus_id):
         if 'milestone' in filters:
             if pid is None:
                 return
             is_multi = isinstance(pid, (list, tuple))
             milestone_realm = Resource('milestone')
             db = self.env.get_read_db()
-            cursor = db.cursor()
             # TODO: creation and (later) modifications should also be reported
             query = '''
                 SELECT project_id,completed,name,description FROM milestone
-                WHERE completed>=%s AND completed<=%s AND project_id {where_pid}
+                WHERE project_id {where_pid} AND completed>=%s AND completed<=%s
+                ORDER BY completed DESC
             '''
-            sql_args = [to_utimestamp(start), to_utimestamp(stop)]
             if is_multi:
                 where_pid = 'IN %s'
-                sql_args.append(tuple(pid))
+                pid = project_ids = tuple(pid)
             else:
                 where_pid = '= %s'
-                sql_args.append(pid)
+                project_ids = (pid,)
             query = query.format(where_pid=where_pid)
-            cursor.execute(query, sql_args)
-            for project_id, completed, name, description in cursor:
-                milestone = milestone_realm(id=name, pid=project_id)
-                if 'MILESTONE_VIEW' in req.perm(milestone):
-                    yield('milestone', project_id, from_utimestamp(completed),
-                          '', (milestone, description)) # FIXME: author?
+
+            def milestone_events():
+                rows = TimelineEventCache(self.env).get_rows(
+                    ('milestone', pid), project_ids,
+                    to_utimestamp(start), to_utimestamp(stop),
+                    lambda ts_start, ts_stop: iter_recent_rows(db, query,
+                        (pid, ts_start, ts_stop), maxrows, 1), 1)
+                for project_id, completed, name, description in rows:
+                    milestone = milestone_realm(id=name, pid=project_id)
+                    if 'MILESTONE_VIEW' in req.perm(milestone):
+                        yield('milestone', project_id, from_utimestamp(completed),
+                              '', (milestone, description)) # FIXME: author?
 
             # Attachments
-            for event in AttachmentModule(self.env).get_timeline_events(
-                req, milestone_realm, start, stop, pid, syllabus_id):
+            for event in merge_events([milestone_events(),
+                    AttachmentModule(self.env).get_timeline_events(
+                        req, milestone_realm, start, stop, pid, syllabus_id,
+                        maxrows)]):
                 yield event
                 
     def render_timeline_event(self, context, field, event):
@@ -665,7 +818,7 @@ class MilestoneModule(Component):
         if req.args.has_key('retarget'):
             retarget_to = req.args.get('target')
         if not retarget_to: # None or empty
-            ticket_fields = TicketSystem(self.env).get_ticket_fields(milestone.pid)
+            ticket_fields = TicketSystem(self.env).get_ticket_field_set(milestone.pid)
             allow_retarget_to_none = ticket_fields['milestone']['optional']
             if not allow_retarget_to_none and milestone.has_tickets():
                 raise TracError(_('Can not delete milestone %(milestone)s because there are some tickets associated with it'
@@ -749,7 +902,7 @@ class MilestoneModule(Component):
                 # TODO: check ticket modify permissions
                 retarget_to = req.args.get('target')
                 if retarget_to is None:
-                    ticket_fields = TicketSystem(self.env).get_ticket_fields(milestone.pid)
+                    ticket_fields = TicketSystem(self.env).get_ticket_field_set(milestone.pid)
                     allow_retarget_to_none = ticket_fields['milestone']['optional']
                     if not allow_retarget_to_none:
                         raise TracError(_('Can not retarget tickets to empty milestone.'))
@@ -781,7 +934,7 @@ class MilestoneModule(Component):
         milestones = [m for m in Milestone.select(self.env, pid=milestone.pid, db=db)
                       if m.name != milestone.name
                       and 'MILESTONE_VIEW' in req.perm(m.resource)]
-        ticket_fields = TicketSystem(self.env).get_ticket_fields(milestone.pid)
+        ticket_fields = TicketSystem(self.env).get_ticket_field_set(milestone.pid)
         allow_retarget_to_none = ticket_fields['milestone']['optional']
         data = {
             'milestone': milestone,
@@ -798,7 +951,7 @@ class MilestoneModule(Component):
         if default_due <= datetime.now(utc):
             default_due += timedelta(days=1)
 
-        ticket_fields = TicketSystem(self.env).get_ticket_fields(milestone.pid)
+        ticket_fields = TicketSystem(self.env).get_ticket_field_set(milestone.pid)
         allow_retarget_to_none = ticket_fields['milestone']['optional'] \
                                 if 'milestone' in ticket_fields else True
         data = {
@@ -827,7 +980,7 @@ class MilestoneModule(Component):
         milestone_groups = []
         available_groups = []
         component_group_available = False
-        ticket_fields = TicketSystem(self.env).get_ticket_fields(pid)
+        ticket_fields = TicketSystem(self.env).get_ticket_field_set(pid)
 
         # collect fields that can be used for grouping
         for name, field in ticket_fields.iteritems():
@@ -1027,24 +1180,54 @@ class MilestoneModule(Component):
     def get_search_results(self, req, terms, filters):
         if not 'milestone' in filters:
             return
-        db = self.env.get_db_cnx()
-        sql_query, args = search_to_sql(db, ['name', 'description'], terms)
-        cursor = db.cursor()
-        cursor.execute("SELECT name,due,completed,description "
-                       "FROM milestone "
-                       "WHERE " + sql_query, args)
-
         milestone_realm = Resource('milestone')
-        for name, due, completed, description in cursor:
-            milestone = milestone_realm(id=name)
-            if 'MILESTONE_VIEW' in req.perm(milestone):
-                dt = (completed and from_utimestamp(completed) or
-                      due and from_utimestamp(due) or datetime.now(utc))
-                yield (get_resource_url(self.env, milestone, req.href),
-                       get_resource_name(self.env, milestone), dt,
-                       '', shorten_result(description, terms))
+        if not SearchIndex(self.env).is_indexed('milestone'):
+            db = self.env.get_db_cnx()
+            sql_query, args = search_to_sql(db, ['name', 'description'],
+                                            terms)
+            cursor = db.cursor()
+            cursor.execute("SELECT name,due,completed,description "
+                           "FROM milestone "
+                           "WHERE " + sql_query, args)
+
+            for name, due, completed, description in cursor:
+                milestone = milestone_realm(id=name)
+                if 'MILESTONE_VIEW' in req.perm(milestone):
+                    dt = (completed and from_utimestamp(completed) or
+                          due and from_utimestamp(due) or datetime.now(utc))
+                    yield (get_resource_url(self.env, milestone, req.href),
+                           get_resource_name(self.env, milestone), dt,
+                           '', shorten_result(description, terms))
         
         # Attachments
         for result in AttachmentModule(self.env).get_search_results(
             req, milestone_realm, terms):
             yield result
+
+    # ISearchIndexSource methods
+
+    def get_search_index_realms(self):
+        yield ('milestone', 'milestone', 'MILESTONE_VIEW')
+
+    def get_search_documents(self, realm, keys=None):
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        if keys is None:
+            cursor.execute("SELECT project_id,name,due,completed,description "
+                           "FROM milestone")
+            rows = cursor.fetchall()
+        else:
+            rows = []
+            for name, pid in keys:
+                cursor.execute("SELECT project_id,name,due,completed,"
+                               "description FROM milestone "
+                               "WHERE project_id=%s AND name=%s", (pid, name))
+                rows.extend(cursor.fetchall())
+        for pid, name, due, completed, description in rows:
+            milestone = Resource('milestone', name, pid=pid)
+            yield (name, pid, get_resource_name(self.env, milestone), '',
+                   completed or due or None,
+                   '\n'.join([name, description or '']))
+
+    def get_search_index_resource(self, realm, id, pid):
+        return Resource('milestone', id, pid=pid)
@@ -0,0 +1,90 @@
+from trac.resource import Resource
+from trac.test import EnvironmentStub
+from trac.ticket.extras import VirtualTicketPermissionsPolicy
+
+import unittest
+
+
+class PermissionCacheStub(object):
+    """Grants TRAC_ADMIN on the resources of the `admin` realms."""
+
+    def __init__(self, username, admin=(), resource=None):
+        self.username = username
+        self.admin = admin
+        self.resource = resource
+
+    def __call__(self, resource):
+        return PermissionCacheStub(self.username, self.admin, resource)
+
+    def __contains__(self, action):
+        return action == 'TRAC_ADMIN' and \
+               (self.resource.realm if self.resource else None) in self.admin
+
+    def filter(self, action, resources):
+        return [r for r in resources if action in self(r)]
+
+
+class VirtualTicketPermissionsPolicyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.policy = VirtualTicketPermissionsPolicy(self.env)
+        db = self.env.get_db_cnx()
+        cursor = db.cursor()
+        cursor.executemany("""
+            INSERT INTO ticket (id, project_id, owner, reporter, cc)
+            VALUES (%s,1,%s,%s,%s)
+            """, [(1, 'joe', 'ann', 'bob, joe'),
+                  (2, 'ann', 'joe', ''),
+                  (3, 'bob', 'bob', None)])
+        db.commit()
+        ticket = Resource('ticket', 1)
+        self.resources = [
+            None, ticket, ticket.child('attachment', 'file.txt'),
+            Resource('ticket', 2), Resource('ticket', 3), Resource('ticket', 3),
+            Resource('ticket', 42), Resource('ticket', 'abc'),
+            Resource('ticket'), Resource('wiki', 'WikiStart'),
+            Resource('milestone', 'm1')]
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def _assert_equivalent(self, username, admin=()):
+        perm = PermissionCacheStub(username, admin)
+        for action in sorted(self.policy.virtual_permissions) + ['TICKET_VIEW']:
+            expected = [self.policy.check_permission(
+                            action, username, resource,
+                            resource and perm(resource) or perm, None)
+                        for resource in self.resources]
+            self.assertEqual(expected, self.policy.check_permissions(
+                                 action, username, self.resources, perm, None))
+
+    def test_decisions(self):
+        perm = PermissionCacheStub('joe')
+        self.assertEqual(
+            [None, True, True, False, False, False, None, None, None, None,
+             None],
+            self.policy.check_permissions('TICKET_IS_OWNER', 'joe',
+                                          self.resources, perm, None))
+        self.assertEqual(
+            [None, True, True, False, False, False, None, None, None, None,
+             None],
+            self.policy.check_permissions('TICKET_IS_CC', 'joe',
+                                          self.resources, perm, None))
+
+    def test_equivalent_to_check_permission(self):
+        self._assert_equivalent('joe')
+        self._assert_equivalent('bob')
+        self._assert_equivalent('anonymous')
+
+    def test_equivalent_to_check_permission_admin(self):
+        self._assert_equivalent('joe', admin=('ticket',))
+        self._assert_equivalent('joe', admin=('wiki', 'milestone'))
+        self._assert_equivalent('joe', admin=(None,))
+
+
+def suite():
+    return unittest.makeSuite(VirtualTicketPermissionsPolicyTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
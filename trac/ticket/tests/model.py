@@ -10,7 +10,8 @@ from trac.attachment import Attachment
 from trac.core import TracError, implements
 from trac.resource import ResourceNotFound
 from trac.ticket.model import Ticket, Component, Milestone, Priority, Type, Version
-from trac.ticket.api import IMilestoneChangeListener, ITicketChangeListener
+from trac.ticket.api import IMilestoneChangeListener, ITicketChangeListener, \
+                           TicketSystem
 from trac.test import EnvironmentStub
 from trac.util.datefmt import from_utimestamp, to_utimestamp, utc
 
@@ -393,6 +394,85 @@ class TicketTestCase(unittest.TestCase):
         self.assertEqual(ticket, listener.ticket)
 
 
+class TicketSelectTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self._get_ticket_fields = TicketSystem.__dict__['get_ticket_fields']
+        TicketSystem.get_ticket_fields = \
+            lambda ts, pid=None, syllabus_id=None: self._get_fields()
+        db = self.env.get_db_cnx()
+        cursor = db.cursor()
+        cursor.executemany("INSERT INTO projects (id,name) VALUES (%s,%s)",
+                           [(1, 'p1'), (2, 'p2')])
+        cursor.executemany("""
+            INSERT INTO ticket (id,project_id,summary,status,owner,time,
+                                changetime)
+            VALUES (%s,%s,%s,%s,%s,%s,%s)""",
+            [(1, 1, 'Foo', 'new', 'joe', 1000000, 2000000),
+             (2, 1, 'Bar', 'closed', None, 3000000, 3000000),
+             (3, 2, 'Baz', 'new', 'jack', 4000000, 4000000),
+             (4, 1, '', 'new', 'jack', 5000000, 6000000)])
+        cursor.executemany("""
+            INSERT INTO ticket_custom (ticket,name,value) VALUES (%s,%s,%s)
+            """, [(1, 'foo', 'Custom'), (1, 'cbon', '1'), (3, 'foo', 'Other'),
+                  (4, 'cbon', '0')])
+        db.commit()
+
+    def tearDown(self):
+        TicketSystem.get_ticket_fields = self._get_ticket_fields
+        self.env.reset_db()
+
+    def _get_fields(self):
+        fields = dict((name, {'name': name, 'type': type_})
+                      for name, type_ in [('project_id', 'select'),
+                                          ('summary', 'text'),
+                                          ('status', 'radio'),
+                                          ('owner', 'text'),
+                                          ('time', 'time'),
+                                          ('changetime', 'time')])
+        fields.update((name, {'name': name, 'type': type_, 'custom': True,
+                              'value': default})
+                      for name, type_, default in [('foo', 'text', None),
+                                                   ('cbon', 'checkbox', '1')])
+        fields['virt'] = {'name': 'virt', 'type': 'text', 'custom': True,
+                          'virtual': True, 'value': 'Virtual'}
+        return fields
+
+    def _assert_same(self, ids, tickets):
+        self.assertEqual(ids, [ticket.id for ticket in tickets])
+        for ticket in tickets:
+            expected = Ticket(self.env, ticket.id)
+            self.assertEqual(expected.values, ticket.values)
+            self.assertEqual(expected.pid, ticket.pid)
+            self.assertEqual(expected.resource, ticket.resource)
+            self.assertEqual({}, ticket._old)
+
+    def test_select(self):
+        tickets = list(Ticket.select(self.env, 1))
+        self._assert_same([1, 2, 4], tickets)
+        self.assertEqual(('Custom', True, 'Virtual'),
+                         (tickets[0]['foo'], tickets[0]['cbon'],
+                          tickets[0]['virt']))
+        # as when read by id, missing custom values are not defaulted
+        self.assertEqual((None, None, 'Virtual'),
+                         (tickets[1]['foo'], tickets[1]['cbon'],
+                          tickets[1]['virt']))
+        self.assertEqual(False, tickets[2]['cbon'])
+        self._assert_same([3], list(Ticket.select(self.env, 2)))
+
+    def test_select_ids(self):
+        self._assert_same([2, 4], list(Ticket.select(self.env, 1,
+                                                     ids=[4, 3, 2])))
+        self.assertEqual([], list(Ticket.select(self.env, 1, ids=[])))
+        self.assertEqual([], list(Ticket.select(self.env, 2, ids=[1])))
+
+    def test_select_changes(self):
+        ticket = list(Ticket.select(self.env, 1, ids=[1]))[0]
+        ticket['summary'] = 'Changed'
+        self.assertEqual({'summary': 'Foo'}, ticket._old)
+
+
 class TicketCommentTestCase(unittest.TestCase):
     
     def _insert_ticket(self, summary, when, **kwargs):
@@ -1039,6 +1119,7 @@ class VersionTestCase(unittest.TestCase):
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(TicketTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(TicketSelectTestCase, 'test'))
     suite.addTest(unittest.makeSuite(TicketCommentEditTestCase, 'test'))
     suite.addTest(unittest.makeSuite(TicketCommentDeleteTestCase, 'test'))
     suite.addTest(unittest.makeSuite(EnumTestCase, 'test'))
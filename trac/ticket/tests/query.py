@@ -1,5 +1,8 @@
+from trac.cache import CacheManager
 from trac.mimeview import Context
+from trac.project.api import ProjectManagement
 from trac.test import Mock, EnvironmentStub, MockPerm
+from trac.ticket.api import TicketSystem
 from trac.ticket.query import Query, QueryModule, TicketQueryMacro
 from trac.util.datefmt import utc
 from trac.web.href import Href
@@ -7,11 +10,76 @@ from trac.wiki.formatter import LinkFormatter
 
 import unittest
 import difflib
+from collections import OrderedDict
 
 # Note: we don't want to replicate 1:1 all the SQL dialect abstraction
 #       methods from the trac.db layer here. 
 
-class QueryTestCase(unittest.TestCase):
+class ProjectQueryTestCase(unittest.TestCase):
+    """Base class of tests running project queries on a stub environment,
+    with the project syllabus and the ticket fields stubbed."""
+
+    fields = [('project_id', 'select'), ('summary', 'text'),
+              ('reporter', 'text'), ('owner', 'text'),
+              ('description', 'textarea'), ('type', 'select'),
+              ('status', 'radio'), ('priority', 'select'),
+              ('milestone', 'select'), ('component', 'select'),
+              ('version', 'select'), ('resolution', 'radio'),
+              ('keywords', 'text'), ('cc', 'text'), ('time', 'time'),
+              ('changetime', 'time')]
+
+    def setUp(self):
+        self.env = EnvironmentStub(default_data=True)
+        self.db = self.env.get_db_cnx()
+        self.req = Mock(href=self.env.href, authname='anonymous', tz=utc)
+        self._patched = [
+            (ProjectManagement, 'get_project_syllabus',
+             lambda pm, pid: 1),
+            (TicketSystem, 'get_ticket_field_set',
+             lambda ts, pid=None, syllabus_id=None:
+                 self._get_ticket_field_set()),
+        ]
+        for cls, name, stub in self._patched:
+            setattr(cls, '_orig_' + name, cls.__dict__[name])
+            setattr(cls, name, stub)
+        cursor = self.db.cursor()
+        for name, value in [('blocker', '1'), ('major', '2'), ('minor', '3')]:
+            cursor.execute("""
+                INSERT INTO enum_syllabus (syllabus_id,type,name,value)
+                VALUES (1,'priority',%s,%s)""", (name, value))
+        self.db.commit()
+
+    def tearDown(self):
+        for cls, name, stub in self._patched:
+            setattr(cls, name, cls.__dict__['_orig_' + name])
+            delattr(cls, '_orig_' + name)
+        self.env.reset_db()
+
+    def _get_ticket_field_set(self):
+        fields = OrderedDict()
+        for name, type_ in self.fields:
+            fields[name] = {'name': name, 'type': type_, 'label': name,
+                            'value': ''}
+        for name, type_ in self.env.config.options('ticket-custom'):
+            if '.' not in name:
+                fields[name] = {'name': name, 'type': type_, 'label': name,
+                                'value': '', 'custom': True}
+        return fields
+
+    def _query(self, string=None, **kwargs):
+        if string is None:
+            query = Query(self.env, project=1, **kwargs)
+        else:
+            query = Query.from_string(self.env, string, project=1, **kwargs)
+        # SQLite doesn't match the integer `project_id` column with the
+        # string value of the project area constraint
+        for clause in query.constraints:
+            del clause['project_id']
+        del query.constraint_cols['project_id']
+        return query
+
+
+class QueryTestCase(ProjectQueryTestCase):
 
     def prettifySQL(self, sql):
         """Returns a prettified version of the SQL as a list of lines to help
@@ -31,448 +99,449 @@ class QueryTestCase(unittest.TestCase):
         self.assertEqual(sql, correct_sql, failure_message)
 
     def setUp(self):
-        self.env = EnvironmentStub(default_data=True)
-        self.db = self.env.get_db_cnx()
-        self.req = Mock(href=self.env.href, authname='anonymous', tz=utc)
-        
-    def tearDown(self):
-        self.env.reset_db()
+        ProjectQueryTestCase.setUp(self)
+        # pagination by sort key is tested by `KeysetPaginationTestCase`
+        self.env.config.set('query', 'keyset_pagination', 'false')
 
     def test_all_ordered_by_id(self):
-        query = Query(self.env, order='id')
+        query = self._query(order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_all_ordered_by_id_desc(self):
-        query = Query(self.env, order='id', desc=1)
+        query = self._query(order='id', desc=1)
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
 ORDER BY COALESCE(t.id,0)=0 DESC,t.id DESC""")
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_all_ordered_by_id_verbose(self):
-        query = Query(self.env, order='id', verbose=1)
+        query = self._query(order='id', verbose=1)
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.reporter AS reporter,t.description AS description,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_all_ordered_by_id_from_unicode(self):
-        query = Query.from_string(self.env, u'order=id')
+        query = self._query(u'order=id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_all_ordered_by_priority(self):
-        query = Query(self.env) # priority is default order
+        query = self._query() # priority is default order
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-ORDER BY COALESCE(priority.value,'')='',%(cast_priority)s,t.id""" % {
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
+ORDER BY COALESCE(priority.value,'')='' DESC,%(cast_priority)s DESC,t.id""" % {
           'cast_priority': self.env.get_db_cnx().cast('priority.value', 'int')})
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_all_ordered_by_priority_desc(self):
-        query = Query(self.env, desc=1) # priority is default order
+        query = self._query(desc=1) # priority is default order
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-ORDER BY COALESCE(priority.value,'')='' DESC,%(cast_priority)s DESC,t.id""" % {
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
+ORDER BY COALESCE(priority.value,'')='',%(cast_priority)s,t.id""" % {
           'cast_priority': self.env.get_db_cnx().cast('priority.value', 'int')})
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_all_ordered_by_version(self):
-        query = Query(self.env, order='version')
+        query = self._query(order='version')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.version AS version,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-  LEFT OUTER JOIN version ON (version.name=version)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
+  LEFT OUTER JOIN version ON (version.name=version AND version.project_id=t.project_id)
 ORDER BY COALESCE(t.version,'')='',COALESCE(version.time,0)=0,version.time,t.version,t.id""")
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_all_ordered_by_version_desc(self):
-        query = Query(self.env, order='version', desc=1)
+        query = self._query(order='version', desc=1)
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.version AS version,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-  LEFT OUTER JOIN version ON (version.name=version)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
+  LEFT OUTER JOIN version ON (version.name=version AND version.project_id=t.project_id)
 ORDER BY COALESCE(t.version,'')='' DESC,COALESCE(version.time,0)=0 DESC,version.time DESC,t.version DESC,t.id""")
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_milestone(self):
-        query = Query.from_string(self.env, 'milestone=milestone1', order='id')
+        query = self._query('milestone=milestone1', order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.component AS component,t.time AS time,t.changetime AS changetime,t.milestone AS milestone,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-WHERE ((COALESCE(t.milestone,'')=%s))
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
+WHERE ((COALESCE(t.milestone,%s)=%s))
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual(['milestone1'], args)
+        self.assertEqual([1, '', 'milestone1'], args)
         tickets = query.execute(self.req)
 
     def test_all_grouped_by_milestone(self):
-        query = Query(self.env, order='id', group='milestone')
+        query = self._query(order='id', group='milestone')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.component AS component,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-  LEFT OUTER JOIN milestone ON (milestone.name=milestone)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
+  LEFT OUTER JOIN milestone ON (milestone.name=milestone AND milestone.project_id=t.project_id)
 ORDER BY COALESCE(t.milestone,'')='',COALESCE(milestone.completed,0)=0,milestone.completed,COALESCE(milestone.due,0)=0,milestone.due,t.milestone,COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_all_grouped_by_milestone_desc(self):
-        query = Query(self.env, order='id', group='milestone', groupdesc=1)
+        query = self._query(order='id', group='milestone', groupdesc=1)
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.component AS component,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-  LEFT OUTER JOIN milestone ON (milestone.name=milestone)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
+  LEFT OUTER JOIN milestone ON (milestone.name=milestone AND milestone.project_id=t.project_id)
 ORDER BY COALESCE(t.milestone,'')='' DESC,COALESCE(milestone.completed,0)=0 DESC,milestone.completed DESC,COALESCE(milestone.due,0)=0 DESC,milestone.due DESC,t.milestone DESC,COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_grouped_by_priority(self):
-        query = Query(self.env, group='priority')
+        query = self._query(group='priority')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.milestone AS milestone,t.component AS component,t.priority AS priority,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-ORDER BY COALESCE(priority.value,'')='',%(cast_priority)s,t.id""" % {
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
+ORDER BY COALESCE(priority.value,'')='' DESC,%(cast_priority)s DESC,t.id""" % {
           'cast_priority': self.env.get_db_cnx().cast('priority.value', 'int')})
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_milestone_not(self):
-        query = Query.from_string(self.env, 'milestone!=milestone1', order='id')
+        query = self._query('milestone!=milestone1', order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.milestone AS milestone,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.component AS component,t.time AS time,t.changetime AS changetime,t.milestone AS milestone,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-WHERE ((COALESCE(t.milestone,'')!=%s))
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
+WHERE ((COALESCE(t.milestone,%s)!=%s))
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual(['milestone1'], args)
+        self.assertEqual([1, '', 'milestone1'], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_status(self):
-        query = Query.from_string(self.env, 'status=new|assigned|reopened',
+        query = self._query('status=new|assigned|reopened',
                                   order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.status AS status,t.owner AS owner,t.type AS type,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.status AS status,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
 WHERE (COALESCE(t.status,'') IN (%s,%s,%s))
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual(['new', 'assigned', 'reopened'], args)
+        self.assertEqual([1, 'new', 'assigned', 'reopened'], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_owner_containing(self):
-        query = Query.from_string(self.env, 'owner~=someone', order='id')
+        query = self._query('owner~=someone', order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.time AS time,t.changetime AS changetime,t.owner AS owner,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
 WHERE ((COALESCE(t.owner,'') %(like)s))
 ORDER BY COALESCE(t.id,0)=0,t.id""" % {'like': self.env.get_db_cnx().like()})
-        self.assertEqual(['%someone%'], args)
+        self.assertEqual([1, '%someone%'], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_owner_not_containing(self):
-        query = Query.from_string(self.env, 'owner!~=someone', order='id')
+        query = self._query('owner!~=someone', order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.time AS time,t.changetime AS changetime,t.owner AS owner,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
 WHERE ((COALESCE(t.owner,'') NOT %(like)s))
 ORDER BY COALESCE(t.id,0)=0,t.id""" % {'like': self.env.get_db_cnx().like()})
-        self.assertEqual(['%someone%'], args)
+        self.assertEqual([1, '%someone%'], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_owner_beginswith(self):
-        query = Query.from_string(self.env, 'owner^=someone', order='id')
+        query = self._query('owner^=someone', order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.time AS time,t.changetime AS changetime,t.owner AS owner,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
 WHERE ((COALESCE(t.owner,'') %(like)s))
 ORDER BY COALESCE(t.id,0)=0,t.id""" % {'like': self.env.get_db_cnx().like()})
-        self.assertEqual(['someone%'], args)
+        self.assertEqual([1, 'someone%'], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_owner_endswith(self):
-        query = Query.from_string(self.env, 'owner$=someone', order='id')
+        query = self._query('owner$=someone', order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.time AS time,t.changetime AS changetime,t.owner AS owner,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
 WHERE ((COALESCE(t.owner,'') %(like)s))
 ORDER BY COALESCE(t.id,0)=0,t.id""" % {'like': self.env.get_db_cnx().like()})
-        self.assertEqual(['%someone'], args)
+        self.assertEqual([1, '%someone'], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_custom_field(self):
         self.env.config.set('ticket-custom', 'foo', 'text')
-        query = Query.from_string(self.env, 'foo=something', order='id')
+        query = self._query('foo=something', order='id')
         sql, args = query.get_sql()
         foo = self.db.quote('foo')
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value,%s.value AS %s
+"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value,tc.%s AS %s
 FROM ticket AS t
-  LEFT OUTER JOIN ticket_custom AS %s ON (id=%s.ticket AND %s.name='foo')
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-WHERE ((COALESCE(%s.value,'')=%%s))
-ORDER BY COALESCE(t.id,0)=0,t.id""" % ((foo,) * 6))
-        self.assertEqual(['something'], args)
+  LEFT OUTER JOIN (SELECT ticket,MAX(CASE WHEN name='foo' THEN value END) AS %s
+    FROM ticket_custom WHERE name IN ('foo')
+    GROUP BY ticket) AS tc ON (tc.ticket=t.id)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
+WHERE ((COALESCE(tc.%s,%%s)=%%s))
+ORDER BY COALESCE(t.id,0)=0,t.id""" % ((foo,) * 4))
+        self.assertEqual([1, '', 'something'], args)
         tickets = query.execute(self.req)
 
     def test_grouped_by_custom_field(self):
         self.env.config.set('ticket-custom', 'foo', 'text')
-        query = Query(self.env, group='foo', order='id')
+        query = self._query(group='foo', order='id')
         sql, args = query.get_sql()
         foo = self.db.quote('foo')
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value,%s.value AS %s
+"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value,tc.%s AS %s
 FROM ticket AS t
-  LEFT OUTER JOIN ticket_custom AS %s ON (id=%s.ticket AND %s.name='foo')
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-ORDER BY COALESCE(%s.value,'')='',%s.value,COALESCE(t.id,0)=0,t.id""" %
-        ((foo,) * 7))
-        self.assertEqual([], args)
+  LEFT OUTER JOIN (SELECT ticket,MAX(CASE WHEN name='foo' THEN value END) AS %s
+    FROM ticket_custom WHERE name IN ('foo')
+    GROUP BY ticket) AS tc ON (tc.ticket=t.id)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
+ORDER BY COALESCE(tc.%s,'')='',tc.%s,COALESCE(t.id,0)=0,t.id""" %
+        ((foo,) * 5))
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_multiple_owners(self):
-        query = Query.from_string(self.env, 'owner=someone|someone_else',
+        query = self._query('owner=someone|someone_else',
                                   order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.time AS time,t.changetime AS changetime,t.owner AS owner,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
 WHERE (COALESCE(t.owner,'') IN (%s,%s))
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual(['someone', 'someone_else'], args)
+        self.assertEqual([1, 'someone', 'someone_else'], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_multiple_owners_not(self):
-        query = Query.from_string(self.env, 'owner!=someone|someone_else',
+        query = self._query('owner!=someone|someone_else',
                                   order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.time AS time,t.changetime AS changetime,t.owner AS owner,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
 WHERE (COALESCE(t.owner,'') NOT IN (%s,%s))
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual(['someone', 'someone_else'], args)
+        self.assertEqual([1, 'someone', 'someone_else'], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_multiple_owners_contain(self):
-        query = Query.from_string(self.env, 'owner~=someone|someone_else',
+        query = self._query('owner~=someone|someone_else',
                                   order='id')
         sql, args = query.get_sql()
-        self.assertEqual(['%someone%', '%someone/_else%'], args)
+        self.assertEqual([1, '%someone%', '%someone/_else%'], args)
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.time AS time,t.changetime AS changetime,t.owner AS owner,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
 WHERE ((COALESCE(t.owner,'') %(like)s OR COALESCE(t.owner,'') %(like)s))
 ORDER BY COALESCE(t.id,0)=0,t.id""" % {'like': self.env.get_db_cnx().like()})
         tickets = query.execute(self.req)
 
     def test_constrained_by_empty_value_contains(self):
-        query = Query.from_string(self.env, 'owner~=|', order='id')
+        query = self._query('owner~=|', order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.time AS time,t.changetime AS changetime,t.owner AS owner,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_empty_value_startswith(self):
-        query = Query.from_string(self.env, 'owner^=|', order='id')
+        query = self._query('owner^=|', order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.time AS time,t.changetime AS changetime,t.owner AS owner,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_empty_value_endswith(self):
-        query = Query.from_string(self.env, 'owner$=|', order='id')
+        query = self._query('owner$=|', order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.time AS time,t.changetime AS changetime,t.owner AS owner,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual([], args)
+        self.assertEqual([1], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_time_range(self):
-        query = Query.from_string(self.env, 'created=2008-08-01..2008-09-01', order='id')
+        query = self._query('created=2008-08-01..2008-09-01', order='id')
         sql, args = query.get_sql(self.req)
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.time AS time,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
 WHERE (((%(cast_time)s>=%%s AND %(cast_time)s<%%s)))
 ORDER BY COALESCE(t.id,0)=0,t.id""" % {
           'cast_time': self.env.get_db_cnx().cast('t.time', 'int64')})
-        self.assertEqual([1217548800000000L, 1220227200000000L], args)
+        self.assertEqual([1, 1217548800000000L, 1220227200000000L], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_time_range_exclusion(self):
-        query = Query.from_string(self.env, 'created!=2008-08-01..2008-09-01', order='id')
+        query = self._query('created!=2008-08-01..2008-09-01', order='id')
         sql, args = query.get_sql(self.req)
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.time AS time,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
 WHERE ((NOT (%(cast_time)s>=%%s AND %(cast_time)s<%%s)))
 ORDER BY COALESCE(t.id,0)=0,t.id""" % {
           'cast_time': self.env.get_db_cnx().cast('t.time', 'int64')})
-        self.assertEqual([1217548800000000L, 1220227200000000L], args)
+        self.assertEqual([1, 1217548800000000L, 1220227200000000L], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_time_range_open_right(self):
-        query = Query.from_string(self.env, 'created=2008-08-01..', order='id')
+        query = self._query('created=2008-08-01..', order='id')
         sql, args = query.get_sql(self.req)
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.time AS time,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
 WHERE ((%(cast_time)s>=%%s))
 ORDER BY COALESCE(t.id,0)=0,t.id""" % {
           'cast_time': self.env.get_db_cnx().cast('t.time', 'int64')})
-        self.assertEqual([1217548800000000L], args)
+        self.assertEqual([1, 1217548800000000L], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_time_range_open_left(self):
-        query = Query.from_string(self.env, 'created=..2008-09-01', order='id')
+        query = self._query('created=..2008-09-01', order='id')
         sql, args = query.get_sql(self.req)
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.time AS time,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
 WHERE ((%(cast_time)s<%%s))
 ORDER BY COALESCE(t.id,0)=0,t.id""" % {
           'cast_time': self.env.get_db_cnx().cast('t.time', 'int64')})
-        self.assertEqual([1220227200000000L], args)
+        self.assertEqual([1, 1220227200000000L], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_time_range_modified(self):
-        query = Query.from_string(self.env, 'modified=2008-08-01..2008-09-01', order='id')
+        query = self._query('modified=2008-08-01..2008-09-01', order='id')
         sql, args = query.get_sql(self.req)
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.changetime AS changetime,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.time AS time,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
 WHERE (((%(cast_changetime)s>=%%s AND %(cast_changetime)s<%%s)))
 ORDER BY COALESCE(t.id,0)=0,t.id""" % {
           'cast_changetime': self.env.get_db_cnx().cast('t.changetime', 'int64')})
-        self.assertEqual([1217548800000000L, 1220227200000000L], args)
+        self.assertEqual([1, 1217548800000000L, 1220227200000000L], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_keywords(self):
-        query = Query.from_string(self.env, 'keywords~=foo -bar baz',
+        query = self._query('keywords~=foo -bar baz',
                                   order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.keywords AS keywords,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,t.keywords AS keywords,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%%s)
 WHERE (((COALESCE(t.keywords,'') %(like)s AND COALESCE(t.keywords,'') NOT %(like)s AND COALESCE(t.keywords,'') %(like)s)))
 ORDER BY COALESCE(t.id,0)=0,t.id""" % {'like': self.env.get_db_cnx().like()})
-        self.assertEqual(['%foo%', '%bar%', '%baz%'], args)
+        self.assertEqual([1, '%foo%', '%bar%', '%baz%'], args)
         tickets = query.execute(self.req)
 
     def test_constrained_by_milestone_or_version(self):
-        query = Query.from_string(self.env, 'milestone=milestone1&or&version=version1', order='id')
+        query = self._query('milestone=milestone1&or&version=version1', order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.component AS component,t.time AS time,t.changetime AS changetime,t.version AS version,t.milestone AS milestone,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-WHERE ((COALESCE(t.milestone,'')=%s)) OR ((COALESCE(t.version,'')=%s))
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
+WHERE ((COALESCE(t.milestone,%s)=%s)) OR ((COALESCE(t.version,%s)=%s))
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual(['milestone1', 'version1'], args)
+        self.assertEqual([1, '', 'milestone1', '', 'version1'], args)
         tickets = query.execute(self.req)
 
     def test_equal_in_value(self):
-        query = Query.from_string(self.env, r'status=this=that&version=version1',
+        query = self._query(r'status=this=that&version=version1',
                                   order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
 """SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.status AS status,t.time AS time,t.changetime AS changetime,t.version AS version,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-WHERE ((COALESCE(t.status,'')=%s) AND (COALESCE(t.version,'')=%s))
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
+WHERE ((COALESCE(t.status,%s)=%s) AND (COALESCE(t.version,%s)=%s))
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual(['this=that', 'version1'], args)
+        self.assertEqual([1, '', 'this=that', '', 'version1'], args)
         tickets = query.execute(self.req)
 
     def test_special_character_escape(self):
-        query = Query.from_string(self.env, r'status=here\&now|maybe\|later|back\slash',
+        query = self._query(r'status=here\&now|maybe\|later|back\slash',
                                   order='id')
         sql, args = query.get_sql()
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.status AS status,t.owner AS owner,t.type AS type,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.status AS status,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
 WHERE (COALESCE(t.status,'') IN (%s,%s,%s))
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual(['here&now', 'maybe|later', 'back\\slash'], args)
+        self.assertEqual([1, 'here&now', 'maybe|later', 'back\\slash'], args)
         tickets = query.execute(self.req)
 
     def test_repeated_constraint_field(self):
-        like_query = Query.from_string(self.env, 'owner!=someone|someone_else',
+        like_query = self._query('owner!=someone|someone_else',
                                        order='id')
-        query = Query.from_string(self.env, 'owner!=someone&owner!=someone_else',
+        query = self._query('owner!=someone&owner!=someone_else',
                                   order='id')
         like_sql, like_args = like_query.get_sql()
         sql, args = query.get_sql()
@@ -481,39 +550,63 @@ ORDER BY COALESCE(t.id,0)=0,t.id""")
         tickets = query.execute(self.req)
 
     def test_user_var(self):
-        query = Query.from_string(self.env, 'owner=$USER&order=id')
+        query = self._query('owner=$USER&order=id')
         sql, args = query.get_sql(req=self.req)
         self.assertEqualSQL(sql,
-"""SELECT t.id AS id,t.summary AS summary,t.owner AS owner,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.time AS time,t.changetime AS changetime,priority.value AS priority_value
+"""SELECT t.id AS id,t.summary AS summary,t.type AS type,t.status AS status,t.priority AS priority,t.milestone AS milestone,t.component AS component,t.time AS time,t.changetime AS changetime,t.owner AS owner,priority.value AS priority_value
 FROM ticket AS t
-  LEFT OUTER JOIN enum AS priority ON (priority.type='priority' AND priority.name=priority)
-WHERE ((COALESCE(t.owner,'')=%s))
+  LEFT OUTER JOIN enum_syllabus AS priority ON (priority.type='priority' AND priority.name=priority AND priority.syllabus_id=%s)
+WHERE ((COALESCE(t.owner,%s)=%s))
 ORDER BY COALESCE(t.id,0)=0,t.id""")
-        self.assertEqual(['anonymous'], args)
+        self.assertEqual([1, '', 'anonymous'], args)
         tickets = query.execute(self.req)
 
+    def test_sql_plan_cached(self):
+        self.env.config.set('ticket-custom', 'foo', 'text')
+        qm = QueryModule(self.env)
+        plans = []
+        def build_sql_plan(query, db, cols, custom_fields):
+            plans.append(cols)
+            return build(query, db, cols, custom_fields)
+        build = Query._build_sql_plan
+        Query._build_sql_plan = build_sql_plan
+        try:
+            sql, args = self._query('foo=bar&order=id').get_sql()
+            self.assertEqual(1, len(plans))
+            # the constraint values aren't part of the plan
+            sql2, args2 = self._query('foo=baz&order=id').get_sql()
+            self.assertEqual(1, len(plans))
+            self.assertEqual(sql, sql2)
+            self.assertEqual([1, '', 'baz'], args2)
+            self._query('foo=bar&order=id&desc=1').get_sql()
+            self.assertEqual(2, len(plans))
+            self._query('foo=bar&order=foo').get_sql()
+            self.assertEqual(3, len(plans))
+        finally:
+            Query._build_sql_plan = build
+
     def test_csv_escape(self):
         query = Mock(get_columns=lambda: ['col1'],
-                     execute=lambda r,c: [{'id': 1,
-                                           'col1': 'value, needs escaped'}],
+                     execute_iter=lambda r,c: iter([{'id': 1,
+                                           'col1': 'value, needs escaped'}]),
                      time_fields=['time', 'changetime'])
         content, mimetype = QueryModule(self.env).export_csv(
                                 Mock(href=self.env.href, perm=MockPerm()),
                                 query)
         self.assertEqual('col1\r\n"value, needs escaped"\r\n',
-                         content)
+                         ''.join(content))
 
     def test_template_data(self):
         req = Mock(href=self.env.href, perm=MockPerm(), authname='anonymous',
                    tz=None)
         context = Context.from_request(req, 'query')
 
-        query = Query.from_string(self.env, 'owner=$USER&order=id')
+        query = self._query('owner=$USER&order=id')
         tickets = query.execute(req)
         data = query.template_data(context, tickets, req=req)
         self.assertEqual(['anonymous'], data['clauses'][0]['owner']['values'])
 
-        query = Query.from_string(self.env, 'owner=$USER&order=id')
+        query = self._query('owner=$USER&order=id')
         tickets = query.execute(req)
         data = query.template_data(context, tickets)
         self.assertEqual(['$USER'], data['clauses'][0]['owner']['values'])
@@ -577,9 +670,124 @@ class TicketQueryMacroTestCase(unittest.TestCase):
                            'list')
         
 
+class KeysetPaginationTestCase(ProjectQueryTestCase):
+
+    def setUp(self):
+        ProjectQueryTestCase.setUp(self)
+        self.env.config.set('ticket-custom', 'foo', 'text')
+        self.env.config.set('ticket-custom', 'bar', 'text')
+        cursor = self.db.cursor()
+        owners = ['joe', 'jack', '', None]
+        priorities = ['blocker', 'major', 'minor', None]
+        for i in range(1, 41):
+            cursor.execute("""
+                INSERT INTO ticket (id,project_id,summary,status,priority,
+                                    owner,time,changetime)
+                VALUES (%s,1,%s,'new',%s,%s,%s,%s)""",
+                (i, 'Ticket %d' % (i % 7), priorities[i % 4],
+                 owners[i % 3], i % 5, i % 5))
+            if i % 4:
+                cursor.executemany("""
+                    INSERT INTO ticket_custom (ticket,name,value)
+                    VALUES (%s,%s,%s)""",
+                    [(i, 'foo', str(i % 3) * (i % 2)), (i, 'bar', str(i))])
+        self.db.commit()
+
+    def _get_ids(self, max=0, page=None, after=None, **kwargs):
+        query = self._query(cols=['id', 'summary'], max=max, page=page,
+                            after=after, **kwargs)
+        ids = [t['id'] for t in query.execute(self.req)]
+        # grouped pages end with the first ticket of the next page
+        return ids[:max or None], query.next_after
+
+    def _assert_pages(self, **kwargs):
+        all_ids = self._get_ids(**kwargs)[0]
+        self.assertEqual(40, len(all_ids))
+        ids = []
+        page, after = 1, None
+        while True:
+            page_ids, after = self._get_ids(max=7, page=page, after=after,
+                                            **kwargs)
+            self.assertTrue(page_ids)
+            ids.extend(page_ids)
+            if after is None:
+                break
+            page += 1
+        self.assertEqual(6, page)
+        self.assertEqual(all_ids, ids)
+        # pages without `after` are selected by offset
+        offset_ids = []
+        for page in range(1, 7):
+            offset_ids.extend(self._get_ids(max=7, page=page, **kwargs)[0])
+        self.assertEqual(all_ids, offset_ids)
+
+    def test_id(self):
+        self._assert_pages(order='id')
+
+    def test_id_desc(self):
+        self._assert_pages(order='id', desc=1)
+
+    def test_text(self):
+        self._assert_pages(order='summary')
+
+    def test_text_desc(self):
+        self._assert_pages(order='summary', desc=1)
+
+    def test_text_empty_values(self):
+        self._assert_pages(order='owner')
+        self._assert_pages(order='owner', desc=1)
+
+    def test_enum(self):
+        self._assert_pages(order='priority')
+        self._assert_pages(order='priority', desc=1)
+
+    def test_time(self):
+        self._assert_pages(order='time')
+
+    def test_custom(self):
+        self._assert_pages(order='foo')
+
+    def test_custom_desc(self):
+        self._assert_pages(order='foo', desc=1)
+
+    def test_grouped(self):
+        self._assert_pages(order='summary', group='owner')
+        self._assert_pages(order='foo', group='priority', groupdesc=1)
+
+    def test_invalid_after(self):
+        ids = self._get_ids(max=7, page=2, after='invalid', order='summary')[0]
+        offset_ids = self._get_ids(max=7, page=2, order='summary')[0]
+        self.assertEqual(offset_ids, ids)
+
+    def test_count_cache_invalidated_by_other_process(self):
+        query = self._query(order='id')
+        self.assertEqual(40, len(query.execute(self.req)))
+        qm = QueryModule(self.env)
+        sql, args = query.get_sql(self.req)
+        self.assertEqual(40, qm.get_cached_count(
+                                        qm.get_count_key(1, sql, args)))
+        # as done by `invalidate_counts` in another process
+        CacheManager(self.env).invalidate(qm._counts_cache_id(1))
+        self.assertEqual(None, qm.get_cached_count(
+                                        qm.get_count_key(1, sql, args)))
+
+    def test_count_cache_invalidated_per_project(self):
+        query = self._query(order='id')
+        self.assertEqual(40, len(query.execute(self.req)))
+        qm = QueryModule(self.env)
+        sql, args = query.get_sql(self.req)
+        qm.ticket_changed(Mock(pid=2), '', 'joe', {})
+        self.assertEqual(40, qm.get_cached_count(
+                                        qm.get_count_key(1, sql, args)))
+        qm.ticket_changed(Mock(pid=1), '', 'joe', {})
+        self.assertEqual(None, qm.get_cached_count(
+                                        qm.get_count_key(1, sql, args)))
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(QueryTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(KeysetPaginationTestCase, 'test'))
     suite.addTest(unittest.makeSuite(QueryLinksTestCase, 'test'))
     suite.addTest(unittest.makeSuite(TicketQueryMacroTestCase, 'test'))
     return suite
@@ -16,6 +16,7 @@
 
 import csv
 from datetime import datetime
+from itertools import islice
 import pkg_resources
 import re
 from StringIO import StringIO
@@ -30,11 +31,15 @@ from trac.core import *
 from trac.mimeview.api import Mimeview, IContentConverter, Context
 from trac.resource import Resource, ResourceNotFound, get_resource_url, \
                          render_resource_link, get_resource_shortname
-from trac.search import ISearchSource, search_to_sql, shorten_result
+from trac.search import ISearchSource, ISearchIndexSource, search_to_sql, \
+                        shorten_result
+from trac.search.index import SearchIndex
 from trac.ticket.api import TicketSystem, ITicketManipulator
 from trac.ticket.model import Milestone, Ticket, group_milestones
 from trac.ticket.notification import TicketNotifyEmail
-from trac.timeline.api import ITimelineEventProvider
+from trac.timeline.api import ITimelineEventProvider, iter_recent_rows, \
+                             merge_events
+from trac.timeline.cache import TimelineEventCache
 from trac.util import as_bool, get_reporter_id
 from trac.util.compat import any
 from trac.util.datefmt import format_datetime, from_utimestamp, \
@@ -62,7 +67,8 @@ class InvalidTicket(TracError):
 class TicketModule(Component):
 
     implements(IContentConverter, INavigationContributor, IRequestHandler,
-               ISearchSource, ITemplateProvider, ITimelineEventProvider)
+               ISearchSource, ISearchIndexSource, ITemplateProvider,
+               ITimelineEventProvider)
 
     ticket_manipulators = SyllabusExtensionPoint(ITicketManipulator)
 
@@ -194,6 +200,17 @@ class TicketModule(Component):
         if not 'ticket' in filters:
             return
         ticket_realm = Resource('ticket')
+        if not SearchIndex(self.env).is_indexed('ticket'):
+            for result in self._get_search_results(req, terms):
+                yield result
+
+        # Attachments
+        for result in AttachmentModule(self.env).get_search_results(
+            req, ticket_realm, terms):
+            yield result        
+
+    def _get_search_results(self, req, terms):
+        ticket_realm = Resource('ticket')
         db = self.env.get_db_cnx()
         sql, args = search_to_sql(db, ['summary', 'keywords', 'description',
                                          'reporter', 'cc', 
@@ -214,9 +231,12 @@ class TicketModule(Component):
             )
             """ % (sql, sql2, sql3), args + args2 + args3)
         ticketsystem = TicketSystem(self.env)
-        for summary, desc, author, type, tid, ts, status, resolution in cursor:
+        rows = cursor.fetchall()
+        viewable = set(req.perm.filter('TICKET_VIEW',
+                                       [ticket_realm(id=row[4]) for row in rows]))
+        for summary, desc, author, type, tid, ts, status, resolution in rows:
             t = ticket_realm(id=tid)
-            if 'TICKET_VIEW' in req.perm(t):
+            if t in viewable:
                 yield (req.href.ticket(tid),
                        tag_("%(title)s: %(message)s",
                             title=tag.span(get_resource_shortname(self.env, t),
@@ -225,11 +245,54 @@ class TicketModule(Component):
                                 summary, status, resolution, type)),
                        from_utimestamp(ts), author,
                        shorten_result(desc, terms))
-        
-        # Attachments
-        for result in AttachmentModule(self.env).get_search_results(
-            req, ticket_realm, terms):
-            yield result        
+
+    # ISearchIndexSource methods
+
+    def get_search_index_realms(self):
+        yield ('ticket', 'ticket', 'TICKET_VIEW')
+
+    def get_search_documents(self, realm, keys=None):
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        if keys is None:
+            cursor.execute("SELECT id FROM ticket")
+            ids = [id for id, in cursor]
+        else:
+            ids = [int(id) for id, pid in keys]
+        ticketsystem = TicketSystem(self.env)
+        # Read the tickets with their comments and custom fields in batches
+        for i in xrange(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            id_args = ','.join(['%s'] * len(batch))
+            texts = {}
+            cursor.execute("""
+                SELECT ticket,newvalue FROM ticket_change
+                WHERE field='comment' AND ticket IN (%s) ORDER BY time
+                """ % id_args, batch)
+            for tid, text in cursor:
+                texts.setdefault(tid, []).append(text)
+            cursor.execute("""
+                SELECT ticket,value FROM ticket_custom WHERE ticket IN (%s)
+                """ % id_args, batch)
+            for tid, text in cursor:
+                texts.setdefault(tid, []).append(text)
+            cursor.execute("""
+                SELECT id,project_id,summary,description,keywords,reporter,cc,
+                       type,status,resolution,time
+                FROM ticket WHERE id IN (%s)
+                """ % id_args, batch)
+            for (tid, pid, summary, desc, keywords, reporter, cc, type,
+                 status, resolution, ts) in cursor.fetchall():
+                title = '#%s: %s' % (tid, ticketsystem.format_summary(
+                                              summary, status, resolution,
+                                              type))
+                text = '\n'.join(filter(None, [unicode(tid), summary,
+                                               keywords, desc, reporter, cc] +
+                                              texts.get(tid, [])))
+                yield (tid, pid, title, reporter, ts, text)
+
+    def get_search_index_resource(self, realm, id, pid):
+        return Resource('ticket', int(id), pid=pid)
 
     # ITimelineEventProvider methods
 
@@ -240,6 +303,11 @@ class TicketModule(Component):
                 yield ('ticket_details', _("Ticket updates"), False)
 
     def get_timeline_events(self, req, start, stop, filters, pid, syllabus_id):
+        return self.get_recent_timeline_events(req, start, stop, filters, 0,
+                                               pid, syllabus_id)
+
+    def get_recent_timeline_events(self, req, start, stop, filters, maxrows,
+                                   pid, syllabus_id):
         if pid is None:
             return
         is_multi = isinstance(pid, (list, tuple))
@@ -267,8 +335,6 @@ class TicketModule(Component):
         def produce_event((id, ts, project_id, author, type, summary, description),
                           status, fields, comment, cid):
             ticket = ticket_realm(id=id, pid=project_id)
-            if 'TICKET_VIEW' not in req.perm(ticket):
-                return None
             resolution = fields.get('resolution')
             info = ''
             if status == 'edit':
@@ -295,32 +361,35 @@ class TicketModule(Component):
                      description, comment, cid)
             return (kind, project_id, from_utimestamp(ts), author, data_)
 
-        # Ticket changes
         db = self.env.get_read_db()
-        if 'ticket' in filters or 'ticket_details' in filters:
-            cursor = db.cursor()
+        event_cache = TimelineEventCache(self.env)
+        project_ids = pid if is_multi else (pid,)
 
-            cursor.execute("""
+        # Changes are `(id, project_id, date, produce_event args)` tuples
+        def ticket_changes():
+            sql = """
                 SELECT t.project_id,t.id,tc.time,tc.author,t.type,t.summary, 
                        tc.field,tc.oldvalue,tc.newvalue 
                 FROM ticket_change tc 
                     INNER JOIN ticket t ON t.id = tc.ticket 
-                        AND tc.time>=%s AND tc.time<=%s 
                 WHERE t.project_id {where_pid}
-                ORDER BY tc.time
-                """.format(where_pid=where_pid),
-                (ts_start, ts_stop, pid))
+                    AND tc.time>=%s AND tc.time<=%s 
+                ORDER BY tc.time DESC,t.id
+                """.format(where_pid=where_pid)
+            rows = event_cache.get_rows(('ticket_change', pid), project_ids,
+                ts_start, ts_stop,
+                lambda ts_from, ts_to: iter_recent_rows(db, sql,
+                                        (pid, ts_from, ts_to), maxrows, 2), 2)
             data = None
-            for vals in cursor:
+            for vals in rows:
                 project_id,id,t,author,type,summary,field,oldvalue,newvalue = vals
                 if not (oldvalue or newvalue):
                     # ignore empty change from custom field created or deleted
                     continue 
                 if not data or (id, t) != data[:2]:
                     if data:
-                        ev = produce_event(data, status, fields, comment, cid)
-                        if ev:
-                            yield ev
+                        yield (data[0], data[2], from_utimestamp(data[1]),
+                               (data, status, fields, comment, cid))
                     status, fields, comment, cid = 'edit', {}, '', None
                     data = (id, t, project_id, author, type, summary, None)
                 if field == 'comment':
@@ -333,27 +402,52 @@ class TicketModule(Component):
                 elif field[0] != '_': # properties like _comment{n} are hidden
                     fields[field] = newvalue
             if data:
-                ev = produce_event(data, status, fields, comment, cid)
-                if ev:
-                    yield ev
-
-            # New tickets
+                yield (data[0], data[2], from_utimestamp(data[1]),
+                       (data, status, fields, comment, cid))
+
+        def new_tickets():
+            sql = """
+                SELECT id,time,project_id,reporter,type,summary,description
+                FROM ticket WHERE project_id {where_pid} AND time>=%s AND time<=%s
+                ORDER BY time DESC,id
+                """.format(where_pid=where_pid)
+            rows = event_cache.get_rows(('ticket', pid), project_ids,
+                ts_start, ts_stop,
+                lambda ts_from, ts_to: iter_recent_rows(db, sql,
+                                        (pid, ts_from, ts_to), maxrows, 1), 1)
+            for row in rows:
+                yield (row[0], row[2], from_utimestamp(row[1]),
+                       (row, 'new', {}, None, None))
+
+        def ticket_events():
+            changes = []
+            if 'ticket' in filters or 'ticket_details' in filters:
+                changes.append(ticket_changes())
             if 'ticket' in filters:
-                cursor.execute("""
-                    SELECT id,time,project_id,reporter,type,summary,description
-                    FROM ticket WHERE project_id {where_pid} AND time>=%s AND time<=%s
-                    """.format(where_pid=where_pid),
-                    (pid, ts_start, ts_stop))
-                for row in cursor:
-                    ev = produce_event(row, 'new', {}, None, None)
-                    if ev:
-                        yield ev
-
-            # Attachments
-            if 'ticket_details' in filters:
-                for event in AttachmentModule(self.env).get_timeline_events(
-                    req, ticket_realm, start, stop, pid, syllabus_id):
-                    yield event
+                changes.append(new_tickets())
+            changes = merge_events(changes)
+            # TICKET_VIEW is checked for the tickets of `maxrows` changes
+            # (or of all the changes) at once
+            while True:
+                batch = list(islice(changes, maxrows or None))
+                if not batch:
+                    break
+                viewable = set(req.perm.filter('TICKET_VIEW',
+                    set(ticket_realm(id=id, pid=project_id)
+                        for id, project_id, date, args in batch)))
+                for id, project_id, date, args in batch:
+                    if ticket_realm(id=id, pid=project_id) in viewable:
+                        event = produce_event(*args)
+                        if event:
+                            yield event
+
+        events = [ticket_events()]
+        # Attachments
+        if 'ticket_details' in filters:
+            events.append(AttachmentModule(self.env).get_timeline_events(
+                req, ticket_realm, start, stop, pid, syllabus_id, maxrows))
+        for event in merge_events(events):
+            yield event
 
     def render_timeline_event(self, context, field, event):
         ticket, verb, info, summary, status, resolution, type, \
@@ -17,7 +17,10 @@
 # Author: Jonas Borgström <jonas@edgewall.com>
 #         Christopher Lenz <cmlenz@gmx.de>
 
+from heapq import heapify, heappop, heapreplace
+
 from trac.core import *
+from trac.util.datefmt import to_utimestamp
 
 
 class ITimelineEventProvider(Interface):
@@ -61,6 +64,19 @@ class ITimelineEventProvider(Interface):
         Old form (0.10) `(kind, href, title, date, author, markup)` is not supported.
         """
 
+    # Providers may also provide an optional method:
+    #
+    #   def get_recent_timeline_events(req, start, stop, filters, maxrows,
+    #                                  pid=None, syllabus_id=None):
+    #       """Like `get_timeline_events`, but the events are generated
+    #       newest first. When `maxrows` is not 0, no more than the
+    #       `maxrows` first events will be read from the generator."""
+    #
+    # It is used by `TimelineModule` instead of `get_timeline_events`: the
+    # events of such providers are merged lazily and their queries can be
+    # limited with `iter_recent_rows`. The events of other providers are
+    # sorted in memory.
+
     def render_timeline_event(context, field, event):
         """Display the title of the event in the given context.
 
@@ -73,3 +89,66 @@ class ITimelineEventProvider(Interface):
         """
 
 
+def iter_recent_rows(db, sql, args, maxrows, time_index):
+    """Generate the rows of the `sql` query newest first.
+
+    `sql` must order the rows by descending time, the last of its `args`
+    being the time upper bound, compared with `<=`. `time_index` is the
+    index of the time column in the rows.
+
+    When `maxrows` is not 0, the rows are read `maxrows` at a time, so
+    that nothing more is read when the caller stops early. The rows
+    sharing the time of the last row of a batch are read again with
+    the next batch.
+    """
+    cursor = db.cursor()
+    if not maxrows:
+        cursor.execute(sql, args)
+        for row in cursor:
+            yield row
+        return
+    args = list(args)
+    limit = maxrows
+    while True:
+        cursor.execute(sql + " LIMIT %d" % limit, args)
+        rows = cursor.fetchall()
+        if len(rows) < limit:
+            for row in rows:
+                yield row
+            return
+        last = rows[-1][time_index]
+        rows = [row for row in rows if row[time_index] != last]
+        if not rows: # all the rows of the batch have the same time
+            limit *= 2
+            continue
+        for row in rows:
+            yield row
+        args[-1] = last
+        limit = maxrows
+
+
+def merge_events(iterables, key=None):
+    """Merge `iterables` of events generated newest first into a single
+    generator of events, newest first.
+
+    `key` returns the `datetime` of an item, by default the `date` of
+    an event tuple.
+    """
+    if key is None:
+        key = lambda event: event[2]
+    heap = []
+    for index, iterable in enumerate(iterables):
+        iterator = iter(iterable)
+        for item in iterator:
+            heap.append((-to_utimestamp(key(item)), index, item, iterator))
+            break
+    heapify(heap)
+    while heap:
+        _, index, item, iterator = heap[0]
+        yield item
+        for item in iterator:
+            heapreplace(heap,
+                        (-to_utimestamp(key(item)), index, item, iterator))
+            break
+        else:
+            heappop(heap)
@@ -0,0 +1,197 @@
+import threading
+from datetime import datetime
+
+from trac.attachment import IAttachmentChangeListener
+from trac.cache import CacheManager
+from trac.config import BoolOption
+from trac.core import *
+from trac.ticket.api import ITicketChangeListener, IMilestoneChangeListener
+from trac.util.datefmt import to_utimestamp, utc
+from trac.wiki.api import IWikiChangeListener
+
+__all__ = ['TimelineEventCache']
+
+
+# Length of a day bucket in microseconds (UTC days)
+DAY = 86400 * 1000000
+
+
+class TimelineEventCache(Component):
+    '''Cache of the rows read by timeline event providers, per day.
+
+    Rows are cached per (provider query, projects, UTC day) before any
+    permission check, so they are shared by all users. Only past days
+    are cached: new events are normally added to the current day, those
+    added with a past time (e.g. imported) invalidate all the days of
+    their project. So do changes of past events (deleted tickets, edited
+    ticket comments, renamed milestones, deleted wiki pages or
+    attachments...). Wiki page versions can't be edited once saved.
+    Project generations are kept by `CacheManager`, so invalidation
+    made by one process is seen by all other processes on their next
+    request.
+    '''
+
+    implements(ITicketChangeListener, IMilestoneChangeListener,
+               IWikiChangeListener, IAttachmentChangeListener)
+
+    enabled = BoolOption('timeline', 'event_cache', 'true',
+        """Cache the timeline events of past days until they change.""")
+
+    # Maximum number of cached day buckets
+    CACHE_SIZE = 10000
+
+    # Maximum number of uncached days read with a single query
+    MAX_READ_DAYS = 7
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {((key, project_ids), day): (generations, rows)}
+        self._days = {}
+
+    # ITicketChangeListener methods
+
+    def ticket_created(self, tkt):
+        self._invalidate_past(tkt.pid, tkt.time_created)
+
+    def ticket_changed(self, tkt, comment, author, old_values):
+        # Past events show the current values of these fields
+        if set(old_values) & set(('summary', 'type', 'description',
+                                    'reporter')):
+            self.invalidate(tkt.pid)
+
+    def ticket_deleted(self, tkt):
+        self.invalidate(tkt.pid)
+
+    # IMilestoneChangeListener methods
+
+    def milestone_created(self, milestone):
+        if milestone.completed:
+            self.invalidate(milestone.pid)
+
+    def milestone_changed(self, milestone, old_values):
+        if set(old_values) & set(('name', 'completed', 'description')):
+            self.invalidate(milestone.pid)
+
+    def milestone_deleted(self, milestone):
+        self.invalidate(milestone.pid)
+
+    # IWikiChangeListener methods
+
+    def wiki_page_added(self, page):
+        self._invalidate_past(page.pid or None, page.time)
+
+    def wiki_page_changed(self, page, version, t, comment, author, ipnr):
+        self._invalidate_past(page.pid or None, t)
+
+    def wiki_page_deleted(self, page):
+        self.invalidate(page.pid or None)
+
+    def wiki_page_version_deleted(self, page):
+        self.invalidate(page.pid or None)
+
+    def wiki_page_renamed(self, page, old_name):
+        self.invalidate(page.pid or None)
+
+    # IAttachmentChangeListener methods
+
+    def attachment_added(self, attachment):
+        self._invalidate_past(attachment.parent_pid, attachment.date)
+
+    def attachment_deleted(self, attachment):
+        self.invalidate(attachment.parent_pid)
+
+    def attachment_reparented(self, attachment, old_parent_realm,
+                              old_parent_id, old_parent_pid):
+        self.invalidate(old_parent_pid)
+        if attachment.parent_pid != old_parent_pid:
+            self.invalidate(attachment.parent_pid)
+
+    # API
+
+    def get_rows(self, key, project_ids, ts_start, ts_stop, fetch,
+                 time_index):
+        '''Generate the rows of a provider query newest first.
+
+        `fetch(ts_start, ts_stop)` returns the rows of the query with a
+        time between its arguments (inclusive), newest first. `key`
+        identifies the query and its arguments other than the time, and
+        `project_ids` are the projects of its rows (`None` for global
+        resources). `time_index` is the index of the time column in the
+        rows.
+
+        The current day is always read with `fetch`, uncached past days
+        are read `MAX_READ_DAYS` at a time.
+        '''
+        if not self.enabled:
+            for row in fetch(ts_start, ts_stop):
+                yield row
+            return
+        key = (key, tuple(project_ids))
+        generation = self._get_generation(project_ids)
+        today = to_utimestamp(datetime.now(utc)) // DAY
+        day = ts_stop // DAY
+        first_day = ts_start // DAY
+        if day >= today:
+            for row in fetch(max(ts_start, today * DAY), ts_stop):
+                yield row
+            day = today - 1
+        while day >= first_day:
+            rows = self._get_day(key, day, generation)
+            if rows is None:
+                rows = self._read_days(key, day, first_day, generation,
+                                       fetch, time_index)
+            for row in rows:
+                if ts_start <= row[time_index] <= ts_stop:
+                    yield row
+            day -= 1
+
+    def invalidate(self, project_id):
+        '''Invalidate the cached days of the project, or of the global
+        resources if `project_id` is `None`.'''
+        CacheManager(self.env).invalidate(self._cache_id(project_id))
+        with self._lock:
+            for k in [k for k in self._days if project_id in k[0][1]]:
+                del self._days[k]
+
+    # Internal methods
+
+    def _invalidate_past(self, project_id, t):
+        """Invalidate the cached days of the project if `t` is a past
+        day."""
+        today = to_utimestamp(datetime.now(utc)) // DAY
+        if t is not None and to_utimestamp(t) // DAY < today:
+            self.invalidate(project_id)
+
+    def _get_day(self, key, day, generation):
+        entry = self._days.get((key, day))
+        if entry is not None and entry[0] == generation:
+            return entry[1]
+
+    def _read_days(self, key, day, first_day, generation, fetch,
+                   time_index):
+        """Read the uncached days from `day` backwards and return the
+        rows of `day`."""
+        last_day = day
+        while last_day > first_day and \
+                last_day > day - self.MAX_READ_DAYS + 1 and \
+                self._get_day(key, last_day - 1, generation) is None:
+            last_day -= 1
+        days = dict((d, []) for d in xrange(last_day, day + 1))
+        for row in fetch(last_day * DAY, (day + 1) * DAY - 1):
+            days[row[time_index] // DAY].append(row)
+        with self._lock:
+            if len(self._days) + len(days) > self.CACHE_SIZE:
+                self._days = {}
+            for d, rows in days.iteritems():
+                self._days[(key, d)] = (generation, rows)
+        return days[day]
+
+    def _get_generation(self, project_ids):
+        cm = CacheManager(self.env)
+        return tuple(cm.get_generation(self._cache_id(project_id))
+                     for project_id in project_ids)
+
+    def _cache_id(self, project_id):
+        if project_id is None:
+            return 'trac.timeline.events.global'
+        return 'trac.timeline.events.project:%s' % project_id
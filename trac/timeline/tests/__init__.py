@@ -1 +1,13 @@
+import unittest
+
+from trac.timeline.tests import api, cache
 from trac.timeline.tests.functional import functionalSuite
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(api.suite())
+    suite.addTest(cache.suite())
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+from itertools import islice
+
+from trac.test import EnvironmentStub
+from trac.timeline.api import iter_recent_rows, merge_events
+from trac.util.datefmt import utc
+
+import unittest
+
+
+class CursorStub(object):
+
+    def __init__(self, cursor, queries):
+        self.cursor = cursor
+        self.queries = queries
+
+    def execute(self, sql, args):
+        self.queries.append((sql, list(args)))
+        return self.cursor.execute(sql, args)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+class IterRecentRowsTestCase(unittest.TestCase):
+
+    sql = "SELECT id,time FROM ticket WHERE time<=%s ORDER BY time DESC,id"
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.db = self.env.get_db_cnx()
+        cursor = self.db.cursor()
+        # times 10 (x1), 9 (x4), 8 (x1), 7 (x2), 6 (x6), 5 (x1)
+        times = [10] + [9] * 4 + [8] + [7] * 2 + [6] * 6 + [5]
+        cursor.executemany("INSERT INTO ticket (id,time) VALUES (%s,%s)",
+                           list(enumerate(times)))
+        self.db.commit()
+        self.queries = []
+        db = self.db
+        queries = self.queries
+        self.db_stub = type('DbStub', (object,), {
+            'cursor': lambda self: CursorStub(db.cursor(), queries)})()
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def _get_rows(self, maxrows, time=10):
+        return list(iter_recent_rows(self.db_stub, self.sql, [time],
+                                     maxrows, 1))
+
+    def test_unlimited(self):
+        rows = self._get_rows(0)
+        self.assertEqual(15, len(rows))
+        self.assertEqual([self.sql], [sql for sql, args in self.queries])
+
+    def test_same_rows_for_all_batch_sizes(self):
+        expected = self._get_rows(0)
+        for maxrows in range(1, 17):
+            self.assertEqual(expected, self._get_rows(maxrows))
+
+    def test_ties_across_batches(self):
+        self.assertEqual([(0, 10), (1, 9), (2, 9), (3, 9), (4, 9)],
+                         self._get_rows(3)[:5])
+        # the rows of time 9 are read again with the second batch, which
+        # is doubled as they don't fit in it
+        self.assertEqual([(10, 'LIMIT 3'), (9, 'LIMIT 3'), (9, 'LIMIT 6')],
+                         [(args[0], sql[-7:].strip())
+                          for sql, args in self.queries[:3]])
+
+    def test_batch_of_same_time(self):
+        # the 6 rows of time 6 don't fit in a batch of 2: it is doubled
+        rows = self._get_rows(2, time=6)
+        self.assertEqual([6] * 6 + [5], [t for id, t in rows])
+        self.assertEqual(['LIMIT 2', 'LIMIT 4', 'LIMIT 8'],
+                         [sql[-7:].strip() for sql, args in self.queries])
+
+    def test_stop_early(self):
+        rows = iter_recent_rows(self.db_stub, self.sql, [10], 2, 1)
+        self.assertEqual([(0, 10)], list(islice(rows, 1)))
+        self.assertEqual(1, len(self.queries))
+
+
+class MergeEventsTestCase(unittest.TestCase):
+
+    def _event(self, name, hours):
+        return (name, None, datetime(2010, 1, 1, tzinfo=utc) -
+                            timedelta(hours=hours))
+
+    def test_merge(self):
+        a = [self._event('a1', 1), self._event('a2', 4)]
+        b = [self._event('b1', 0), self._event('b2', 2),
+             self._event('b3', 5)]
+        c = [self._event('c1', 3)]
+        self.assertEqual(['b1', 'a1', 'b2', 'c1', 'a2', 'b3'],
+                         [e[0] for e in merge_events([a, [], b, c])])
+
+    def test_ties_in_iterables_order(self):
+        a = [self._event('a1', 1), self._event('a2', 1)]
+        b = [self._event('b1', 1)]
+        self.assertEqual(['a1', 'a2', 'b1'],
+                         [e[0] for e in merge_events([a, b])])
+        self.assertEqual(['b1', 'a1', 'a2'],
+                         [e[0] for e in merge_events([b, a])])
+
+    def test_key(self):
+        a = [('a1', 3), ('a2', 1)]
+        b = [('b1', 2)]
+        key = lambda item: datetime(2010, 1, item[1], tzinfo=utc)
+        self.assertEqual([('a1', 3), ('b1', 2), ('a2', 1)],
+                         list(merge_events([a, b], key)))
+
+    def test_lazy(self):
+        read = []
+        def generate(name, hours):
+            for h in hours:
+                read.append((name, h))
+                yield self._event(name, h)
+        events = merge_events([generate('a', [1, 2, 3]),
+                               generate('b', [4, 5])])
+        self.assertEqual('a', events.next()[0])
+        # the first event of each iterable only
+        self.assertEqual([('a', 1), ('b', 4)], read)
+        self.assertEqual('a', events.next()[0])
+        self.assertEqual([('a', 1), ('b', 4), ('a', 2)], read)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(IterRecentRowsTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(MergeEventsTestCase, 'test'))
+    return suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
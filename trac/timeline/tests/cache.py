@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+
+from trac.cache import CacheManager
+from trac.test import EnvironmentStub, Mock
+from trac.timeline.cache import DAY, TimelineEventCache
+from trac.util.datefmt import to_utimestamp, utc
+
+import unittest
+
+
+class TimelineEventCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.cache = TimelineEventCache(self.env)
+        self.today = to_utimestamp(datetime.now(utc)) // DAY
+        # two events a day from 10 days ago to today
+        self.rows = []
+        for day in xrange(self.today, self.today - 11, -1):
+            self.rows.extend([('e%d' % (self.today - day), day * DAY + 2000),
+                              ('e%d' % (self.today - day), day * DAY + 1000)])
+        self.fetched = []
+
+    def tearDown(self):
+        self.env.reset_db()
+
+    def _fetch(self, ts_start, ts_stop):
+        self.fetched.append(((ts_start - self.today * DAY) // DAY,
+                             (ts_stop - self.today * DAY) // DAY))
+        return [row for row in self.rows if ts_start <= row[1] <= ts_stop]
+
+    def _get_rows(self, ts_start, ts_stop, project_ids=(1,)):
+        return list(self.cache.get_rows('query', project_ids, ts_start,
+                                        ts_stop, self._fetch, 1))
+
+    def _expected(self, ts_start, ts_stop):
+        return [row for row in self.rows if ts_start <= row[1] <= ts_stop]
+
+    def test_past_days_cached(self):
+        start, stop = (self.today - 5) * DAY, self.today * DAY - 1
+        self.assertEqual(self._expected(start, stop),
+                         self._get_rows(start, stop))
+        # the 5 past days are read with a single query
+        self.assertEqual([(-5, -1)], self.fetched)
+        self.assertEqual(self._expected(start, stop),
+                         self._get_rows(start, stop))
+        self.assertEqual([(-5, -1)], self.fetched)
+
+    def test_read_days_limit(self):
+        start, stop = (self.today - 10) * DAY, self.today * DAY - 1
+        self.assertEqual(self._expected(start, stop),
+                         self._get_rows(start, stop))
+        self.assertEqual([(-7, -1), (-10, -8)], self.fetched)
+
+    def test_day_bucketing(self):
+        start, stop = (self.today - 5) * DAY, self.today * DAY - 1
+        self._get_rows(start, stop)
+        del self.fetched[:]
+        # a range within cached days is filtered from the buckets
+        start = (self.today - 3) * DAY + 1500
+        stop = (self.today - 2) * DAY + 2000
+        self.assertEqual(self._expected(start, stop),
+                         self._get_rows(start, stop))
+        self.assertEqual(3, len(self._get_rows(start, stop)))
+        self.assertEqual([], self.fetched)
+        # only the uncached days are read
+        start = (self.today - 7) * DAY
+        self.assertEqual(self._expected(start, stop),
+                         self._get_rows(start, stop))
+        self.assertEqual([(-7, -6)], self.fetched)
+
+    def test_today_not_cached(self):
+        start, stop = (self.today - 1) * DAY, (self.today + 1) * DAY - 1
+        self.assertEqual(self._expected(start, stop),
+                         self._get_rows(start, stop))
+        self.assertEqual([(0, 0), (-1, -1)], self.fetched)
+        self.rows.insert(0, ('new', self.today * DAY + 3000))
+        self.assertEqual(self._expected(start, stop),
+                         self._get_rows(start, stop))
+        self.assertEqual([(0, 0), (-1, -1), (0, 0)], self.fetched)
+
+    def test_disabled(self):
+        self.env.config.set('timeline', 'event_cache', 'false')
+        start, stop = (self.today - 2) * DAY, self.today * DAY - 1
+        self._get_rows(start, stop)
+        self._get_rows(start, stop)
+        self.assertEqual([(-2, -1), (-2, -1)], self.fetched)
+
+    def test_invalidate(self):
+        start, stop = (self.today - 2) * DAY, self.today * DAY - 1
+        self._get_rows(start, stop)
+        self._get_rows(start, stop, project_ids=(2, None))
+        self.cache.invalidate(1)
+        self._get_rows(start, stop)
+        self._get_rows(start, stop, project_ids=(2, None))
+        self.assertEqual([(-2, -1)] * 3, self.fetched)
+        self.cache.invalidate(None)
+        self._get_rows(start, stop, project_ids=(2, None))
+        self.assertEqual([(-2, -1)] * 4, self.fetched)
+
+    def test_invalidate_by_other_process(self):
+        start, stop = (self.today - 2) * DAY, self.today * DAY - 1
+        self._get_rows(start, stop)
+        # as done by `invalidate` in another process
+        CacheManager(self.env).invalidate(self.cache._cache_id(1))
+        self._get_rows(start, stop)
+        self.assertEqual([(-2, -1)] * 2, self.fetched)
+
+    def test_listeners(self):
+        start, stop = (self.today - 2) * DAY, self.today * DAY - 1
+        now = datetime.now(utc)
+        page = Mock(pid=1, time=now)
+        self._get_rows(start, stop)
+        # events of today don't change the cached days
+        self.cache.wiki_page_added(page)
+        self.cache.wiki_page_changed(page, 2, now, '', 'joe', None)
+        self.cache.ticket_changed(Mock(pid=1), '', 'joe', {'status': 'new'})
+        self._get_rows(start, stop)
+        self.assertEqual(1, len(self.fetched))
+        # a page saved with a past time
+        self.cache.wiki_page_changed(page, 3, now - timedelta(days=2), '',
+                                     'joe', None)
+        self._get_rows(start, stop)
+        self.assertEqual(2, len(self.fetched))
+        self.cache.ticket_changed(Mock(pid=1), '', 'joe', {'summary': 'old'})
+        self._get_rows(start, stop)
+        self.assertEqual(3, len(self.fetched))
+
+
+def suite():
+    return unittest.makeSuite(TimelineEventCacheTestCase, 'test')
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -21,7 +21,7 @@ from datetime import datetime, timedelta
 import pkg_resources
 import re
 from collections import OrderedDict
-from itertools import groupby
+from itertools import groupby, islice
 
 from genshi.builder import tag
 
@@ -29,7 +29,7 @@ from trac.config import IntOption, BoolOption, SyllabusExtensionPoint
 from trac.core import *
 from trac.mimeview import Context
 from trac.perm import IPermissionRequestor
-from trac.timeline.api import ITimelineEventProvider
+from trac.timeline.api import ITimelineEventProvider, merge_events
 from trac.util import as_int
 from trac.util.datefmt import format_date, format_datetime, parse_date, \
                               to_utimestamp, utc, pretty_timedelta
@@ -206,25 +206,20 @@ class TimelineModule(Component):
             else:
                 include.add(name)
         
-        # gather all events for the given period of time
-        events = []
-        for provider in self.event_providers(syllabus_id):
-            try:
-                for event in provider.get_timeline_events(req, start, stop,
-                                                          filters, pid, syllabus_id) or []:
-                    author = (event[self.EV_AUTHOR_OFFSET] or '').lower()
-                    if (not include or author in include) \
-                       and not author in exclude:
-                        events.append(self._event_data(provider, event))
-            except Exception, e: # cope with a failure of that provider
-                self._provider_failure(e, req, provider, filters,
-                                       [f[0] for f in available_filters])
-
-        # prepare sorted global list
-        events = sorted(events, key=lambda e: e['date'], reverse=True)
-        if maxrows:
-            events = events[:maxrows]
-        events = sorted(events, key=lambda e: (e['project_id'], e['date']), reverse=True)
+        # gather the most recent events of all providers for the given
+        # period of time, the query limit can't be applied by providers
+        # when events are filtered by author
+        limit = 0 if include or exclude else maxrows
+        all_filters = [f[0] for f in available_filters]
+        events = merge_events([self._get_provider_events(req, provider,
+                                    start, stop, filters, limit, pid,
+                                    syllabus_id, include, exclude,
+                                    all_filters)
+                               for provider
+                               in self.event_providers(syllabus_id)],
+                              key=lambda e: e['date'])
+        events = list(islice(events, maxrows or None))
+        events.sort(key=lambda e: (e['project_id'], e['date']), reverse=True)
 
         nonempty_projects = set()
         for project_id, _pevents in groupby(events, key=lambda e: e['project_id']):
@@ -346,6 +341,31 @@ class TimelineModule(Component):
 
     # Internal methods
 
+    def _get_provider_events(self, req, provider, start, stop, filters,
+                             maxrows, pid, syllabus_id, include, exclude,
+                             all_filters):
+        """Generate the event data of the provider newest first."""
+        try:
+            get_recent_events = getattr(provider,
+                                        'get_recent_timeline_events', None)
+            if get_recent_events:
+                events = (self._event_data(provider, event)
+                          for event in get_recent_events(req, start, stop,
+                                filters, maxrows, pid, syllabus_id) or [])
+            else:
+                events = sorted((self._event_data(provider, event)
+                                 for event in provider.get_timeline_events(
+                                    req, start, stop, filters, pid,
+                                    syllabus_id) or []),
+                                key=lambda e: e['date'], reverse=True)
+            for event in events:
+                author = (event['author'] or '').lower()
+                if (not include or author in include) \
+                   and not author in exclude:
+                    yield event
+        except Exception, e: # cope with a failure of that provider
+            self._provider_failure(e, req, provider, filters, all_filters)
+
     def _event_data(self, provider, event):
         """Compose the timeline event date from the event tuple and prepared
         provider methods"""
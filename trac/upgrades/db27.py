@@ -0,0 +1,31 @@
+from trac.db import Table, Column, Index, ForeignKey, DatabaseManager
+
+def do_upgrade(env, ver, cursor):
+    """Add the full-text search index tables and build the index."""
+    tables = [Table('search_document', key='id')[
+                  Column('id', auto_increment=True),
+                  Column('realm', type='varchar (255)'),
+                  Column('resource', type='varchar (255)'),
+                  Column('project_id', type='int', null=True),
+                  Column('title'),
+                  Column('author', type='varchar (255)'),
+                  Column('time', type='int64'),
+                  Column('text'),
+                  ForeignKey('project_id', 'projects', 'id',
+                             on_delete='CASCADE'),
+                  Index(['realm', 'resource'])],
+              Table('search_term', key=('term', 'document'))[
+                  Column('term', type='varchar (255)'),
+                  Column('document', type='int'),
+                  Column('weight', type='int'),
+                  ForeignKey('document', 'search_document', 'id',
+                             on_delete='CASCADE'),
+                  Index(['document'])]]
+
+    db_connector, _ = DatabaseManager(env).get_connector()
+    for table in tables:
+        for stmt in db_connector.to_sql(table):
+            cursor.execute(stmt)
+
+    from trac.search.index import SearchIndex
+    SearchIndex(env).reindex()
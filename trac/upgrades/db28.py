@@ -0,0 +1,15 @@
+from trac.db import Table, Column, ForeignKey, DatabaseManager
+
+def do_upgrade(env, ver, cursor):
+    """Add the queue of deferred ticket evaluation updates."""
+    table = Table('ticket_evaluation_queue', key=('ticket_id',))[
+                Column('ticket_id', type='int', null=False),
+                Column('project_id', type='int', null=False),
+                Column('time', type='int64', null=False),
+                Column('claimed_by', type='varchar (255)'),
+                Column('claim_time', type='int64'),
+                ForeignKey('ticket_id', 'ticket', 'id', on_delete='CASCADE')]
+
+    db_connector, _ = DatabaseManager(env).get_connector()
+    for stmt in db_connector.to_sql(table):
+        cursor.execute(stmt)
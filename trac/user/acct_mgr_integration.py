@@ -9,7 +9,7 @@ from trac.web.api import IRequestFilter, RequestDone, IAuthenticator
 from trac.perm import PermissionError
 from trac.project.sys import ProjectSystem
 from trac.project.api import ProjectManagement
-from trac.user.api import UserRole
+from trac.user.api import UserRole, UserManagement
 
 from genshi.builder import tag
 from trac.util.translation import _
@@ -306,6 +306,8 @@ class AccountManagerIntegration(Component):
             if not val:
                 continue
             set_user_attribute(self.env, username, attr, val)
+        if name:
+            UserManagement(self.env).invalidate_user_fullnames()
 
     def _do_remove_account(self, username):
         if not self.acctmgr.has_user(username):
@@ -362,11 +364,12 @@ class HTTPAuthFilter(Component):
             # check project
             # TODO: what about user role?
             req.data['role'] = None
+            access = self.pm.get_user_access(req.authname)
             for role in (UserRole.DEVELOPER, UserRole.MANAGER):
-                pids = self.pm.get_user_projects(req.authname, role)
+                pids = [p for p, name in access['projects'].get(int(role), ())]
                 if pid in pids:
                     req.data['role'] = role
-                    self.ps.set_request_data(req, pid)
+                    self.ps.set_request_data(req, pid, access['project_info'].get(pid))
                     break
             else:
                 del req.data['project_id']
@@ -11,6 +11,7 @@ from trac.util.translation import _
 
 from trac.user.model import Metagroup, Group, Team, User
 from trac.project.model import Project
+from trac.project.api import ProjectManagement
 from sqlalchemy import func
 from sqlalchemy.orm.exc import NoResultFound
 from trac.db_sqlalchemy import project_permissions
@@ -21,6 +22,7 @@ from formencode.foreach import ForEach
 from trac.util.formencode_addons import process_form
 
 from trac.user.api import UserManagement
+from trac.evaluation.api.cache import EvaluationValueCache
 
 
 
@@ -187,6 +189,7 @@ class UserManagementAdmin(Component):
                         for key, val in changes.iteritems():
                             setattr(metagroup, key, val)
                         session.commit()
+                        ProjectManagement(self.env).invalidate_project_info_cache()
                         add_notice(req, _('Your changes have been saved.'))
                         req.redirect(req.panel_href())
 
@@ -222,6 +225,7 @@ class UserManagementAdmin(Component):
                         session.query(Metagroup).\
                                 filter(Metagroup.id.in_(ids)).delete(False)
                         session.commit()
+                        ProjectManagement(self.env).invalidate_syllabus_cache()
                         add_notice(req, _('The selected items have been removed.'))
                         req.redirect(req.panel_href())
 
@@ -274,6 +278,7 @@ class UserManagementAdmin(Component):
                         for key, val in changes.iteritems():
                             setattr(group, key, val)
                         session.commit()
+                        ProjectManagement(self.env).invalidate_syllabus_cache()
                         add_notice(req, _('Your changes have been saved.'))
                         req.redirect(req.panel_href())
 
@@ -313,6 +318,7 @@ class UserManagementAdmin(Component):
                         session.query(Group).\
                                 filter(Group.id.in_(ids)).delete(False)
                         session.commit()
+                        ProjectManagement(self.env).invalidate_syllabus_cache()
                         add_notice(req, _('The selected items have been removed.'))
                         req.redirect(req.panel_href())
 
@@ -366,6 +372,7 @@ class UserManagementAdmin(Component):
                         for key, val in changes.iteritems():
                             setattr(team, key, val)
                         session.commit()
+                        ProjectManagement(self.env).invalidate_syllabus_cache()
                         add_notice(req, _('Your changes have been saved.'))
                         req.redirect(req.panel_href())
 
@@ -403,6 +410,7 @@ class UserManagementAdmin(Component):
                         session.query(Team).\
                                 filter(Team.id.in_(ids)).delete(False)
                         session.commit()
+                        ProjectManagement(self.env).invalidate_syllabus_cache()
                         add_notice(req, _('The selected items have been removed.'))
                         req.redirect(req.panel_href())
 
@@ -475,6 +483,9 @@ class UserManagementAdmin(Component):
                     add_notice(req, _('Your changes have been saved.'))
                     req.redirect(req.panel_href())
 
+            # prefetch fullnames shown in template
+            UserManagement(self.env).get_user_fullnames(
+                [member.username for member, dev, tl in members], req)
             data = {
                 'view': 'detail',
                 'team': team,
@@ -512,6 +523,7 @@ class UserManagementAdmin(Component):
                                     if project_id is not None:
                                         Project.revoke_permission(self.env, project_id, member.username)
                             session.commit()
+                            EvaluationValueCache(self.env).invalidate(project_id)
                         else:
                             add_notice(req, _('The selected items have been removed.'))
                             req.redirect(req.panel_href())
@@ -556,6 +568,7 @@ class UserManagementAdmin(Component):
                             add_warning(req, _("Can not add user to specified permission groups "
                                                "as selected team is not connected with any project."))
                     session.commit()
+                    EvaluationValueCache(self.env).invalidate(project_id)
                     req.redirect(req.panel_href())
 
                 for err in errs:
@@ -566,6 +579,9 @@ class UserManagementAdmin(Component):
                           join(User, Team.members).\
                           outerjoin(Project, Team.project).\
                           order_by(Team.id, User.username).all()
+        # prefetch fullnames shown in template
+        UserManagement(self.env).get_user_fullnames(
+            [username for team, project, uid, username in members], req)
         data = {
             'teams': teams,
             'members': members,
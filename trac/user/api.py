@@ -1,4 +1,9 @@
+import threading
+import time
+from collections import OrderedDict
+
 from trac.core import Component, TracError
+from trac.cache import CacheManager
 
 from trac.util.translation import _
 
@@ -119,6 +124,18 @@ class UserManagement(Component):
 
     VALID_PROJECT_USER_REALMS = ('team', 'manager')
 
+    # limits of process-wide user fullnames cache
+    fullname_cache_size = 2000
+    fullname_cache_ttl = 600 # seconds
+
+    _fullname_cache_id = 'trac.user.api.UserManagement.fullnames'
+
+    def __init__(self):
+        self._fullnames_lock = threading.Lock()
+        self._fullnames_generation = None
+        # {username: (fullname, time)} in order of usage (LRU first)
+        self._fullnames = OrderedDict()
+
     def user_exists(self, username):
         """
         Returns whether the user exists.
@@ -170,58 +187,94 @@ class UserManagement(Component):
                     WHERE mp.project_id=%s
                 '''
                 args += (pid, pid)
-        if perm_groups:
-            perm_groups = tuple(perm_groups)
-            query = '''
-            ( %s )
-            INTERSECT
-            SELECT username FROM (
-                SELECT username, action
-                FROM permission
-                UNION
-                SELECT username, action
-                FROM project_permissions
-                WHERE project_id=%%s
-            ) AS uniperm
-            WHERE action in %%s
-            ''' % (query,)
-            args.append(pid)
-            args.append(perm_groups)
-
         db = self.env.get_read_db()
         cursor = db.cursor()
         cursor.execute(query, args)
+        users = [row[0] for row in cursor.fetchall()]
 
-        return [row[0] for row in cursor.fetchall()]
+        if perm_groups:
+            from trac.perm import DefaultPermissionStore
+            subjects = DefaultPermissionStore(self.env). \
+                       get_subjects_with_groups(perm_groups, pid)
+            users = [u for u in users if u in subjects]
+        return users
 
     def get_user_fullname(self, username, req=None, with_username=False):
         if not username:
             return username
-        if req is not None:
-            if username not in req.data['user_fullname_cache']:
-                req.data['user_fullname_cache'][username] = self._get_user_fullname(username)
-            fullname = req.data['user_fullname_cache'][username]
-        else:
-            fullname = self._get_user_fullname(username)
+        fullname = self.get_user_fullnames((username,), req)[username]
         if not with_username:
             return fullname
         if fullname == username:
             return fullname
         return u'{0} ({1})'.format(fullname, username)
 
-    def _get_user_fullname(self, username):
+    def get_user_fullnames(self, usernames, req=None):
+        '''Return dict {<username>: <fullname>, ...} for all `usernames`.
+
+        Fullnames are looked up in the request cache (if `req` is given),
+        then in the process-wide cache, and missing ones are fetched
+        from database in one query. So handlers can prefetch fullnames
+        of all users shown on a page.
+        '''
+        usernames = set(u for u in usernames if u)
+        if req is not None:
+            req_cache = req.data.setdefault('user_fullname_cache', {})
+        else:
+            req_cache = {}
+        fullnames = dict((u, req_cache[u]) for u in usernames if u in req_cache)
+        missing = usernames.difference(fullnames)
+        if missing:
+            generation = CacheManager(self.env).get_generation(self._fullname_cache_id)
+            now = time.time()
+            with self._fullnames_lock:
+                if self._fullnames_generation != generation:
+                    self._fullnames_generation = generation
+                    self._fullnames.clear()
+                cache = self._fullnames
+                for username in missing:
+                    entry = cache.pop(username, None)
+                    if entry is not None and now - entry[1] < self.fullname_cache_ttl:
+                        # move to the end of LRU order
+                        cache[username] = entry
+                        fullnames[username] = entry[0]
+            missing.difference_update(fullnames)
+            if missing:
+                fetched = self._fetch_user_fullnames(missing)
+                with self._fullnames_lock:
+                    if self._fullnames_generation == generation:
+                        cache = self._fullnames
+                        for username, fullname in fetched.iteritems():
+                            cache[username] = (fullname, now)
+                        while len(cache) > self.fullname_cache_size:
+                            cache.popitem(last=False)
+                fullnames.update(fetched)
+            req_cache.update(fullnames)
+        return fullnames
+
+    def invalidate_user_fullnames(self):
+        '''Invalidate cached user fullnames in all processes.
+        Must be called after user name changes.'''
+        CacheManager(self.env).invalidate(self._fullname_cache_id)
+        with self._fullnames_lock:
+            self._fullnames_generation = None
+            self._fullnames.clear()
+
+    def _fetch_user_fullnames(self, usernames):
+        usernames = list(usernames)
         q = '''
-            SELECT fullname
+            SELECT username, fullname
             FROM user_info
-            WHERE username=%s
-        '''
+            WHERE username IN ({0})
+        '''.format(','.join(['%s'] * len(usernames)))
         db = self.env.get_read_db()
         cursor = db.cursor()
-        cursor.execute(q, (username,))
-        res = cursor.fetchone()
-        if not res or not res[0]:
-            return username
-        return res[0]
+        cursor.execute(q, usernames)
+        fullnames = dict((u, u) for u in usernames)
+        for username, fullname in cursor:
+            if fullname:
+                fullnames[username] = fullname
+        return fullnames
 
     def get_group_users(self, gid, group_lvl=GroupLevel.TEAM):
         column = GroupLevel.get_column(group_lvl)
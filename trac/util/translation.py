@@ -328,6 +328,15 @@ try:
     def get_translations():
         return translations
 
+    def get_active_locale_key():
+        """Return a hashable key of the currently active translations,
+        usable for caching of translated data, or `None` if translations
+        are not active (so `gettext` returns lazy proxies).
+        """
+        if not translations.isactive:
+            return None
+        return tuple(getattr(translations.active, 'files', ()))
+
     def get_available_locales():
         """Return a list of locale identifiers of the locales for which
         translations are available.
@@ -374,6 +383,9 @@ except ImportError: # fall back on 0.11 behavior, i18n functions are no-ops
     def get_translations():
         return translations
 
+    def get_active_locale_key():
+        return ()
+
     def get_available_locales():
         return []
 
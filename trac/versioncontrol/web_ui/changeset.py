@@ -31,11 +31,14 @@ from trac.core import *
 from trac.mimeview import Context, Mimeview
 from trac.perm import IPermissionRequestor
 from trac.resource import Resource, ResourceNotFound
-from trac.search import ISearchSource, search_to_sql, shorten_result
-from trac.timeline.api import ITimelineEventProvider
+from trac.search import ISearchSource, ISearchIndexSource, search_to_sql, \
+                        shorten_result
+from trac.search.index import SearchIndex
+from trac.timeline.api import ITimelineEventProvider, merge_events
 from trac.util import as_bool, content_disposition, embedded_numbers, pathjoin
 from trac.util.compat import any
-from trac.util.datefmt import from_utimestamp, pretty_timedelta
+from trac.util.datefmt import from_utimestamp, pretty_timedelta, \
+                              to_utimestamp
 from trac.util.text import exception_to_unicode, to_unicode, \
                            unicode_urlencode, shorten_line, CRLF
 from trac.util.translation import _, ngettext
@@ -123,7 +126,8 @@ class ChangesetModule(Component):
     """
 
     implements(INavigationContributor, IPermissionRequestor, IRequestHandler,
-               ITimelineEventProvider, IWikiSyntaxProvider, ISearchSource)
+               ITimelineEventProvider, IWikiSyntaxProvider, ISearchSource,
+               ISearchIndexSource)
 
     property_diff_renderers = ExtensionPoint(IPropertyDiffRenderer)
     
@@ -891,6 +895,11 @@ class ChangesetModule(Component):
             return []
 
     def get_timeline_events(self, req, start, stop, filters, pid, syllabus_id):
+        return self.get_recent_timeline_events(req, start, stop, filters, 0,
+                                               pid, syllabus_id)
+
+    def get_recent_timeline_events(self, req, start, stop, filters, maxrows,
+                                   pid, syllabus_id):
         all_repos = 'changeset' in filters
         repo_filters = set(f for f in filters if f.startswith('repo-'))
         if all_repos or repo_filters:
@@ -943,16 +952,21 @@ class ChangesetModule(Component):
                     repositories |= rm.get_real_repositories(project_id=project_id)
             else:
                 repositories = rm.get_real_repositories(project_id=pid)
-            for repos in sorted(repositories,
-                                key=lambda repos: repos.reponame):
-                if all_repos or ('repo-' + repos.reponame) in repo_filters:
-                    try:
-                        for event in generate_changesets(repos):
-                            yield event
-                    except TracError, e:
-                        self.log.error("Timeline event provider for repository"
-                                       " '%s' failed: %r", 
-                                       repos.reponame, exception_to_unicode(e))
+            def repository_events(repos):
+                try:
+                    for event in generate_changesets(repos):
+                        yield event
+                except TracError, e:
+                    self.log.error("Timeline event provider for repository"
+                                   " '%s' failed: %r", 
+                                   repos.reponame, exception_to_unicode(e))
+
+            # Changesets are generated newest first by each repository
+            for event in merge_events([repository_events(repos)
+                    for repos in sorted(repositories,
+                                        key=lambda repos: repos.reponame)
+                    if all_repos or ('repo-' + repos.reponame) in repo_filters]):
+                yield event
 
     def render_timeline_event(self, context, field, event):
         changesets, show_location, show_files = event[4]
@@ -1154,7 +1168,8 @@ class ChangesetModule(Component):
             yield ('changeset', _('Changesets'))
 
     def get_search_results(self, req, terms, filters):
-        if not 'changeset' in filters:
+        if not 'changeset' in filters or \
+                SearchIndex(self.env).is_indexed('changeset'):
             return
         rm = RepositoryManager(self.env)
         pid = req.project
@@ -1180,6 +1195,55 @@ class ChangesetModule(Component):
                        '[%s]: %s' % (rev, shorten_line(log)),
                        from_utimestamp(ts), author, shorten_result(log, terms))
 
+    # ISearchIndexSource methods
+
+    def get_search_index_realms(self):
+        yield ('changeset', 'changeset', 'CHANGESET_VIEW')
+
+    def get_search_documents(self, realm, keys=None):
+        # Changeset documents are identified by `reponame/rev`
+        rm = RepositoryManager(self.env)
+        if keys is None:
+            repositories = dict((repos.id, repos)
+                                for repos in rm.get_real_repositories())
+            db = self.env.get_read_db()
+            cursor = db.cursor()
+            cursor.execute("SELECT repos,rev,time,author,message "
+                           "FROM revision")
+            for id, rev, ts, author, log in cursor.fetchall():
+                repos = repositories.get(id)
+                if not repos:
+                    continue # revisions for a no longer active repository
+                try:
+                    rev = int(rev)
+                except ValueError:
+                    pass
+                yield self._get_search_document(repos, rev, ts, author, log)
+            return
+        for id, pid in keys:
+            reponame, rev = id.rsplit('/', 1)
+            repos = rm.get_repository(reponame)
+            if not repos:
+                continue
+            try:
+                changeset = repos.get_changeset(rev)
+            except NoSuchChangeset:
+                continue
+            yield self._get_search_document(repos, changeset.rev,
+                                            to_utimestamp(changeset.date),
+                                            changeset.author,
+                                            changeset.message)
+
+    def _get_search_document(self, repos, rev, ts, author, log):
+        return ('%s/%s' % (repos.reponame, rev), repos.pid,
+                '[%s]: %s' % (rev, shorten_line(log)), author, ts,
+                '\n'.join([unicode(rev), log or '', author or '']))
+
+    def get_search_index_resource(self, realm, id, pid):
+        reponame, rev = id.rsplit('/', 1)
+        return Resource('repository', reponame, pid=pid).child('changeset',
+                                                               rev)
+
 
 class AnyDiffModule(Component):
 
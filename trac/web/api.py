@@ -198,6 +198,9 @@ class Request(object):
     This class provides a convenience API over WSGI.
     """
 
+    # Size of the buffer used to write streamed content
+    CHUNK_SIZE = 4096
+
     def __init__(self, environ, start_response):
         """Create the request wrapper.
         
@@ -562,15 +565,34 @@ class Request(object):
         Its value either corresponds to the length of `data`, or, if there 
         are multiple calls to `write`, to the cumulated length of the `data`
         arguments.
+
+        `data` can also be an iterable of `str` strings. Such content is
+        streamed as it is produced, in pieces of about `CHUNK_SIZE` bytes,
+        and doesn't need the ''Content-Length'' header: the server then uses
+        chunked transfer encoding or closes the connection at the end.
         """
         if not self._write:
             self.end_headers()
-        if not hasattr(self, '_content_length'):
-            raise RuntimeError("No Content-Length header set")
-        if isinstance(data, unicode):
-            raise ValueError("Can't send unicode content")
+        if isinstance(data, basestring):
+            if not hasattr(self, '_content_length'):
+                raise RuntimeError("No Content-Length header set")
+            data = [data]
         try:
-            self._write(data)
+            buf = []
+            bufsize = 0
+            for chunk in data:
+                if isinstance(chunk, unicode):
+                    raise ValueError("Can't send unicode content")
+                if not chunk:
+                    continue
+                buf.append(chunk)
+                bufsize += len(chunk)
+                if bufsize >= self.CHUNK_SIZE:
+                    self._write(''.join(buf))
+                    buf = []
+                    bufsize = 0
+            if buf:
+                self._write(''.join(buf))
         except (IOError, socket.error), e:
             if e.args[0] in (errno.EPIPE, errno.ECONNRESET, 10053, 10054):
                 raise RequestDone
@@ -861,7 +861,7 @@ class Chrome(Component):
         return self.templates.load(filename, cls=cls)
 
     def render_template(self, req, filename, data, content_type=None,
-                        fragment=False):
+                        fragment=False, iterable=False):
         """Render the `filename` using the `data` for the context.
 
         The `content_type` argument is used to choose the kind of template
@@ -871,6 +871,10 @@ class Chrome(Component):
 
         When `fragment` is specified, the (filtered) Genshi stream is
         returned.
+
+        When `iterable` is specified, an iterable of encoded `str` strings
+        is returned, so that the content is rendered while it is sent.
+        Errors raised meanwhile are logged with their template location.
         """
         if content_type is None:
             content_type = 'text/html'
@@ -924,6 +928,11 @@ class Chrome(Component):
             'late_script_data': req.chrome['script_data'],
         })
 
+        if iterable:
+            return self._iterable_content(req, filename, stream, method,
+                                          doctype, (links, scripts,
+                                                    script_data))
+
         try:
             buffer = StringIO()
             stream.render(method, doctype=doctype, out=buffer,
@@ -931,23 +940,52 @@ class Chrome(Component):
             return buffer.getvalue().translate(_translate_nop,
                                                _invalid_control_chars)
         except Exception, e:
-            # restore what may be needed by the error template
-            req.chrome['links'] = links
-            req.chrome['scripts'] = scripts
-            req.chrome['script_data'] = script_data
-            # give some hints when hitting a Genshi unicode error
-            if isinstance(e, UnicodeError):
-                pos = self._stream_location(stream)
-                if pos:
-                    location = "'%s', line %s, char %s" % pos
-                else:
-                    location = _("(unknown template location)")
-                raise TracError(_("Genshi %(error)s error while rendering "
-                                  "template %(location)s", 
-                                  error=e.__class__.__name__, 
-                                  location=location))
+            pos = isinstance(e, UnicodeError) and \
+                  self._stream_location(stream) or None
+            self._rendering_error(req, e, pos, (links, scripts, script_data))
             raise
 
+    def _iterable_content(self, req, filename, stream, method, doctype,
+                          chrome_items):
+        # the content is sent while rendered, so an error can't be shown
+        # on an error page any more: log where it happened in the template
+        positions = []
+        def track_position(stream):
+            for kind, data, pos in stream:
+                if pos and pos[0]:
+                    positions[:] = [pos]
+                yield kind, data, pos
+        try:
+            for chunk in (stream | track_position).serialize(method,
+                                                             doctype=doctype):
+                yield chunk.encode('utf-8').translate(_translate_nop,
+                                                      _invalid_control_chars)
+        except Exception, e:
+            pos = positions and positions[0] or None
+            self.log.error("Error while rendering template %s at %s: %s",
+                           filename, self._format_location(pos),
+                           exception_to_unicode(e, traceback=True))
+            self._rendering_error(req, e, pos, chrome_items)
+            raise
+
+    def _rendering_error(self, req, e, pos, chrome_items):
+        """Prepare the request for reporting the error `e` raised while
+        rendering a template at `pos`."""
+        # restore what may be needed by the error template
+        (req.chrome['links'], req.chrome['scripts'],
+         req.chrome['script_data']) = chrome_items
+        # give some hints when hitting a Genshi unicode error
+        if isinstance(e, UnicodeError):
+            raise TracError(_("Genshi %(error)s error while rendering "
+                              "template %(location)s", 
+                              error=e.__class__.__name__, 
+                              location=self._format_location(pos)))
+
+    def _format_location(self, pos):
+        if pos:
+            return "'%s', line %s, char %s" % pos
+        return _("(unknown template location)")
+
     # E-mail formatting utilities
 
     def cc_list(self, cc_field):
@@ -93,6 +93,8 @@ class DetachedSession(dict):
 
         authenticated = int(self.authenticated)
         now = int(time.time())
+        name_changed = authenticated and \
+                       self._old.get('name') != self.get('name')
 
         # We can't do the session management in one big transaction,
         # as the intertwined changes to both the session and
@@ -155,6 +157,10 @@ class DetachedSession(dict):
                     return
                 session_saved[0] = True
 
+        if session_saved[0] and name_changed:
+            from trac.user.api import UserManagement
+            UserManagement(self.env).invalidate_user_fullnames()
+
         # Purge expired sessions. We do this only when the session was
         # changed as to minimize the purging.
 
@@ -379,6 +385,10 @@ class SessionAdmin(Component):
         else:
             return (sid, 1)
 
+    def _invalidate_user_fullnames(self):
+        from trac.user.api import UserManagement
+        UserManagement(self.env).invalidate_user_fullnames()
+
     def _get_sids(self):
         db = self.env.get_db_cnx()
         cursor = db.cursor()
@@ -452,6 +462,8 @@ class SessionAdmin(Component):
                 cursor.execute("""
                     INSERT INTO session_attribute VALUES (%s, %s, 'email', %s)
                     """, (sid, authenticated, email))
+        if name is not None:
+            self._invalidate_user_fullnames()
 
     def _do_set(self, attr, sid, val):
         if attr not in ('name', 'email'):
@@ -474,6 +486,8 @@ class SessionAdmin(Component):
             cursor.execute("""
                 INSERT INTO session_attribute VALUES (%s, %s, %s, %s)
                 """, (sid, authenticated, attr, val))
+        if attr == 'name':
+            self._invalidate_user_fullnames()
 
     def _do_delete(self, *sids):
         @self.env.with_transaction()
@@ -1,5 +1,7 @@
-from trac.core import Component, implements
-from trac.test import EnvironmentStub
+from genshi.template import MarkupTemplate
+
+from trac.core import Component, implements, TracError
+from trac.test import EnvironmentStub, Mock
 from trac.web.chrome import add_link, add_meta, add_script, add_script_data, \
                             add_stylesheet, Chrome, INavigationContributor
 from trac.web.href import Href
@@ -260,8 +262,65 @@ class ChromeTestCase(unittest.TestCase):
         self.assertEqual('test2', items[1]['name'])
 
 
+class IterableContentTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.env = EnvironmentStub()
+        self.errors = []
+        self.env.log = Mock(error=lambda *args: self.errors.append(args),
+                            debug=lambda *args: None)
+        self.req = Request(chrome={'links': {}, 'scripts': [],
+                                   'script_data': {}})
+        self.chrome_items = ({'stylesheet': []}, ['script'], {'var': 1})
+
+    def _iterate(self, text, error):
+        def fail():
+            raise error
+        template = MarkupTemplate(text, filename='test.html')
+        stream = template.generate(fail=fail, items=range(3))
+        content = Chrome(self.env)._iterable_content(self.req, 'test.html',
+                                                     stream, 'xml', None,
+                                                     self.chrome_items)
+        return content
+
+    def test_content(self):
+        content = self._iterate('<p>${u"\\u00e9"}</p>', None)
+        self.assertEqual('<p>\xc3\xa9</p>', ''.join(content))
+        self.assertEqual([], self.errors)
+
+    def test_error_logged(self):
+        content = self._iterate('''<div xmlns:py="http://genshi.edgewall.org/">
+  <p py:for="i in items">$i</p>
+  <p>${fail()}</p>
+</div>''', ValueError('broken'))
+        self.assertTrue(content.next().startswith('<div>'))
+        self.assertRaises(ValueError, list, content)
+        self.assertEqual(1, len(self.errors))
+        message = self.errors[0][0] % self.errors[0][1:]
+        self.assertTrue("test.html at 'test.html', line 3" in message)
+        self.assertTrue('broken' in message)
+        # restored for the error template
+        self.assertEqual(self.chrome_items,
+                         (self.req.chrome['links'], self.req.chrome['scripts'],
+                          self.req.chrome['script_data']))
+
+    def test_unicode_error(self):
+        content = self._iterate('<p>${fail()}</p>',
+                                UnicodeDecodeError('ascii', '\xe9', 0, 1,
+                                                   'invalid'))
+        try:
+            list(content)
+            self.fail('TracError not raised')
+        except TracError, e:
+            self.assertTrue("'test.html', line 1" in unicode(e))
+        self.assertEqual(1, len(self.errors))
+
+
 def suite():
-    return unittest.makeSuite(ChromeTestCase, 'test')
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(ChromeTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(IterableContentTestCase, 'test'))
+    return suite
 
 if __name__ == '__main__':
     unittest.main(defaultTest='suite')
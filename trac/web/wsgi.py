@@ -204,6 +204,12 @@ class WSGIServerGateway(WSGIGateway):
         WSGIGateway.__init__(self, environ, handler.rfile,
                              _ErrorsWrapper(lambda x: handler.log_error('%s', x)))
         self.handler = handler
+        self._chunked = False
+
+    def run(self, application):
+        WSGIGateway.run(self, application)
+        if self._chunked and not self.handler.wfile.closed:
+            self.handler.wfile.write('0\r\n\r\n')
 
     def _write(self, data):
         assert self.headers_set, 'Response not started'
@@ -216,8 +222,25 @@ class WSGIServerGateway(WSGIGateway):
                 self.handler.send_response(int(status[:3]))
                 for name, value in headers:
                     self.handler.send_header(name, value)
+                if not [name for name, value in headers
+                        if name.lower() == 'content-length'] and \
+                        status[:3] not in ('204', '304') and \
+                        self.environ['REQUEST_METHOD'] != 'HEAD':
+                    # content of unknown length (streamed)
+                    if self.handler.request_version == 'HTTP/1.1' and \
+                            self.handler.protocol_version == 'HTTP/1.1':
+                        self.handler.send_header('Transfer-Encoding',
+                                                 'chunked')
+                        self._chunked = True
+                    else:
+                        self.handler.close_connection = 1
                 self.handler.end_headers()
-            self.handler.wfile.write(data)
+            if self._chunked:
+                if data:
+                    self.handler.wfile.write('%x\r\n%s\r\n'
+                                             % (len(data), data))
+            else:
+                self.handler.wfile.write(data)
         except (IOError, socket.error), e:
             if e.args[0] in (errno.EPIPE, errno.ECONNRESET, 10053, 10054):
                 # client disconnect
@@ -28,8 +28,12 @@ from trac.core import *
 from trac.mimeview.api import Mimeview, IContentConverter, Context
 from trac.perm import IPermissionRequestor
 from trac.resource import *
-from trac.search import ISearchSource, search_to_sql, shorten_result
-from trac.timeline.api import ITimelineEventProvider
+from trac.search import ISearchSource, ISearchIndexSource, search_to_sql, \
+                        shorten_result
+from trac.search.index import SearchIndex
+from trac.timeline.api import ITimelineEventProvider, iter_recent_rows, \
+                             merge_events
+from trac.timeline.cache import TimelineEventCache
 from trac.util import get_reporter_id
 from trac.util.datefmt import from_utimestamp, to_utimestamp
 from trac.util.text import shorten_line
@@ -56,7 +60,7 @@ class WikiModule(Component):
 
     implements(IContentConverter, INavigationContributor, IPermissionRequestor,
                IRequestHandler, ITimelineEventProvider, ISearchSource,
-               ITemplateProvider)
+               ISearchIndexSource, ITemplateProvider)
 
     page_manipulators = ExtensionPoint(IWikiPageManipulator)
 
@@ -721,6 +725,11 @@ class WikiModule(Component):
             yield ('wiki_project', _('Wiki changes (project)'))
 
     def get_timeline_events(self, req, start, stop, filters, pid, syllabus_id):
+        return self.get_recent_timeline_events(req, start, stop, filters, 0,
+                                               pid, syllabus_id)
+
+    def get_recent_timeline_events(self, req, start, stop, filters, maxrows,
+                                   pid, syllabus_id):
         is_global = 'wiki_global' in filters
         is_project = 'wiki_project' in filters
         is_multi = isinstance(pid, (list, tuple))
@@ -729,9 +738,10 @@ class WikiModule(Component):
 
         q = '''
             SELECT COALESCE(project_id,0),time,name,comment,author,version
-            FROM wiki WHERE time>=%s AND time<=%s AND ({glob} {op} {proj})
+            FROM wiki WHERE ({glob} {op} {proj}) AND time>=%s AND time<=%s
+            ORDER BY time DESC
         '''
-        args = [to_utimestamp(start), to_utimestamp(stop)]
+        args = []
         glob = is_global and 'project_id IS NULL' or ''
         if is_project:
             if is_multi:
@@ -743,32 +753,43 @@ class WikiModule(Component):
         else:
             proj = ''
         op = is_global and is_project and 'OR' or ''
+        q = q.format(glob=glob, op=op, proj=proj)
+        project_ids = []
+        if is_global:
+            project_ids.append(None)
+        if is_project:
+            project_ids.extend(pid if is_multi else [pid])
 
         wiki_realm = Resource('wiki')
         db = self.env.get_read_db()
-        cursor = db.cursor()
-        cursor.execute(q.format(glob=glob, op=op, proj=proj), args)
-        for vals in cursor:
-            project_id = vals[0]
-            vals = vals[1:]
-            ts, name, comment, author, version = vals
-            wiki_page = wiki_realm(id=name, version=version, pid=project_id)
-            if 'WIKI_VIEW' not in req.perm(wiki_page):
-                continue
-            data_ = (wiki_page, comment)
-            yield ('wiki', project_id, from_utimestamp(ts), author, data_)
 
+        def wiki_events():
+            rows = TimelineEventCache(self.env).get_rows(
+                ('wiki', is_global, is_project and pid), project_ids,
+                to_utimestamp(start), to_utimestamp(stop),
+                lambda ts_start, ts_stop: iter_recent_rows(db, q,
+                    args + [ts_start, ts_stop], maxrows, 1), 1)
+            for vals in rows:
+                project_id = vals[0]
+                vals = vals[1:]
+                ts, name, comment, author, version = vals
+                wiki_page = wiki_realm(id=name, version=version, pid=project_id)
+                if 'WIKI_VIEW' not in req.perm(wiki_page):
+                    continue
+                data_ = (wiki_page, comment)
+                yield ('wiki', project_id, from_utimestamp(ts), author, data_)
+
+        events = [wiki_events()]
         # Attachments
         def attachment_events(pid):
-            for event in AttachmentModule(self.env).get_timeline_events(
-                req, wiki_realm, start, stop, pid, syllabus_id):
-                yield event
+            return AttachmentModule(self.env).get_timeline_events(
+                req, wiki_realm, start, stop, pid, syllabus_id, maxrows)
         if is_project:
-            for e in attachment_events(pid):
-                yield e
+            events.append(attachment_events(pid))
         if is_global:
-            for e in attachment_events(None):
-                yield e
+            events.append(attachment_events(None))
+        for event in merge_events(events):
+            yield event
 
     def render_timeline_event(self, context, field, event):
         wiki_page, comment = event[4]
@@ -799,27 +820,55 @@ class WikiModule(Component):
     def get_search_results(self, req, terms, filters):
         if not 'wiki' in filters:
             return
-        db = self.env.get_db_cnx()
-        sql_query, args = search_to_sql(db, ['w1.name', 'w1.author', 'w1.text'],
-                                        terms)
-        cursor = db.cursor()
-        cursor.execute("SELECT w1.name,w1.time,w1.author,w1.text "
-                       "FROM wiki w1,"
-                       "(SELECT name,max(version) AS ver "
-                       "FROM wiki GROUP BY name) w2 "
-                       "WHERE w1.version = w2.ver AND w1.name = w2.name "
-                       "AND " + sql_query, args)
-
         wiki_realm = Resource('wiki')
-        for name, ts, author, text in cursor:
-            page = wiki_realm(id=name)
-            if 'WIKI_VIEW' in req.perm(page):
-                yield (get_resource_url(self.env, page, req.href),
-                       '%s: %s' % (name, shorten_line(text)),
-                       from_utimestamp(ts), author,
-                       shorten_result(text, terms))
+        if not SearchIndex(self.env).is_indexed('wiki'):
+            db = self.env.get_db_cnx()
+            sql_query, args = search_to_sql(db, ['w1.name', 'w1.author',
+                                                 'w1.text'], terms)
+            cursor = db.cursor()
+            cursor.execute("SELECT w1.name,w1.time,w1.author,w1.text "
+                           "FROM wiki w1,"
+                           "(SELECT name,max(version) AS ver "
+                           "FROM wiki GROUP BY name) w2 "
+                           "WHERE w1.version = w2.ver AND w1.name = w2.name "
+                           "AND " + sql_query, args)
+
+            for name, ts, author, text in cursor:
+                page = wiki_realm(id=name)
+                if 'WIKI_VIEW' in req.perm(page):
+                    yield (get_resource_url(self.env, page, req.href),
+                           '%s: %s' % (name, shorten_line(text)),
+                           from_utimestamp(ts), author,
+                           shorten_result(text, terms))
         
         # Attachments
         for result in AttachmentModule(self.env).get_search_results(
             req, wiki_realm, terms):
             yield result
+
+    # ISearchIndexSource methods
+
+    def get_search_index_realms(self):
+        yield ('wiki', 'wiki', 'WIKI_VIEW')
+
+    def get_search_documents(self, realm, keys=None):
+        db = self.env.get_read_db()
+        cursor = db.cursor()
+        names_sql = ''
+        args = []
+        if keys is not None:
+            names_sql = 'WHERE name IN (%s)' % ','.join(['%s'] * len(keys))
+            args = [name for name, pid in keys]
+        cursor.execute("SELECT w1.name,w1.project_id,w1.time,w1.author,"
+                       "w1.text "
+                       "FROM wiki w1,"
+                       "(SELECT name,max(version) AS ver "
+                       "FROM wiki %s GROUP BY name) w2 "
+                       "WHERE w1.version = w2.ver AND w1.name = w2.name"
+                       % names_sql, args)
+        for name, pid, ts, author, text in cursor.fetchall():
+            yield (name, pid, '%s: %s' % (name, shorten_line(text)), author,
+                   ts, '\n'.join([name, author or '', text or '']))
+
+    def get_search_index_resource(self, realm, id, pid):
+        return Resource('wiki', id, pid=pid)